@@ -7,10 +7,9 @@ from pathlib import Path
 
 from flask import Flask
 
-from backend.config import STORAGE_PATH, UPLOAD_PATH, MUSIC_LIBRARY_PATH, DATA_DIR, BASE_DIR
+from backend.config import STORAGE_PATH, UPLOAD_PATH, MUSIC_LIBRARY_PATH, DATA_DIR, BASE_DIR, LOG_DIR
 
-# Расширенное логирование: в терминал и в один файл logs/app.log
-LOG_DIR = BASE_DIR / "logs"
+# Расширенное логирование: в терминал и в один файл app.log в LOG_PATH (по умолчанию logs/)
 LOG_DIR.mkdir(parents=True, exist_ok=True)
 LOG_FILE = LOG_DIR / "app.log"
 log_fmt = "%(asctime)s %(levelname)s [%(name)s] %(message)s"
@@ -62,6 +61,18 @@ def create_app():
             return None
         return redirect(url_for("main.login", next=request.url))
 
+    # Тело больше MAX_CONTENT_LENGTH: werkzeug обрывает приём, клиенту — ошибка в формате API
+    from flask import jsonify
+    from werkzeug.exceptions import RequestEntityTooLarge
+    from backend.config import MAX_FILE_SIZE_MB
+
+    @app.errorhandler(RequestEntityTooLarge)
+    def request_too_large(e):
+        return jsonify({
+            "error": f"Файл превышает лимит {MAX_FILE_SIZE_MB} МБ.",
+            "recommendation": "Загрузите файл меньшего размера или сократите документ.",
+        }), 413
+
     # Фоновая очистка по срокам хранения (ТЗ 5.2): раз в 24 часа
     def _cleanup_loop():
         interval = 24 * 60 * 60  # секунд
@@ -76,10 +87,20 @@ def create_app():
     t = threading.Thread(target=_cleanup_loop, daemon=True)
     t.start()
 
+    # Воркеры очереди: при старте забирают задачи, оставшиеся в очереди после перезапуска.
+    # EMBEDDED_WORKERS=0 — задачи обрабатывает отдельный процесс (python -m backend.worker)
+    from backend.config import EMBEDDED_WORKERS
+    if EMBEDDED_WORKERS:
+        from backend.tasks_queue import start_worker
+        start_worker()
+
     return app
 
 
-app = create_app()
+# Процессы пула spawn (executors.cpu_pool) заново импортируют главный модуль под именем __mp_main__:
+# при запуске python -m backend.app без этой проверки каждый из них поднимал бы приложение и воркеры очереди
+if __name__ != "__mp_main__":
+    app = create_app()
 
 if __name__ == "__main__":
     port = int(os.getenv("PORT", 5000))
@@ -27,12 +27,15 @@ _storage = os.getenv("STORAGE_PATH", "").strip() or str(BASE_DIR / "storage")
 _upload = os.getenv("UPLOAD_PATH", "").strip() or str(BASE_DIR / "uploads")
 _music = os.getenv("MUSIC_LIBRARY_PATH", "").strip() or str(BASE_DIR / "static" / "music")
 _voice_samples = os.getenv("VOICE_SAMPLES_DIR", "").strip() or str(BASE_DIR / "static" / "voice_samples")
+_logs = os.getenv("LOG_PATH", "").strip() or str(BASE_DIR / "logs")
 
 STORAGE_PATH = _resolve_path(_storage, BASE_DIR / "storage")
 UPLOAD_PATH = _resolve_path(_upload, BASE_DIR / "uploads")
 MUSIC_LIBRARY_PATH = _resolve_path(_music, BASE_DIR / "static" / "music")
 VOICE_SAMPLES_DIR = _resolve_path(_voice_samples, BASE_DIR / "static" / "voice_samples")
 DATA_DIR = (BASE_DIR / "data").resolve()
+# Логи app.log и worker.log
+LOG_DIR = _resolve_path(_logs, BASE_DIR / "logs")
 
 
 def resolve_storage_path(stored: str) -> Path:
@@ -67,12 +70,85 @@ LOGIN_PASSWORD = os.getenv("LOGIN_PASSWORD", "test")
 
 # Database (URI с прямыми слэшами для работы на Win и Linux)
 DATABASE_URL = os.getenv("DATABASE_URL", f"sqlite:///{(DATA_DIR / 'podcast_gen.db').as_posix()}")
+# Соединения SQLite переиспользуются (сколько держать открытыми про запас), журнал WAL — читатели не блокируют запись
+# (на сетевом диске WAL не работает — DB_JOURNAL_MODE=DELETE), ожидание блокировки (мс), кэш подготовленных запросов
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "8"))
+DB_JOURNAL_MODE = os.getenv("DB_JOURNAL_MODE", "WAL").strip().upper() or "WAL"
+DB_SYNCHRONOUS = os.getenv("DB_SYNCHRONOUS", "NORMAL").strip().upper() or "NORMAL"
+DB_BUSY_TIMEOUT_MS = int(os.getenv("DB_BUSY_TIMEOUT_MS", "5000"))
+DB_STATEMENT_CACHE = int(os.getenv("DB_STATEMENT_CACHE", "256"))
 
 # Limits (ТЗ 2.3: budget, 10 MB files)
 MAX_TEXT_LENGTH = int(os.getenv("MAX_TEXT_LENGTH", "50000"))
 MAX_FILE_SIZE_MB = int(os.getenv("MAX_FILE_SIZE_MB", "10"))
 MAX_FILE_SIZE_BYTES = MAX_FILE_SIZE_MB * 1024 * 1024
+# Flask/werkzeug отклоняет тело запроса больше лимита ещё до разбора multipart (запас на поля формы)
+MAX_CONTENT_LENGTH = MAX_FILE_SIZE_BYTES + 1024 * 1024
+# Срок выполнения задачи (сек, 0 — без ограничения) и бюджеты этапов (0 — только общий срок):
+# по истечении вызовы API и ожидание вычислений прерываются, задача помечается failed с названием этапа
 TASK_TIMEOUT_SECONDS = int(os.getenv("TASK_TIMEOUT_SECONDS", "600"))
+STAGE_TIMEOUTS = {
+    "extract": int(os.getenv("STAGE_TIMEOUT_EXTRACT", "120")),
+    "script": int(os.getenv("STAGE_TIMEOUT_SCRIPT", "240")),
+    "tts": int(os.getenv("STAGE_TIMEOUT_TTS", "360")),
+    "music_cover": int(os.getenv("STAGE_TIMEOUT_MUSIC_COVER", "180")),
+    "rss": int(os.getenv("STAGE_TIMEOUT_RSS", "60")),
+}
+# Число воркеров очереди задач (параллельно обрабатываемых задач)
+TASK_WORKERS = int(os.getenv("TASK_WORKERS", "2"))
+# Воркеры в веб-процессе; 0 — только отдельный процесс python -m backend.worker (веб лишь ставит задачи в очередь)
+EMBEDDED_WORKERS = os.getenv("EMBEDDED_WORKERS", "1").strip().lower() not in ("0", "false", "no")
+# Очередь в SQLite: аренда задачи воркером (продлевается heartbeat-ом), попыток после обрыва аренды, опрос очереди (сек)
+TASK_LEASE_SECONDS = int(os.getenv("TASK_LEASE_SECONDS", "60"))
+TASK_MAX_ATTEMPTS = int(os.getenv("TASK_MAX_ATTEMPTS", "3"))
+QUEUE_POLL_SECONDS = float(os.getenv("QUEUE_POLL_SECONDS", "2"))
+# Задач, выполняемых одновременно во всех процессах воркеров, — для прогноза ETA, Retry-After и допуска в очередь.
+# 0 — по живым процессам воркеров (сумма их воркеров из heartbeat в таблице queue_worker)
+QUEUE_SLOTS = int(os.getenv("QUEUE_SLOTS", "0"))
+# Старение в планировщике: за столько секунд ожидания оценка объёма задачи уменьшается вдвое (длинные не голодают)
+QUEUE_AGING_SECONDS = float(os.getenv("QUEUE_AGING_SECONDS", "300"))
+# Одинаковые задачи (тот же источник и параметры): присоединяются к выполняемой, а готовый результат
+# не старше COALESCE_RESULT_TTL_SECONDS отдаётся сразу (0 — готовые результаты не переиспользуются)
+COALESCE_RESULT_TTL_SECONDS = int(os.getenv("COALESCE_RESULT_TTL_SECONDS", "3600"))
+# Допуск задач в очередь: не больше QUEUE_MAX_DEPTH ожидающих воркера и QUEUE_MAX_PER_SESSION незавершённых
+# (ожидающих и выполняемых) на сессию; сверх лимита — 429 с Retry-After. 0 — без ограничения
+QUEUE_MAX_DEPTH = int(os.getenv("QUEUE_MAX_DEPTH", "100"))
+QUEUE_MAX_PER_SESSION = int(os.getenv("QUEUE_MAX_PER_SESSION", "10"))
+# WebSocket с подпиской на много задач: обновления копятся и отправляются одним кадром не чаще раза в столько секунд
+WS_BATCH_INTERVAL_SECONDS = float(os.getenv("WS_BATCH_INTERVAL_SECONDS", "0.5"))
+WS_MAX_SUBSCRIPTIONS = int(os.getenv("WS_MAX_SUBSCRIPTIONS", "500"))
+# Прогресс внутри этапа (реплики TTS) пишется в БД не чаще раза в столько секунд на задачу; смена этапа — сразу
+PROGRESS_FLUSH_SECONDS = float(os.getenv("PROGRESS_FLUSH_SECONDS", "2"))
+
+# Пулы этапов (services/executors.py): потоки для сетевых вызовов, процессы для аудио и PDF
+# (CPU_WORKERS=0 — тяжёлые операции в потоке воркера); реплик TTS одной задачи в работе одновременно
+IO_WORKERS = int(os.getenv("IO_WORKERS", "32"))
+CPU_WORKERS = int(os.getenv("CPU_WORKERS", str(os.cpu_count() or 1)))
+TTS_CONCURRENCY = int(os.getenv("TTS_CONCURRENCY", "4"))
+
+# Извлечение PDF: документы от PDF_PARALLEL_MIN_PAGES страниц разбираются диапазонами по PDF_PAGES_PER_CHUNK
+# в пуле процессов CPU_WORKERS, не более PDF_WORKERS диапазонов одного документа (0 или 1 — последовательно)
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "64"))
+PDF_PAGES_PER_CHUNK = int(os.getenv("PDF_PAGES_PER_CHUNK", "16"))
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+# Загрузка страниц по URL: общее время на ответ (сек), размер пула соединений; HTTP-кэш с ETag/Last-Modified
+URL_FETCH_TIMEOUT_SECONDS = int(os.getenv("URL_FETCH_TIMEOUT_SECONDS", "30"))
+URL_FETCH_POOL_SIZE = int(os.getenv("URL_FETCH_POOL_SIZE", "10"))
+HTTP_CACHE_ENABLED = os.getenv("HTTP_CACHE_ENABLED", "1").strip().lower() not in ("0", "false", "no")
+# Очистка HTTP-кэша (services/cleanup.py): записи старше срока (дни) и самые старые сверх объёма (МБ)
+HTTP_CACHE_MAX_AGE_DAYS = int(os.getenv("HTTP_CACHE_MAX_AGE_DAYS", "7"))
+HTTP_CACHE_MAX_MB = int(os.getenv("HTTP_CACHE_MAX_MB", "200"))
+# Извлечение текста страницы: density — основной текст статьи (lxml, плотность текста); soup — весь body (BeautifulSoup)
+HTML_EXTRACTOR = os.getenv("HTML_EXTRACTOR", "density").strip().lower() or "density"
+
+# Пакетное извлечение (/api/extract/batch): максимум источников в запросе, потоков, одновременных загрузок с одного хоста
+EXTRACT_BATCH_MAX_ITEMS = int(os.getenv("EXTRACT_BATCH_MAX_ITEMS", "50"))
+EXTRACT_BATCH_WORKERS = int(os.getenv("EXTRACT_BATCH_WORKERS", "8"))
+EXTRACT_BATCH_PER_HOST = int(os.getenv("EXTRACT_BATCH_PER_HOST", "2"))
+
+# Кэш результатов извлечения (/api/extract -> extraction_id -> /api/tasks), часов
+EXTRACTION_CACHE_TTL_HOURS = int(os.getenv("EXTRACTION_CACHE_TTL_HOURS", "24"))
 
 # Retention (ТЗ 5.2)
 FILE_RETENTION_DAYS = int(os.getenv("FILE_RETENTION_DAYS", "7"))
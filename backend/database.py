@@ -1,8 +1,27 @@
-"""SQLite database and models. ТЗ 5.1: Session, Task, Result."""
+"""SQLite database and models. ТЗ 5.1: Session, Task, Result.
+Соединения переиспользуются: после блока get_connection соединение возвращается в пул процесса (не больше
+DB_POOL_SIZE свободных), настройки (WAL, synchronous, busy_timeout) задаются один раз при открытии,
+а подготовленные запросы остаются в кэше соединения.
+"""
+import logging
+import os
 import sqlite3
+import threading
 from contextlib import contextmanager
 from pathlib import Path
-from backend.config import DATABASE_URL, DATA_DIR
+from backend.config import (
+    DATABASE_URL, DATA_DIR, DB_BUSY_TIMEOUT_MS, DB_JOURNAL_MODE, DB_POOL_SIZE, DB_STATEMENT_CACHE, DB_SYNCHRONOUS,
+)
+
+logger = logging.getLogger(__name__)
+
+JOURNAL_MODES = ("WAL", "DELETE", "TRUNCATE", "PERSIST", "MEMORY")
+SYNCHRONOUS_MODES = ("OFF", "NORMAL", "FULL", "EXTRA")
+
+_pools = {}  # (путь, readonly) -> свободные соединения
+_pool_lock = threading.Lock()
+_pool_pid = None
+_journal_set = set()  # пути, для которых режим журнала уже установлен
 
 
 def _get_db_path():
@@ -13,24 +32,75 @@ def _get_db_path():
     return DATA_DIR / "podcast_gen.db"
 
 
+def _connect(path: Path, readonly: bool) -> sqlite3.Connection:
+    if DB_JOURNAL_MODE not in JOURNAL_MODES:
+        raise ValueError(f"DB_JOURNAL_MODE: ожидается одно из {', '.join(JOURNAL_MODES)}")
+    if DB_SYNCHRONOUS not in SYNCHRONOUS_MODES:
+        raise ValueError(f"DB_SYNCHRONOUS: ожидается одно из {', '.join(SYNCHRONOUS_MODES)}")
+    if path not in _journal_set:
+        path.parent.mkdir(parents=True, exist_ok=True)
+    # check_same_thread=False: соединение из пула может достаться другому потоку (но не двум сразу)
+    conn = sqlite3.connect(
+        str(path), timeout=DB_BUSY_TIMEOUT_MS / 1000, check_same_thread=False, cached_statements=DB_STATEMENT_CACHE,
+    )
+    conn.row_factory = sqlite3.Row
+    conn.execute(f"PRAGMA busy_timeout = {DB_BUSY_TIMEOUT_MS}")
+    if path not in _journal_set:
+        conn.execute(f"PRAGMA journal_mode = {DB_JOURNAL_MODE}")  # хранится в файле БД — один раз на процесс
+        _journal_set.add(path)
+    conn.execute(f"PRAGMA synchronous = {DB_SYNCHRONOUS}")
+    if readonly:
+        conn.execute("PRAGMA query_only = ON")
+    return conn
+
+
+def _acquire(path: Path, readonly: bool) -> sqlite3.Connection:
+    global _pool_pid
+    with _pool_lock:
+        if _pool_pid != os.getpid():
+            # Соединения родителя после fork не используются
+            _pools.clear()
+            _pool_pid = os.getpid()
+        idle = _pools.get((path, readonly))
+        if idle:
+            return idle.pop()
+    return _connect(path, readonly)
+
+
+def _release(path: Path, readonly: bool, conn: sqlite3.Connection) -> None:
+    if not conn.in_transaction:
+        with _pool_lock:
+            idle = _pools.setdefault((path, readonly), [])
+            if _pool_pid == os.getpid() and len(idle) < DB_POOL_SIZE:
+                idle.append(conn)
+                return
+    conn.close()
+
+
 @contextmanager
-def get_connection():
+def get_connection(readonly: bool = False):
+    """
+    Соединение на время блока: commit при выходе, rollback при исключении, затем возврат в пул.
+    Вложенный get_connection получает другое соединение — своя транзакция, как и прежде.
+    readonly=True — соединение только для чтения (PRAGMA query_only) для обработчиков GET.
+    """
     path = _get_db_path()
-    path.parent.mkdir(parents=True, exist_ok=True)
-    conn = sqlite3.connect(str(path))
-    conn.row_factory = sqlite3.Row
+    conn = _acquire(path, readonly)
     try:
         yield conn
         conn.commit()
     except Exception:
-        conn.rollback()
+        try:
+            conn.rollback()
+        except sqlite3.Error as e:
+            logger.warning("[db] rollback: %s", e)
         raise
     finally:
-        conn.close()
+        _release(path, readonly, conn)
 
 
 def init_db():
-    """Create tables: session, task, result."""
+    """Create tables: session, task, result, api_call, extraction, queue_item, queue_worker."""
     path = _get_db_path()
     path.parent.mkdir(parents=True, exist_ok=True)
 
@@ -67,9 +137,74 @@ def init_db():
                 FOREIGN KEY (task_id) REFERENCES task(id)
             );
 
+            CREATE TABLE IF NOT EXISTS api_call (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                task_id TEXT,
+                service TEXT NOT NULL,
+                operation TEXT,
+                prompt_tokens INTEGER,
+                completion_tokens INTEGER,
+                chars INTEGER,
+                bytes_sent INTEGER,
+                bytes_received INTEGER,
+                latency_ms INTEGER NOT NULL,
+                retries INTEGER NOT NULL DEFAULT 0,
+                ok INTEGER NOT NULL DEFAULT 1,
+                error_message TEXT,
+                created_at TEXT NOT NULL
+            );
+
+            CREATE TABLE IF NOT EXISTS extraction (
+                id TEXT PRIMARY KEY,
+                content_key TEXT NOT NULL UNIQUE,
+                source TEXT NOT NULL,
+                source_ref TEXT,
+                text TEXT NOT NULL,
+                removed_json TEXT,
+                created_at TEXT NOT NULL
+            );
+
+            -- Очередь задач: переживает перезапуск; воркер берёт задачу в аренду (lease) и продлевает её heartbeat-ом.
+            -- Время аренды и постановки — unix time (REAL), чтобы сравнивать без разбора строк.
+            CREATE TABLE IF NOT EXISTS queue_item (
+                task_id TEXT PRIMARY KEY,
+                state TEXT NOT NULL DEFAULT 'queued',
+                lease_owner TEXT,
+                lease_expires_at REAL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                enqueued_at REAL NOT NULL,
+                session_id TEXT,
+                priority INTEGER NOT NULL DEFAULT 0,
+                est_work REAL NOT NULL DEFAULT 0
+            );
+
+            -- Процессы воркеров и число их воркеров (heartbeat): сколько задач очередь выполняет одновременно
+            CREATE TABLE IF NOT EXISTS queue_worker (
+                process_id TEXT PRIMARY KEY,
+                slots INTEGER NOT NULL,
+                heartbeat_at REAL NOT NULL
+            );
+
+            CREATE TABLE IF NOT EXISTS stage_timing (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                task_id TEXT NOT NULL,
+                stage TEXT NOT NULL,
+                seconds REAL NOT NULL,
+                text_length INTEGER,
+                replicas INTEGER,
+                cache_hit_ratio REAL,
+                duration_minutes REAL,
+                created_at TEXT NOT NULL
+            );
+
             CREATE INDEX IF NOT EXISTS idx_task_session ON task(session_id);
             CREATE INDEX IF NOT EXISTS idx_task_status ON task(status);
             CREATE INDEX IF NOT EXISTS idx_task_created ON task(created_at);
+            CREATE INDEX IF NOT EXISTS idx_api_call_task ON api_call(task_id);
+            CREATE INDEX IF NOT EXISTS idx_api_call_created ON api_call(created_at);
+            CREATE INDEX IF NOT EXISTS idx_extraction_created ON extraction(created_at);
+            CREATE INDEX IF NOT EXISTS idx_queue_item_state ON queue_item(state, enqueued_at);
+            CREATE INDEX IF NOT EXISTS idx_stage_timing_stage ON stage_timing(stage, id);
         """)
         try:
             conn.execute("ALTER TABLE task ADD COLUMN progress INTEGER DEFAULT 0")
@@ -79,4 +214,36 @@ def init_db():
             conn.execute("ALTER TABLE task ADD COLUMN activity_message TEXT")
         except sqlite3.OperationalError:
             pass
+        # Планировщик очереди: приоритет и оценка объёма работы задачи, время последней выдачи задачи сессии
+        for ddl in (
+            "ALTER TABLE queue_item ADD COLUMN session_id TEXT",
+            "ALTER TABLE queue_item ADD COLUMN priority INTEGER NOT NULL DEFAULT 0",
+            "ALTER TABLE queue_item ADD COLUMN est_work REAL NOT NULL DEFAULT 0",
+            "ALTER TABLE session ADD COLUMN last_claimed_at REAL",
+            # Отчёт об отмене задачи: этап и сэкономленные вызовы API
+            "ALTER TABLE task ADD COLUMN cancel_report_json TEXT",
+            # Объединение одинаковых задач: отпечаток (источник + параметры) и задача-лидер, чей результат общий
+            "ALTER TABLE task ADD COLUMN fingerprint TEXT",
+            "ALTER TABLE task ADD COLUMN leader_task_id TEXT",
+            # Прогноз ETA: начало текущего этапа (unix time) и признаки задачи, известные по ходу выполнения
+            "ALTER TABLE task ADD COLUMN stage_started_at REAL",
+            "ALTER TABLE task ADD COLUMN features_json TEXT",
+            # Версия задачи: растёт при каждом изменении строки (long-poll и SSE в /api/tasks/<id>)
+            "ALTER TABLE task ADD COLUMN version INTEGER NOT NULL DEFAULT 0",
+        ):
+            try:
+                conn.execute(ddl)
+            except sqlite3.OperationalError:
+                pass
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_task_fingerprint ON task(fingerprint, status)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_task_leader ON task(leader_task_id)")
+        # Список подкастов: обход result по (created_at, id) от новых к старым, задачи результата — по индексу
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_result_created ON result(created_at, id)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_task_result ON task(result_id, status)")
+        # Триггер, а не version = version + 1 в каждом UPDATE: версию меняют все writer-ы, включая будущие
+        conn.execute(
+            """CREATE TRIGGER IF NOT EXISTS trg_task_version AFTER UPDATE ON task
+               WHEN NEW.version = OLD.version
+               BEGIN UPDATE task SET version = OLD.version + 1 WHERE id = NEW.id; END"""
+        )
     return path
@@ -1,34 +1,49 @@
 """REST API routes. ТЗ 4.2."""
+import base64
 import json
 import logging
+import shutil
 import threading
+import time
 import uuid
 from pathlib import Path
 
 import requests
-from flask import Blueprint, jsonify, request, send_file
+from flask import Blueprint, Response, jsonify, request, send_file, stream_with_context
+from werkzeug.exceptions import RequestEntityTooLarge
 
 from backend.config import (
-    UPLOAD_PATH, MAX_TEXT_LENGTH, MAX_FILE_SIZE_BYTES, STORAGE_PATH,
+    UPLOAD_PATH, MAX_TEXT_LENGTH, MAX_FILE_SIZE_BYTES, STORAGE_PATH, EXTRACT_BATCH_MAX_ITEMS,
     resolve_storage_path, BASE_URL,
     OPENAPI_LLM_URL, OPENAPI_LLM_API_KEY,
     OPENAPI_TTS_URL, OPENAPI_TTS_API_KEY,
     OPENAPI_IMAGE_URL, OPENAPI_IMAGE_API_KEY,
 )
 from backend.database import get_connection
-from backend.services.text_extraction import (
-    extract_from_pdf,
-    extract_from_docx,
-    extract_from_url,
-)
+from backend.services import cancellation, executors, progress_bus, task_progress
+from backend.services.batch_extract import iter_batch
+from backend.services.checkpoints import first_incomplete_stage
+from backend.services.coalescing import find_leader, live_followers, task_fingerprint
+from backend.services.extraction_cache import extract_file_cached, extract_url_cached, get_extraction
 from backend.services.llm_client import generate_script
 from backend.services.music_cover import list_music_tracks
+from backend.services.scheduling import estimate_work, parse_priority
 from backend.services.tts_client import list_voices, get_voice_preview_path, preload_voice_previews
-from backend.tasks_queue import enqueue, get_queue_size
+from backend.services.uploads import save_upload
+from backend.services.usage import get_task_usage, get_usage_summary
+from backend.tasks_queue import (
+    check_admission, enqueue, get_admission_stats, get_predicted_wait, get_queue_position, get_queue_size,
+    get_queue_stats, get_task_forecast, record_admission,
+)
 
 logger = logging.getLogger(__name__)
 api_bp = Blueprint("api", __name__)
 
+TERMINAL_STATUSES = ("completed", "failed", "cancelled")
+# Long-poll GET /api/tasks/<id>?wait= — не дольше, сек; SSE — комментарий-пинг при тишине, сек
+LONG_POLL_MAX_SECONDS = 60
+SSE_KEEPALIVE_SECONDS = 15
+
 ALLOWED_EXTENSIONS = {"pdf", "docx", "doc"}
 
 
@@ -56,12 +71,17 @@ def api_status():
     llm_configured = bool(OPENAPI_LLM_URL and OPENAPI_LLM_API_KEY)
     tts_configured = bool(OPENAPI_TTS_URL and OPENAPI_TTS_API_KEY)
     image_configured = bool(OPENAPI_IMAGE_URL and OPENAPI_IMAGE_API_KEY)
-    queue_pending = get_queue_size()
+    queue = get_queue_stats()
     return jsonify({
         "llm": "configured" if llm_configured else "unavailable",
         "tts": "configured" if tts_configured else "unavailable",
         "image": "configured" if image_configured else "unavailable",
-        "queue_pending": queue_pending,
+        "queue_pending": queue["queued"],
+        "queue_in_flight": queue["in_flight"],
+        "predicted_wait_seconds": get_predicted_wait(),
+        "admission": get_admission_stats(),
+        "workers": queue["workers"],
+        "abandoned": executors.get_stats(),
     })
 
 
@@ -84,14 +104,13 @@ def extract_text():
                     "error": "Неподдерживаемый формат файла.",
                     "recommendation": "Используйте PDF или DOCX."
                 }), 400
-            UPLOAD_PATH.mkdir(parents=True, exist_ok=True)
-            path = UPLOAD_PATH / f.filename
-            f.save(path)
+            # Уникальное имя: одновременные загрузки файлов с одинаковым именем не перезаписывают друг друга
+            path, content_hash, _ = save_upload(f, UPLOAD_PATH)
             try:
-                if path.suffix.lower() == ".pdf":
-                    text, removed_phones, removed_contacts = extract_from_pdf(path)
-                else:
-                    text, removed_phones, removed_contacts = extract_from_docx(path)
+                # Лимит + 1 символ: для PDF достаточно, чтобы обнаружить превышение, без разбора всего документа
+                text, removed_phones, removed_contacts, extraction_id = extract_file_cached(
+                    path, max_chars=MAX_TEXT_LENGTH + 1, content_hash=content_hash, filename=f.filename,
+                )
             finally:
                 try:
                     path.unlink(missing_ok=True)
@@ -105,7 +124,7 @@ def extract_text():
                     "error": "Не указан URL.",
                     "recommendation": "Передайте в теле запроса JSON: { \"url\": \"https://...\" }"
                 }), 400
-            text, removed_phones, removed_contacts = extract_from_url(url)
+            text, removed_phones, removed_contacts, extraction_id = extract_url_cached(url)
         else:
             return jsonify({
                 "error": "Некорректный запрос.",
@@ -127,7 +146,10 @@ def extract_text():
             "text": text,
             "length": len(text),
             "removed": removed,
+            "extraction_id": extraction_id,
         })
+    except RequestEntityTooLarge:
+        raise
     except ValueError as e:
         logger.warning("extract_text validation: %s", e)
         return jsonify({
@@ -148,6 +170,66 @@ def extract_text():
         }), 500
 
 
+@api_bp.route("/extract/batch", methods=["POST"])
+def extract_batch():
+    """
+    Пакетное извлечение: JSON { "urls": [...] } или multipart (файлы под ключом 'file', URL — поля 'url').
+    Источники обрабатываются параллельно; ответ — NDJSON, по строке на источник по мере готовности
+    (index — позиция во входном списке: сначала URL, затем файлы), последняя строка — {"done": true, ...}.
+    Тело запроса целиком ограничено MAX_CONTENT_LENGTH (413): файлы пакета вместе — не больше лимита одного файла.
+    """
+    items = []
+    if request.content_type and "multipart/form-data" in request.content_type:
+        urls = [u.strip() for u in request.form.getlist("url") if u.strip()]
+        files = [f for f in request.files.getlist("file") if f and f.filename]
+    elif request.is_json:
+        data = request.get_json() or {}
+        urls = data.get("urls") or []
+        if not isinstance(urls, list):
+            urls = []
+        urls = [u.strip() for u in urls if isinstance(u, str) and u.strip()]
+        files = []
+    else:
+        return jsonify({
+            "error": "Некорректный запрос.",
+            "recommendation": "Отправьте JSON { \"urls\": [...] } или multipart с файлами (ключ 'file') и полями 'url'."
+        }), 400
+    if not urls and not files:
+        return jsonify({"error": "Не указаны источники.", "recommendation": "Передайте список URL и/или файлы."}), 400
+    if len(urls) + len(files) > EXTRACT_BATCH_MAX_ITEMS:
+        return jsonify({
+            "error": f"Слишком много источников (максимум {EXTRACT_BATCH_MAX_ITEMS}).",
+            "recommendation": "Разбейте список на несколько запросов."
+        }), 400
+    bad = [f.filename for f in files if not allowed_file(f.filename)]
+    if bad:
+        return jsonify({"error": f"Неподдерживаемый формат файла: {', '.join(bad)}.", "recommendation": "Используйте PDF или DOCX."}), 400
+    items.extend({"url": u} for u in urls)
+    try:
+        # Файлы дочитываются из запроса до начала ответа: поток запроса после этого уже недоступен
+        for f in files:
+            path, content_hash, _ = save_upload(f, UPLOAD_PATH)
+            items.append({"path": path, "name": f.filename, "content_hash": content_hash})
+    except ValueError as e:
+        for item in items:
+            if "path" in item:
+                item["path"].unlink(missing_ok=True)
+        return jsonify({"error": str(e), "recommendation": "Загрузите файл меньшего размера."}), 400
+
+    def generate():
+        ok = failed = 0
+        for entry in iter_batch(items):
+            if "error" in entry:
+                failed += 1
+            else:
+                ok += 1
+            yield json.dumps(entry, ensure_ascii=False) + "\n"
+        yield json.dumps({"done": True, "total": len(items), "ok": ok, "failed": failed}) + "\n"
+
+    logger.info("[api] POST /extract/batch: urls=%s files=%s", len(urls), len(files))
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+
+
 @api_bp.route("/script", methods=["POST"])
 def create_script():
     """
@@ -191,20 +273,33 @@ def create_task():
     """
     Создание задачи: multipart (file + params) или JSON (url + params).
     Параметры: format, style, duration, voice_map, music_id, music_volume_db, title, description, cover_prompt, base_url.
+    extraction_id (из /api/extract) заменяет file/url: текст берётся из кэша извлечения, повторная загрузка не нужна.
+    priority — целое от -10 до 10 (по умолчанию 0): задачи с большим приоритетом выдаются воркерам раньше.
+    Задача с тем же источником и параметрами, что у выполняемой или недавно завершённой, не запускается заново:
+    она получает её статус и результат (coalesced_with в ответе). reuse=false — всегда новая генерация.
+    Источник сравнивается по содержимому: страница по url загружается при создании задачи (обычно условным GET).
     """
     session_id = request.headers.get("X-Session-Id") or request.args.get("session_id") or str(uuid.uuid4())
     task_id = str(uuid.uuid4())
     params = {}
     if request.content_type and "multipart/form-data" in request.content_type:
         f = request.files.get("file")
-        if f and f.filename and allowed_file(f.filename):
-            UPLOAD_PATH.mkdir(parents=True, exist_ok=True)
-            task_upload = UPLOAD_PATH / task_id
-            task_upload.mkdir(parents=True, exist_ok=True)
-            path = task_upload / (f.filename or "document.pdf")
-            f.save(path)
+        extraction = get_extraction((request.form.get("extraction_id") or "").strip())
+        if extraction:
+            params["source"] = "extraction"
+            params["extraction_id"] = extraction["extraction_id"]
+        elif f and f.filename and allowed_file(f.filename):
+            try:
+                path, content_hash, _ = save_upload(f, UPLOAD_PATH / task_id)
+            except ValueError as e:
+                return jsonify({
+                    "error": str(e),
+                    "recommendation": "Загрузите файл меньшего размера или сократите документ.",
+                }), 400
             params["source"] = "file"
             params["file_path"] = str(path)
+            params["content_hash"] = content_hash
+            params["filename"] = f.filename
         for key in ("format", "style", "duration", "presentation", "music_id", "title", "description", "cover_prompt", "base_url"):
             val = request.form.get(key)
             if val is not None:
@@ -217,19 +312,27 @@ def create_task():
             params["voice_speed"] = float(request.form.get("voice_speed", 1.0))
         except (TypeError, ValueError):
             params["voice_speed"] = 1.0
+        priority_raw = request.form.get("priority")
+        reuse_raw = request.form.get("reuse")
         voice_1 = request.form.get("voice_1") or "male_1"
         voice_2 = request.form.get("voice_2") or "female_1"
         params["voice_map"] = {"1": voice_1, "2": voice_2}
     elif request.is_json:
         data = request.get_json() or {}
         url = (data.get("url") or "").strip()
-        if not url:
+        extraction = get_extraction((data.get("extraction_id") or "").strip())
+        if extraction:
+            params["source"] = "extraction"
+            params["extraction_id"] = extraction["extraction_id"]
+        elif not url:
             return jsonify({
                 "error": "Для создания по URL укажите поле 'url'.",
-                "recommendation": "Передайте url в JSON."
+                "recommendation": "Передайте url в JSON или extraction_id из /api/extract."
             }), 400
-        params["source"] = "url"
-        params["url"] = url
+        else:
+            params["source"] = "url"
+        if url:
+            params["url"] = url
         params["format"] = (data.get("format") or "dialog").strip() or "dialog"
         params["style"] = (data.get("style") or "conversational").strip() or "conversational"
         params["duration"] = (data.get("duration") or "standard").strip() or "standard"
@@ -242,6 +345,8 @@ def create_task():
         params["description"] = data.get("description")
         params["cover_prompt"] = data.get("cover_prompt")
         params["base_url"] = (data.get("base_url") or request.url_root.rstrip("/")).strip()
+        priority_raw = data.get("priority")
+        reuse_raw = data.get("reuse")
     else:
         return jsonify({
             "error": "Отправьте файл (multipart) или JSON с полем url.",
@@ -250,62 +355,220 @@ def create_task():
 
     if not params.get("source"):
         return jsonify({"error": "Укажите файл или url.", "recommendation": "См. документацию API."}), 400
-
+    try:
+        params["priority"] = parse_priority(priority_raw)
+    except ValueError as e:
+        return jsonify({"error": str(e), "recommendation": "Уберите поле или передайте целое число."}), 400
+    reuse = str(reuse_raw).strip().lower() not in ("0", "false", "no") if reuse_raw is not None else True
+    if reuse and params["source"] == "url":
+        # Отпечаток — по содержимому страницы, а не по адресу: изменившаяся статья не получит старый выпуск.
+        # Обычно это условный GET (304 из HTTP-кэша); текст сохраняется в кэше извлечения и пайплайн его не загружает
+        try:
+            _, _, _, extraction_id = extract_url_cached(params["url"])
+        except ValueError as e:
+            return jsonify({"error": str(e), "recommendation": "Проверьте URL или передайте reuse=false."}), 400
+        except requests.exceptions.RequestException as e:
+            logger.warning("[api] POST /tasks: загрузка %s: %s", params["url"], e)
+            return jsonify({
+                "error": "Не удалось загрузить страницу по URL.",
+                "recommendation": "Проверьте URL и доступность сайта.",
+            }), 400
+        extraction = get_extraction(extraction_id)
+        if extraction:
+            params["source"] = "extraction"
+            params["extraction_id"] = extraction["extraction_id"]
+    est_work = estimate_work(params, len(extraction["text"]) if extraction else None)
+    fingerprint = task_fingerprint(params, extraction) if reuse else None
+
+    leader = None
+    rejection = None
+    shared_upload = False
     with get_connection() as conn:
+        # Поиск совпадения, проверка лимитов очереди и вставка в одной транзакции — двойной клик
+        # не запустит два пайплайна, параллельные запросы не превысят лимит
+        conn.execute("BEGIN IMMEDIATE")
         conn.execute("INSERT OR IGNORE INTO session (id, created_at) VALUES (?, ?)", (session_id, _now()))
-        conn.execute(
-            "INSERT INTO task (id, session_id, status, stage, params_json, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
-            (task_id, session_id, "pending", "", json.dumps(params), _now(), _now()),
-        )
-    enqueue(task_id)
+        if fingerprint:
+            leader = find_leader(conn, fingerprint)
+        if leader is None:
+            # Присоединение к другой задаче очередь не удлиняет — лимиты только для новых
+            rejection = check_admission(conn, session_id)
+            if rejection is None:
+                conn.execute(
+                    "INSERT INTO task (id, session_id, status, stage, params_json, created_at, updated_at, fingerprint) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (task_id, session_id, "pending", "", json.dumps(params), _now(), _now(), fingerprint),
+                )
+        else:
+            leader_params = json.loads(leader["params_json"] or "{}")
+            if params.get("source") == "file" and leader_params.get("file_path"):
+                params["file_path"] = leader_params["file_path"]  # своя копия загрузки не нужна
+                shared_upload = True
+            conn.execute(
+                """INSERT INTO task (id, session_id, status, stage, params_json, created_at, updated_at, fingerprint,
+                   leader_task_id, result_id, progress, activity_message) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                (task_id, session_id, leader["status"], leader["stage"], json.dumps(params), _now(), _now(), fingerprint,
+                 leader["id"], leader["result_id"], leader["progress"], leader["activity_message"]),
+            )
+            # Приоритет ожидающего лидера — не ниже, чем у присоединившейся задачи
+            conn.execute(
+                "UPDATE queue_item SET priority = MAX(priority, ?) WHERE task_id = ? AND state = 'queued'",
+                (params["priority"], leader["id"]),
+            )
+    if rejection:
+        record_admission(rejection["reason"])
+        if params.get("source") == "file":
+            shutil.rmtree(UPLOAD_PATH / task_id, ignore_errors=True)
+        logger.info("[api] POST /tasks: отказ (%s), Retry-After=%s", rejection["reason"], rejection["retry_after"])
+        if rejection["reason"] == "queue_full":
+            error = f"Очередь заполнена: ожидают обработки {rejection['limit']} задач."
+        else:
+            error = f"У сессии уже {rejection['limit']} незавершённых задач."
+        resp = jsonify({
+            "error": error,
+            "recommendation": f"Повторите запрос через {rejection['retry_after']} с.",
+            "reason": rejection["reason"],
+            "retry_after": rejection["retry_after"],
+        })
+        resp.headers["Retry-After"] = str(rejection["retry_after"])
+        return resp, 429
+    if leader is None:
+        record_admission("queued")
+        enqueue(task_id, priority=params["priority"], est_work=est_work)
+    else:
+        record_admission("coalesced")
+        if shared_upload:
+            shutil.rmtree(UPLOAD_PATH / task_id, ignore_errors=True)
+        logger.info("[api] POST /tasks: задача %s объединена с %s (status=%s)", task_id, leader["id"], leader["status"])
+    progress_bus.publish(progress_bus.session_topic(session_id))
     queue_pending = get_queue_size()
+    status = leader["status"] if leader else "pending"
     payload = {
         "task_id": task_id,
         "session_id": session_id,
-        "status": "pending",
+        "status": status,
         "queue_pending": queue_pending,
+        "queue_position": get_queue_position(leader["id"] if leader else task_id) if status == "pending" else None,
     }
+    if leader:
+        payload["coalesced_with"] = leader["id"]
     logger.info("[api] POST /tasks: создана задача task_id=%s, возвращаем payload=%s", task_id, payload)
     return jsonify(payload), 201
 
 
 @api_bp.route("/podcasts")
 def list_podcasts():
-    """Список всех сгенерированных подкастов (completed) для страницы /podcasts."""
+    """
+    Список сгенерированных подкастов (completed) для страницы /podcasts, от новых к старым.
+    Постранично по курсору: next_cursor из ответа передаётся в ?cursor= (None — страниц больше нет).
+    Фильтры: session_id, from / to (ISO-дата или дата-время, UTC; to-дата включает весь день).
+    """
     try:
         limit = min(int(request.args.get("limit", 50)), 100)
     except (TypeError, ValueError):
         limit = 50
-    with get_connection() as conn:
+    limit = max(limit, 1)
+    session_id = (request.args.get("session_id") or "").strip() or None
+    try:
+        date_from = _parse_list_date(request.args.get("from"))
+        date_to = _parse_list_date(request.args.get("to"), end_of_day=True)
+        after = _decode_cursor(request.args.get("cursor"))
+    except ValueError as e:
+        return jsonify({
+            "error": str(e),
+            "recommendation": "Передайте from/to в формате ISO (2024-05-01 или 2024-05-01T12:00:00) и cursor из предыдущего ответа.",
+        }), 400
+
+    # Задача результата: последователи делят результат лидера, ссылка — на первую (в сессии — на свою)
+    task_where = "t.result_id = r.id AND t.status = 'completed'" + (" AND t.session_id = ?" if session_id else "")
+    where, args = [], []
+    if session_id:
+        # Эпизодов сессии немного — отбор по индексу задач сессии (+status: не по индексу статуса), а не обход всех результатов
+        where.append("r.id IN (SELECT t.result_id FROM task t WHERE t.session_id = ? AND +t.status = 'completed')")
+        args.append(session_id)
+    else:
+        where.append("EXISTS (SELECT 1 FROM task t WHERE " + task_where + ")")
+    if date_from:
+        where.append("r.created_at >= ?")
+        args.append(date_from)
+    if date_to:
+        where.append("r.created_at < ?")
+        args.append(date_to)
+    if after:
+        # Сравнение строк значений — поиск по индексу idx_result_created с позиции курсора, без OFFSET
+        where.append("(r.created_at, r.id) < (?, ?)")
+        args.extend(after)
+    with get_connection(readonly=True) as conn:
         rows = conn.execute(
-            """SELECT r.task_id, r.title, r.description, r.duration_seconds, r.created_at, r.cover_path
+            f"""SELECT r.id, (SELECT MIN(t.id) FROM task t WHERE {task_where}) AS task_id,
+                      r.title, r.description, r.duration_seconds, r.created_at, r.cover_path
                FROM result r
-               JOIN task t ON t.result_id = r.id
-               WHERE t.status = 'completed'
-               ORDER BY r.created_at DESC
+               WHERE {" AND ".join(where)}
+               ORDER BY r.created_at DESC, r.id DESC
                LIMIT ?""",
-            (limit,),
+            ([session_id] if session_id else []) + args + [limit + 1],
         ).fetchall()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = _encode_cursor(rows[-1]["created_at"], rows[-1]["id"])
     base = (BASE_URL or request.url_root.rstrip("/")).strip() or request.url_root.rstrip("/")
     out = []
     for row in rows:
         r = dict(row)
+        r.pop("id")
         r["url"] = f"{base}/result/{r['task_id']}"
         r["mp3_url"] = f"{base}/api/files/{r['task_id']}/mp3"
         r["cover_url"] = f"{base}/api/files/{r['task_id']}/cover" if r.get("cover_path") else None
         out.append(r)
-    return jsonify({"podcasts": out})
+    return jsonify({"podcasts": out, "next_cursor": next_cursor})
 
 
-@api_bp.route("/tasks/<task_id>")
-def get_task(task_id):
-    """Статус и результат задачи. ТЗ 4.2."""
-    with get_connection() as conn:
+def _encode_cursor(created_at: str, result_id: str) -> str:
+    """Курсор списка подкастов: позиция последнего выданного эпизода (created_at, id)."""
+    raw = json.dumps([created_at, result_id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def _decode_cursor(value):
+    if not value:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(value + "=" * (-len(value) % 4))
+        created_at, result_id = json.loads(raw)
+        if not isinstance(created_at, str) or not isinstance(result_id, str):
+            raise TypeError
+    except (ValueError, TypeError):
+        raise ValueError("Некорректный cursor.")
+    return created_at, result_id
+
+
+def _parse_list_date(value, end_of_day: bool = False):
+    """ISO-дата фильтра в формате result.created_at (UTC без зоны); to-дата без времени — до конца дня."""
+    from datetime import datetime, timedelta, timezone
+    value = (value or "").strip()
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        raise ValueError(f"Некорректная дата: {value}.")
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    if end_of_day and len(value) == 10:
+        parsed += timedelta(days=1)
+    return parsed.isoformat()
+
+
+def _task_payload(task_id: str, with_usage: bool = True):
+    """
+    Ответ GET /api/tasks/<id> (None — задачи нет). with_usage=False — usage только у завершённой задачи:
+    long-poll и SSE пересобирают ответ при каждом изменении, расход API нужен клиенту в итоговом.
+    """
+    with get_connection(readonly=True) as conn:
         row = conn.execute("SELECT * FROM task WHERE id = ?", (task_id,)).fetchone()
         if not row:
-            logger.info("[api] GET task %s: 404 not found", task_id)
-            return jsonify({"error": "Задача не найдена.", "recommendation": "Проверьте task_id."}), 404
-        task = dict(row)
+            return None
+        task = task_progress.overlay(dict(row))
         result = None
         if task.get("result_id"):
             r = conn.execute("SELECT * FROM result WHERE id = ?", (task["result_id"],)).fetchone()
@@ -321,8 +584,13 @@ def get_task(task_id):
         "error_message": task.get("error_message"),
         "created_at": task["created_at"],
         "updated_at": task["updated_at"],
+        "version": task.get("version") or 0,
+        **get_task_forecast(task),
+        "coalesced_with": task.get("leader_task_id"),
+        "usage": get_task_usage(task_id) if with_usage or task["status"] in TERMINAL_STATUSES else None,
+        "cancellation": json.loads(task["cancel_report_json"]) if task.get("cancel_report_json") else None,
     }
-    logger.info(
+    logger.debug(
         "[api] GET task %s: status=%s stage=%s progress=%s has_result=%s",
         task_id, out["status"], out["stage"], out["progress"], result is not None,
     )
@@ -336,28 +604,183 @@ def get_task(task_id):
             "cover_url": f"{base}/api/files/{task_id}/cover" if result.get("cover_path") else None,
             "rss_url": f"{base}/api/files/{task_id}/rss",
         }
-        logger.info("[api] GET task %s: возвращаем result_id=%s mp3=%s", task_id, result.get("id"), result.get("mp3_path"))
+    return out
+
+
+def _wait_for_change(task_id: str, since: int, timeout: float) -> None:
+    """
+    Ждать (не дольше timeout), пока версия задачи не отличится от since; для ожидающей задачи — и сдвига очереди.
+    Ожидание — на событиях шины прогресса, БД читается только после события.
+    """
+    deadline = time.monotonic() + timeout
+    with progress_bus.subscribe(task_id) as sub:
+        while True:
+            with get_connection(readonly=True) as conn:
+                row = conn.execute("SELECT id, status, version, leader_task_id FROM task WHERE id = ?", (task_id,)).fetchone()
+            if not row:
+                return
+            row = task_progress.overlay(dict(row))
+            if (row["version"] or 0) != since or row["status"] in TERMINAL_STATUSES:
+                return
+            wanted = {row["leader_task_id"], progress_bus.QUEUE if row["status"] == "pending" else None} - {None}
+            if wanted - sub.topics:
+                sub.add(*wanted)
+                continue  # событие могло прийти до подписки — перечитать
+            left = deadline - time.monotonic()
+            if left <= 0:
+                return
+            if progress_bus.QUEUE in sub.wait(left):
+                return
+
+
+@api_bp.route("/tasks/<task_id>")
+def get_task(task_id):
+    """
+    Статус и результат задачи. ТЗ 4.2. Для ожидающей и выполняемой — позиция в очереди и прогноз начала/окончания.
+    Long-poll: ?since=<version>&wait=<сек> — ответ, как только версия задачи изменится (или сдвинется очередь
+    для ожидающей задачи), иначе по истечении wait (не больше LONG_POLL_MAX_SECONDS). usage в long-poll —
+    только в ответе завершённой задачи.
+    """
+    since = request.args.get("since", type=int)
+    wait = min(request.args.get("wait", 0, type=float), LONG_POLL_MAX_SECONDS)
+    if since is not None and wait > 0:
+        _wait_for_change(task_id, since, wait)
+    out = _task_payload(task_id, with_usage=since is None)
+    if out is None:
+        logger.info("[api] GET task %s: 404 not found", task_id)
+        return jsonify({"error": "Задача не найдена.", "recommendation": "Проверьте task_id."}), 404
     resp = jsonify(out)
     resp.headers["Cache-Control"] = "no-store, no-cache, must-revalidate"
     resp.headers["Pragma"] = "no-cache"
     return resp
 
 
+@api_bp.route("/tasks/<task_id>/events")
+def task_events(task_id):
+    """
+    Server-Sent Events: событие task (id — версия задачи, data — как GET /api/tasks/<id>) при каждом изменении,
+    end — задача завершена. Last-Event-ID при переподключении — без повтора уже полученного состояния.
+    """
+    with get_connection(readonly=True) as conn:
+        if not conn.execute("SELECT 1 FROM task WHERE id = ?", (task_id,)).fetchone():
+            return jsonify({"error": "Задача не найдена.", "recommendation": "Проверьте task_id."}), 404
+    last_id = request.headers.get("Last-Event-ID") or request.args.get("since")
+    try:
+        last_version = int(last_id) if last_id is not None else None
+    except ValueError:
+        last_version = None
+
+    def stream():
+        sent = (last_version, None)
+        with progress_bus.subscribe(task_id) as sub:
+            while True:
+                payload = _task_payload(task_id, with_usage=False)
+                if payload is None:
+                    return
+                key = (payload["version"], payload["queue_position"])
+                if key != sent:
+                    yield f"id: {payload['version']}\nevent: task\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+                    sent = key
+                if payload["status"] in TERMINAL_STATUSES:
+                    yield "event: end\ndata: {}\n\n"
+                    return
+                wanted = {payload["coalesced_with"], progress_bus.QUEUE if payload["status"] == "pending" else None} - {None}
+                if payload["status"] != "pending":
+                    sub.remove(progress_bus.QUEUE)
+                if wanted - sub.topics:
+                    sub.add(*wanted)
+                    continue  # событие могло прийти до подписки — перечитать
+                while not sub.wait(SSE_KEEPALIVE_SECONDS):
+                    yield ": ping\n\n"  # закрытое клиентом соединение обнаружится на записи
+
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return Response(stream_with_context(stream()), mimetype="text/event-stream", headers=headers)
+
+
+@api_bp.route("/tasks/<task_id>/retry", methods=["POST"])
+def retry_task(task_id):
+    """
+    Повтор упавшей или отменённой задачи с первого несделанного этапа: текст, сценарий, озвучка
+    и обложка берутся из контрольных точек в каталоге задачи и повторно не запрашиваются.
+    """
+    with get_connection() as conn:
+        row = conn.execute("SELECT status, params_json FROM task WHERE id = ?", (task_id,)).fetchone()
+        if not row:
+            return jsonify({"error": "Задача не найдена.", "recommendation": "Проверьте task_id."}), 404
+        if row["status"] not in ("failed", "cancelled"):
+            return jsonify({
+                "error": "Повторить можно только задачу со статусом failed или cancelled.",
+                "recommendation": "Дождитесь завершения задачи.",
+            }), 409
+        if conn.execute("SELECT 1 FROM queue_item WHERE task_id = ?", (task_id,)).fetchone():
+            return jsonify({
+                "error": "Отменённая задача ещё завершается.",
+                "recommendation": "Повторите запрос через несколько секунд.",
+            }), 409
+        # Повтор выполняется самой задачей: она отсоединяется от лидера, её бывшие последователи — от неё
+        cur = conn.execute(
+            """UPDATE task SET status = 'pending', error_message = NULL, cancel_report_json = NULL, leader_task_id = NULL,
+               activity_message = ?, updated_at = ? WHERE id = ? AND status IN ('failed', 'cancelled')""",
+            ("В очереди (повтор)", _now(), task_id),
+        )
+        if cur.rowcount == 0:
+            return jsonify({"error": "Задача уже перезапущена.", "recommendation": "Обновите статус задачи."}), 409
+        conn.execute("UPDATE task SET leader_task_id = NULL WHERE leader_task_id = ?", (task_id,))
+    params = json.loads(row["params_json"] or "{}")
+    resume_stage = first_incomplete_stage(STORAGE_PATH / task_id) or "rss"
+    enqueue(task_id, priority=params.get("priority") or 0, est_work=estimate_work(params))
+    progress_bus.publish(task_id)
+    logger.info("[api] Задача %s: повтор с этапа %s", task_id, resume_stage)
+    return jsonify({
+        "task_id": task_id,
+        "status": "pending",
+        "resume_stage": resume_stage,
+        "queue_position": get_queue_position(task_id),
+    })
+
+
+@api_bp.route("/usage")
+def usage_summary():
+    """
+    Сводка по внешним вызовам (LLM, TTS, изображения): токены, символы, байты, задержки, повторы.
+    ?hours=N — за последние N часов (по умолчанию 24; 0 — за всё время).
+    """
+    try:
+        hours = float(request.args.get("hours", 24))
+    except (TypeError, ValueError):
+        hours = 24
+    since = None
+    if hours > 0:
+        from datetime import datetime, timedelta
+        since = (datetime.utcnow() - timedelta(hours=hours)).isoformat()
+    return jsonify(get_usage_summary(since=since))
+
+
 @api_bp.route("/tasks/<task_id>/cancel", methods=["POST"])
 def cancel_task(task_id):
-    """Отмена задачи (помечаем отменённой; воркер может уже обрабатывать)."""
+    """
+    Отмена задачи. Ожидающая задача снимается с очереди; выполняемая прерывается: воркер этого процесса —
+    сразу, воркер другого процесса — при ближайшей проверке отмены в БД (около секунды).
+    Если результата задачи ждут присоединившиеся к ней задачи, пайплайн продолжает работу для них.
+    """
     with get_connection() as conn:
         cur = conn.execute("UPDATE task SET status = 'cancelled', updated_at = ? WHERE id = ? AND status IN ('pending', 'running')", (_now(), task_id))
         if cur.rowcount == 0:
             return jsonify({"error": "Задача не найдена или уже завершена.", "recommendation": "Проверьте task_id."}), 404
+        shared = live_followers(conn, task_id) > 0
+        if not shared:
+            conn.execute("DELETE FROM queue_item WHERE task_id = ? AND state = 'queued'", (task_id,))
+    progress_bus.publish(task_id, progress_bus.QUEUE)
+    interrupted = False if shared else cancellation.cancel(task_id)
+    logger.info("[api] Задача %s отменена%s", task_id, " (прерван выполняющийся пайплайн)" if interrupted else "")
     return jsonify({"task_id": task_id, "status": "cancelled"})
 
 
 @api_bp.route("/files/<task_id>/mp3")
 def download_mp3(task_id):
     """Скачивание MP3. Доступ только через backend. ТЗ 3.7."""
-    with get_connection() as conn:
-        r = conn.execute("SELECT mp3_path FROM result r JOIN task t ON r.task_id = t.id WHERE t.id = ? AND t.status = 'completed'", (task_id,)).fetchone()
+    with get_connection(readonly=True) as conn:
+        r = conn.execute("SELECT mp3_path FROM result r JOIN task t ON t.result_id = r.id WHERE t.id = ? AND t.status = 'completed'", (task_id,)).fetchone()
         if not r:
             return jsonify({"error": "Файл не найден."}), 404
         try:
@@ -372,8 +795,8 @@ def download_mp3(task_id):
 
 @api_bp.route("/files/<task_id>/cover")
 def download_cover(task_id):
-    with get_connection() as conn:
-        r = conn.execute("SELECT cover_path FROM result r JOIN task t ON r.task_id = t.id WHERE t.id = ? AND t.status = 'completed'", (task_id,)).fetchone()
+    with get_connection(readonly=True) as conn:
+        r = conn.execute("SELECT cover_path FROM result r JOIN task t ON t.result_id = r.id WHERE t.id = ? AND t.status = 'completed'", (task_id,)).fetchone()
         if not r or not r["cover_path"]:
             return jsonify({"error": "Обложка не найдена."}), 404
         try:
@@ -388,8 +811,8 @@ def download_cover(task_id):
 
 @api_bp.route("/files/<task_id>/rss")
 def download_rss(task_id):
-    with get_connection() as conn:
-        r = conn.execute("SELECT rss_path FROM result r JOIN task t ON r.task_id = t.id WHERE t.id = ? AND t.status = 'completed'", (task_id,)).fetchone()
+    with get_connection(readonly=True) as conn:
+        r = conn.execute("SELECT rss_path FROM result r JOIN task t ON t.result_id = r.id WHERE t.id = ? AND t.status = 'completed'", (task_id,)).fetchone()
         if not r:
             return jsonify({"error": "RSS не найден."}), 404
         try:
@@ -1,62 +1,297 @@
-"""WebSocket для прогресса генерации. ТЗ 3.4, 7.1."""
+"""WebSocket для прогресса генерации. ТЗ 3.4, 7.1.
+Обновления приходят по событиям шины прогресса (services/progress_bus.py): БД читается только после изменения задачи.
+
+Протокол. Первое сообщение {"task_id": "..."} — одна задача: сервер шлёт её состояние при каждом изменении
+и закрывает соединение после завершения (как раньше).
+Сообщения {"op": "subscribe" | "unsubscribe", "task_ids": [...], "session_id": "..."} — подписка на много задач
+или на все незавершённые задачи сессии (включая созданные позже). Обновления копятся и отправляются кадром
+{"type": "batch", "updates": [...]} не чаще раза в WS_BATCH_INTERVAL_SECONDS; в кадре только изменившиеся задачи.
+"""
 import json
 import logging
+import threading
 import time
+from typing import Optional
 
 from flask_sock import Sock
+from simple_websocket import ConnectionClosed
+
+from backend.config import WS_BATCH_INTERVAL_SECONDS, WS_MAX_SUBSCRIPTIONS
 from backend.database import get_connection
+from backend.services import progress_bus, task_progress
+from backend.tasks_queue import get_queue_position, get_queue_positions
 
 logger = logging.getLogger(__name__)
 sock = Sock()
+# Как часто ожидающий событий обработчик проверяет, не закрыл ли клиент соединение, сек
+IDLE_CHECK_SECONDS = 15
+STAGE_PROGRESS = {"extract": 15, "script": 40, "tts": 70, "music_cover": 85, "rss": 95, "done": 100}
+TERMINAL_STATUSES = ("completed", "failed", "cancelled")
 
 
-def _get_task_status(task_id: str):
-    with get_connection() as conn:
-        row = conn.execute("SELECT * FROM task WHERE id = ?", (task_id,)).fetchone()
-        if not row:
-            return None
-        r = dict(row)
-        if r.get("result_id"):
-            res = conn.execute("SELECT title, duration_seconds FROM result WHERE id = ?", (r["result_id"],)).fetchone()
-            if res:
-                r["result"] = dict(res)
+def _get_tasks_status(task_ids) -> dict:
+    """Состояние задач двумя запросами (с ещё не записанным прогрессом из памяти): {task_id: строка задачи с result}."""
+    task_ids = list(task_ids)
+    if not task_ids:
+        return {}
+    out = {}
+    with get_connection(readonly=True) as conn:
+        for i in range(0, len(task_ids), 500):
+            chunk = task_ids[i:i + 500]
+            marks = ",".join("?" * len(chunk))
+            for row in conn.execute(f"SELECT * FROM task WHERE id IN ({marks})", chunk).fetchall():
+                out[row["id"]] = task_progress.overlay(dict(row))
+        result_ids = list({r["result_id"] for r in out.values() if r.get("result_id")})
+        results = {}
+        for i in range(0, len(result_ids), 500):
+            chunk = result_ids[i:i + 500]
+            marks = ",".join("?" * len(chunk))
+            for res in conn.execute(f"SELECT id, title, duration_seconds FROM result WHERE id IN ({marks})", chunk).fetchall():
+                results[res["id"]] = {"title": res["title"], "duration_seconds": res["duration_seconds"]}
+    for r in out.values():
+        if r.get("result_id") in results:
+            r["result"] = results[r["result_id"]]
         if r.get("progress") is None:
-            r["progress"] = {"extract": 15, "script": 40, "tts": 70, "music_cover": 85, "rss": 95, "done": 100}.get((r.get("stage") or "").lower(), 0)
-        return r
+            r["progress"] = STAGE_PROGRESS.get((r.get("stage") or "").lower(), 0)
+    return out
+
+
+def _get_task_status(task_id: str):
+    return _get_tasks_status([task_id]).get(task_id)
+
+
+def _payload(task_id: str, info: dict, queue_position: Optional[int]) -> dict:
+    status = info.get("status")
+    stage = info.get("stage") or ""
+    progress = info.get("progress")
+    if progress is None:
+        progress = STAGE_PROGRESS.get(stage.lower(), 0)
+    payload = {"task_id": task_id, "status": status, "stage": stage, "progress": progress, "activity_message": info.get("activity_message") or ""}
+    if status == "pending":
+        payload["queue_position"] = queue_position
+    if info.get("error_message"):
+        payload["error_message"] = info["error_message"]
+    if info.get("result"):
+        payload["result"] = info["result"]
+    return payload
+
+
+def _stream_task(ws, task_id: str) -> None:
+    """Обновления одной задачи до её завершения; между событиями шины — ни одного запроса к БД."""
+    last_status = None
+    with progress_bus.subscribe(task_id) as sub:
+        while True:
+            info = _get_task_status(task_id)
+            if not info:
+                ws.send(json.dumps({"error": "task not found"}))
+                return
+            status = info.get("status")
+            position = get_queue_position(info.get("leader_task_id") or task_id) if status == "pending" else None
+            payload = _payload(task_id, info, position)
+            if payload != last_status:
+                ws.send(json.dumps(payload))
+                last_status = payload
+            if status in TERMINAL_STATUSES:
+                return
+            # Пайплайн последователя публикует события по id лидера; позиция в очереди нужна только ожидающей
+            wanted = {info.get("leader_task_id"), progress_bus.QUEUE if status == "pending" else None} - {None}
+            if status != "pending":
+                sub.remove(progress_bus.QUEUE)
+            if wanted - sub.topics:
+                sub.add(*wanted)
+                continue  # событие могло прийти до подписки — перечитать
+            while not sub.wait(IDLE_CHECK_SECONDS):
+                if not ws.connected:
+                    return
+
+
+class _Multiplex:
+    """
+    Соединение с подпиской на много задач. Поток чтения меняет подписки по сообщениям клиента,
+    основной поток ждёт событий шины и отправляет накопленные изменения одним кадром.
+    """
+
+    def __init__(self, ws, sub: progress_bus.Subscription, interval: float):
+        self.ws = ws
+        self.sub = sub
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.send_lock = threading.Lock()
+        self.tasks = set()
+        self.sessions = set()
+        self.followers = {}  # id лидера -> подписанные последователи (события идут по id лидера)
+        self.sent = {}  # task_id -> последнее отправленное состояние
+        self.closed = False
+
+    def send(self, obj: dict) -> None:
+        with self.send_lock:
+            self.ws.send(json.dumps(obj, ensure_ascii=False))
+
+    def handle(self, msg: dict) -> Optional[str]:
+        """Сообщение клиента; возвращает текст ошибки или None."""
+        op = msg.get("op")
+        if op not in ("subscribe", "unsubscribe"):
+            return "op must be subscribe or unsubscribe"
+        ids = msg.get("task_ids") or []
+        if isinstance(ids, str):
+            ids = [ids]
+        if not isinstance(ids, list):
+            return "task_ids must be a list"
+        ids = {str(t).strip() for t in ids if str(t).strip()}
+        session = (msg.get("session_id") or "").strip()
+        topic = progress_bus.session_topic(session) if session else None
+        with self.lock:
+            if op == "subscribe":
+                if len(self.tasks | ids) > WS_MAX_SUBSCRIPTIONS:
+                    return f"too many subscriptions (max {WS_MAX_SUBSCRIPTIONS})"
+                self.tasks |= ids
+                if session:
+                    self.sessions.add(session)
+            else:
+                self.tasks -= ids
+                for task_id in ids:
+                    self.sent.pop(task_id, None)
+                self.sessions.discard(session)
+                # Тема нужна, пока на ней есть подписанные последователи
+                ids = {t for t in ids if not self.followers.get(t, set()) & self.tasks}
+        if op == "subscribe":
+            self.sub.add(*ids, topic)
+            for t in [*ids, topic]:
+                if t:
+                    self.sub.notify(t)  # первое состояние — в ближайшем кадре
+        else:
+            self.sub.remove(*ids, topic)
+        return None
+
+    def read_loop(self) -> None:
+        try:
+            while True:
+                data = self.ws.receive()
+                try:
+                    msg = json.loads(data) if isinstance(data, str) and data.strip() else {}
+                except ValueError:
+                    msg = None
+                error = self.handle(msg) if isinstance(msg, dict) else "invalid JSON"
+                if error:
+                    self.send({"error": error})
+        except ConnectionClosed:
+            pass
+        except Exception as e:
+            logger.warning("ws read error: %s", e)
+        finally:
+            self.closed = True
+            self.sub.notify("closed")
+
+    def run(self) -> None:
+        next_frame = 0.0
+        while not self.closed:
+            changed = self.sub.wait(IDLE_CHECK_SECONDS)
+            if not changed:
+                if not self.ws.connected:
+                    return
+                continue
+            delay = next_frame - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)  # события за интервал уйдут одним кадром
+                changed |= self.sub.wait(0)
+            next_frame = time.monotonic() + self.interval
+            if not self.closed:
+                self.flush(changed)
+
+    def _session_tasks(self, sessions: set) -> set:
+        marks = ",".join("?" * len(sessions))
+        with get_connection(readonly=True) as conn:
+            rows = conn.execute(
+                f"SELECT id FROM task WHERE session_id IN ({marks}) AND status IN ('pending', 'running') ORDER BY created_at",
+                list(sessions),
+            ).fetchall()
+        return {r["id"] for r in rows}
+
+    def flush(self, changed: set) -> None:
+        """Перечитать задачи, затронутые событиями, и отправить изменившиеся."""
+        with self.lock:
+            refresh, sessions = set(), set()
+            for topic in changed:
+                if topic == progress_bus.QUEUE:
+                    refresh |= {t for t, p in self.sent.items() if p.get("status") == "pending"}
+                elif topic.startswith(progress_bus.SESSION_PREFIX):
+                    sessions.add(topic[len(progress_bus.SESSION_PREFIX):])
+                else:
+                    refresh |= ({topic} | self.followers.get(topic, set())) & self.tasks
+            sessions &= self.sessions
+        if sessions:
+            found = self._session_tasks(sessions)
+            with self.lock:
+                found = set(list(found - self.tasks)[:max(0, WS_MAX_SUBSCRIPTIONS - len(self.tasks))])
+                self.tasks |= found
+            self.sub.add(*found)
+            refresh |= found
+        if not refresh:
+            return
+        infos = _get_tasks_status(refresh)
+        pending = [t for t in refresh if infos.get(t, {}).get("status") == "pending"]
+        positions = get_queue_positions({infos[t].get("leader_task_id") or t for t in pending})
+        updates, new_topics = [], []
+        with self.lock:
+            for task_id in sorted(refresh):
+                if task_id not in self.tasks:
+                    continue  # отписались, пока читали
+                info = infos.get(task_id)
+                if info is None:
+                    updates.append({"task_id": task_id, "error": "task not found"})
+                    self.tasks.discard(task_id)
+                    continue
+                payload = _payload(task_id, info, positions.get(info.get("leader_task_id") or task_id))
+                if payload != self.sent.get(task_id):
+                    updates.append(payload)
+                    self.sent[task_id] = payload
+                leader = info.get("leader_task_id")
+                if leader and task_id not in self.followers.get(leader, set()):
+                    self.followers.setdefault(leader, set()).add(task_id)
+                    new_topics.append(leader)
+                if payload["status"] in TERMINAL_STATUSES:
+                    self.tasks.discard(task_id)
+                    self.sent.pop(task_id, None)
+            done = refresh - self.tasks
+            wait_queue = any(p.get("status") == "pending" for p in self.sent.values())
+        self.sub.remove(*[t for t in done if not self.followers.get(t, set()) & self.tasks])
+        if wait_queue and progress_bus.QUEUE not in self.sub.topics:
+            new_topics.append(progress_bus.QUEUE)
+        elif not wait_queue:
+            self.sub.remove(progress_bus.QUEUE)
+        if new_topics:
+            self.sub.add(*new_topics)
+            for task_id in refresh & self.tasks:
+                self.sub.notify(task_id)  # событие могло прийти до подписки — перечитать в следующем кадре
+        if updates:
+            self.send({"type": "batch", "updates": updates})
+
+
+def _stream_many(ws, first: dict) -> None:
+    with progress_bus.subscribe() as sub:
+        mux = _Multiplex(ws, sub, WS_BATCH_INTERVAL_SECONDS)
+        error = mux.handle(first)
+        if error:
+            mux.send({"error": error})
+        reader = threading.Thread(target=mux.read_loop, name="ws-reader", daemon=True)
+        reader.start()
+        mux.run()
 
 
 @sock.route("/ws")
 def progress_ws(ws):
-    """Клиент отправляет {\"task_id\": \"...\"}; сервер шлёт обновления stage/status пока задача не завершена."""
+    """Одна задача ({"task_id": ...}) или подписка на много задач ({"op": "subscribe", ...}) — см. описание модуля."""
     try:
         data = ws.receive()
         msg = json.loads(data) if isinstance(data, str) and data.strip() else {}
+        if msg.get("op"):
+            _stream_many(ws, msg)
+            return
         task_id = (msg.get("task_id") or "").strip()
         if not task_id:
             ws.send(json.dumps({"error": "task_id required"}))
             return
-        last_status = None
-        while True:
-            info = _get_task_status(task_id)
-            if not info:
-                ws.send(json.dumps({"error": "task not found"}))
-                break
-            status = info.get("status")
-            stage = info.get("stage") or ""
-            progress = info.get("progress")
-            if progress is None:
-                progress = {"extract": 15, "script": 40, "tts": 70, "music_cover": 85, "rss": 95, "done": 100}.get(stage.lower(), 0)
-            payload = {"task_id": task_id, "status": status, "stage": stage, "progress": progress, "activity_message": info.get("activity_message") or ""}
-            if info.get("error_message"):
-                payload["error_message"] = info["error_message"]
-            if info.get("result"):
-                payload["result"] = info["result"]
-            if payload != last_status:
-                ws.send(json.dumps(payload))
-                last_status = payload
-            if status in ("completed", "failed", "cancelled"):
-                break
-            time.sleep(0.5)
+        _stream_task(ws, task_id)
     except Exception as e:
         logger.exception("ws error: %s", e)
         try:
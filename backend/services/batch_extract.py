@@ -0,0 +1,156 @@
+"""Пакетное извлечение текста (/api/extract/batch): много URL и файлов одновременно.
+Общий пул потоков, не более EXTRACT_BATCH_PER_HOST одновременных загрузок с одного хоста: лишние URL ждут
+в очереди своего хоста, а не в потоках пула, — загрузки с других сайтов не стоят за ними.
+Результаты отдаются по мере готовности, а не в порядке запроса.
+"""
+import logging
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import Iterator, List, Optional
+from urllib.parse import urlsplit
+
+import requests
+
+from backend.config import MAX_TEXT_LENGTH, EXTRACT_BATCH_WORKERS, EXTRACT_BATCH_PER_HOST
+from backend.services.extraction_cache import extract_file_cached, extract_url_cached
+
+logger = logging.getLogger(__name__)
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+# Загрузки по хостам общие для всех пакетов: параллельные запросы не умножают нагрузку на один сайт.
+# host -> {"active": загрузок в пуле, "waiting": deque ожидающих}; запись удаляется, когда по хосту ничего нет
+_hosts = {}
+_hosts_lock = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=max(1, EXTRACT_BATCH_WORKERS), thread_name_prefix="extract-batch")
+        return _executor
+
+
+def _submit_url(executor: ThreadPoolExecutor, index: int, url: str) -> Future:
+    """Future результата URL; в пул он отправляется, когда у его хоста есть свободный слот."""
+    host = (urlsplit(url).hostname or "").lower()
+    future = Future()
+    with _hosts_lock:
+        state = _hosts.setdefault(host, {"active": 0, "waiting": deque()})
+        if state["active"] >= max(1, EXTRACT_BATCH_PER_HOST):
+            state["waiting"].append((future, index, url))
+            return future
+        state["active"] += 1
+    executor.submit(_run_url, executor, host, future, index, url)
+    return future
+
+
+def _run_url(executor: ThreadPoolExecutor, host: str, future: Future, index: int, url: str) -> None:
+    try:
+        if future.set_running_or_notify_cancel():
+            try:
+                future.set_result(_extract_url(index, url))
+            except Exception as e:
+                future.set_exception(e)
+    finally:
+        _release_host(executor, host)
+
+
+def _release_host(executor: ThreadPoolExecutor, host: str) -> None:
+    """Слот хоста освободился: отправить в пул следующий ожидающий URL (отменённые пропускаются)."""
+    with _hosts_lock:
+        state = _hosts[host]
+        waiting = state["waiting"]
+        while waiting and waiting[0][0].cancelled():
+            waiting.popleft()
+        if waiting:
+            nxt = waiting.popleft()
+        else:
+            nxt = None
+            state["active"] -= 1
+            if not state["active"]:
+                del _hosts[host]
+    if nxt is not None:
+        executor.submit(_run_url, executor, host, *nxt)
+
+
+def _result(index: int, source: str, text: str, phones: list, contacts: list, extraction_id: Optional[str]) -> dict:
+    if len(text) > MAX_TEXT_LENGTH:
+        return {
+            "index": index,
+            "source": source,
+            "error": f"Текст превышает лимит ({MAX_TEXT_LENGTH} символов).",
+            "recommendation": "Сократите исходный материал или разбейте на части.",
+        }
+    removed = {}
+    if phones:
+        removed["phones"] = phones
+    if contacts:
+        removed["contacts"] = contacts
+    return {
+        "index": index,
+        "source": source,
+        "text": text,
+        "length": len(text),
+        "removed": removed,
+        "extraction_id": extraction_id,
+    }
+
+
+def _extract_url(index: int, url: str) -> dict:
+    text, phones, contacts, extraction_id = extract_url_cached(url)
+    return _result(index, url, text, phones, contacts, extraction_id)
+
+
+def _extract_file(index: int, item: dict) -> dict:
+    path = item["path"]
+    try:
+        text, phones, contacts, extraction_id = extract_file_cached(
+            path, max_chars=MAX_TEXT_LENGTH + 1, content_hash=item.get("content_hash"), filename=item["name"],
+        )
+    finally:
+        path.unlink(missing_ok=True)
+    return _result(index, item["name"], text, phones, contacts, extraction_id)
+
+
+def _error(index: int, source: str, e: Exception) -> dict:
+    if isinstance(e, ValueError):
+        error, recommendation = str(e), "Проверьте формат и размер файла или доступность URL."
+    elif isinstance(e, requests.exceptions.RequestException):
+        error, recommendation = "Не удалось загрузить страницу по URL.", "Проверьте URL и доступность сайта."
+    else:
+        logger.exception("batch extract %s", source, exc_info=e)
+        error, recommendation = "Ошибка при извлечении текста.", "Проверьте формат файла или повторите попытку позже."
+    return {"index": index, "source": source, "error": error, "recommendation": recommendation}
+
+
+def iter_batch(items: List[dict]) -> Iterator[dict]:
+    """
+    Запускает извлечение всех элементов и выдаёт результаты по мере готовности.
+    Элемент: {"url": "..."} или {"path": Path, "name": "исходное имя", "content_hash": "..."}; в ответе — index
+    элемента во входном списке. Загруженные файлы удаляются после разбора; при закрытии генератора
+    (клиент отключился) ещё не начатые элементы отменяются.
+    """
+    executor = _get_executor()
+    futures = {}
+    for index, item in enumerate(items):
+        if "url" in item:
+            future = _submit_url(executor, index, item["url"])
+        else:
+            future = executor.submit(_extract_file, index, item)
+        futures[future] = (index, item)
+    try:
+        for future in as_completed(futures):
+            index, item = futures[future]
+            source = item.get("url") or item.get("name")
+            try:
+                yield future.result()
+            except Exception as e:
+                yield _error(index, source, e)
+    finally:
+        for future, (_, item) in futures.items():
+            if future.cancel() and "path" in item:
+                Path(item["path"]).unlink(missing_ok=True)
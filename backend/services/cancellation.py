@@ -0,0 +1,244 @@
+"""Кооперативная отмена задач. У выполняемой задачи есть токен отмены (CancellationToken): пайплайн проверяет
+его между этапами и репликами, а внешние HTTP-вызовы (LLM, TTS, обложка) выполняются через call_abortable —
+при отмене воркер сразу получает TaskCancelled, не дожидаясь ответа API, и освобождается.
+Токен отменяется из API (cancel в этом процессе) или воркером, увидевшим status='cancelled' в БД.
+Тот же механизм ограничивает время: общий срок задачи и бюджет текущего этапа; по истечении токен
+отменяется сторожевым потоком, и ожидание завершается TaskTimedOut.
+"""
+import contextvars
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Как часто ожидающий ответа API поток проверяет отмену, сек
+POLL_SECONDS = 0.2
+
+_tokens: Dict[str, "CancellationToken"] = {}
+_tokens_lock = threading.Lock()
+_current = contextvars.ContextVar("cancellation_token", default=None)
+_watchdog: Optional[threading.Thread] = None
+
+# Потоки для прерываемых HTTP-вызовов: после отмены брошенный вызов дорабатывает здесь, не занимая воркер
+_call_pool = ThreadPoolExecutor(max_workers=32, thread_name_prefix="abortable-call")
+_abandoned = 0  # брошенных вызовов, ещё занимающих поток _call_pool
+_abandoned_lock = threading.Lock()
+
+
+class TaskCancelled(Exception):
+    """Задача отменена пользователем; пайплайн прекращает работу без статуса failed."""
+
+
+class TaskTimedOut(TaskCancelled):
+    """Задача не уложилась в TASK_TIMEOUT_SECONDS или в бюджет этапа; пайплайн помечает её failed."""
+
+    def __init__(self, task_id: str, stage: str, limit: float, total: bool):
+        self.stage = stage
+        if total:
+            message = f"Превышено время выполнения задачи ({limit:g} с) на этапе {stage}"
+        else:
+            message = f"Этап {stage} не уложился в отведённое время ({limit:g} с)"
+        super().__init__(message)
+
+
+class CancellationToken:
+    def __init__(self, task_id: str):
+        self.task_id = task_id
+        self.stage = None
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._clients = set()
+        self._timeout: Optional[TaskTimedOut] = None
+        self._deadline = None  # (момент time.monotonic(), лимит сек) для всей задачи
+        self._stage_deadline = None  # то же для текущего этапа
+
+    def set_deadline(self, seconds: float) -> None:
+        self._deadline = (time.monotonic() + seconds, seconds) if seconds and seconds > 0 else None
+
+    def enter_stage(self, stage: str, budget: Optional[float] = None) -> None:
+        """Начало этапа: бюджет этапа отсчитывается заново (None или 0 — только общий срок задачи)."""
+        self.stage = stage
+        self._stage_deadline = (time.monotonic() + budget, budget) if budget and budget > 0 else None
+
+    def check_deadline(self) -> None:
+        """Отменить токен, если истёк общий срок задачи или бюджет этапа."""
+        if self._event.is_set():
+            return
+        now = time.monotonic()
+        for deadline, total in ((self._deadline, True), (self._stage_deadline, False)):
+            if deadline and now >= deadline[0]:
+                self._timeout = TaskTimedOut(self.task_id, self.stage or "—", deadline[1], total)
+                logger.warning("[cancel] Задача %s: %s", self.task_id, self._timeout)
+                self.cancel()
+                return
+
+    def cancel(self) -> None:
+        """Отменить: взвести флаг и закрыть зарегистрированные HTTP-клиенты (повторные попытки не начнутся)."""
+        with self._lock:
+            if self._event.is_set():
+                return
+            self._event.set()
+            clients = list(self._clients)
+        logger.info("[cancel] Задача %s: отмена, закрываем HTTP-клиентов: %s", self.task_id, len(clients))
+        for client in clients:
+            try:
+                client.close()
+            except Exception as e:
+                logger.debug("[cancel] close %s: %s", client, e)
+
+    def is_cancelled(self) -> bool:
+        self.check_deadline()
+        return self._event.is_set()
+
+    def raise_if_cancelled(self) -> None:
+        """TaskTimedOut — если истекло время, TaskCancelled — если задачу отменили."""
+        if self.is_cancelled():
+            raise self._timeout or TaskCancelled(f"Задача {self.task_id} отменена")
+
+    @contextmanager
+    def register(self, client):
+        """Клиент (httpx.Client, OpenAI), который нужно закрыть при отмене."""
+        with self._lock:
+            cancelled = self._event.is_set()
+            if not cancelled:
+                self._clients.add(client)
+        if cancelled:
+            self.raise_if_cancelled()
+        try:
+            yield client
+        finally:
+            with self._lock:
+                self._clients.discard(client)
+
+
+def _watchdog_loop():
+    """Сторож сроков: отменяет токены задач с истёкшим временем, даже если пайплайн сейчас не проверяет токен."""
+    while True:
+        time.sleep(POLL_SECONDS)
+        with _tokens_lock:
+            tokens = list(_tokens.values())
+        for token in tokens:
+            try:
+                token.check_deadline()
+            except Exception as e:
+                logger.warning("[cancel] watchdog: %s", e)
+
+
+def _ensure_watchdog():
+    global _watchdog
+    with _tokens_lock:
+        if _watchdog is None or not _watchdog.is_alive():
+            _watchdog = threading.Thread(target=_watchdog_loop, name="task-watchdog", daemon=True)
+            _watchdog.start()
+
+
+@contextmanager
+def cancellation_scope(task_id: str, timeout: Optional[float] = None):
+    """Токен отмены задачи на время выполнения пайплайна (доступен через current_token); timeout — общий срок, сек."""
+    token = CancellationToken(task_id)
+    if timeout:
+        token.set_deadline(timeout)
+        _ensure_watchdog()
+    with _tokens_lock:
+        _tokens[task_id] = token
+    ctx_token = _current.set(token)
+    try:
+        yield token
+    finally:
+        _current.reset(ctx_token)
+        with _tokens_lock:
+            if _tokens.get(task_id) is token:
+                del _tokens[task_id]
+
+
+def current_token() -> Optional[CancellationToken]:
+    return _current.get()
+
+
+def cancel(task_id: str) -> bool:
+    """Отменить выполняемую в этом процессе задачу. False — задача здесь не выполняется."""
+    with _tokens_lock:
+        token = _tokens.get(task_id)
+    if token is None:
+        return False
+    token.cancel()
+    return True
+
+
+def running_task_ids() -> list:
+    with _tokens_lock:
+        return list(_tokens)
+
+
+def check_cancelled() -> None:
+    """Точка проверки для пайплайна: TaskCancelled, если текущая задача отменена (TaskTimedOut — истекло время)."""
+    token = _current.get()
+    if token is not None:
+        token.raise_if_cancelled()
+
+
+def enter_stage(stage: str, budget: Optional[float] = None) -> None:
+    """Начало этапа текущей задачи с бюджетом budget сек."""
+    token = _current.get()
+    if token is not None:
+        token.enter_stage(stage, budget)
+        token.raise_if_cancelled()
+
+
+@contextmanager
+def abortable_client(client):
+    """Зарегистрировать клиента у токена текущей задачи (вне задачи — без изменений)."""
+    token = _current.get()
+    if token is None:
+        yield client
+        return
+    with token.register(client):
+        yield client
+
+
+def call_abortable(fn, *args, **kwargs):
+    """
+    Выполнить блокирующий вызов (HTTP-запрос) с возможностью прервать ожидание при отмене задачи.
+    Вне задачи — обычный вызов. Вызов идёт в отдельном потоке с копией контекста (учёт api_call, токен);
+    при отмене ожидание прекращается сразу, ответ брошенного вызова отбрасывается.
+    """
+    token = _current.get()
+    if token is None:
+        return fn(*args, **kwargs)
+    token.raise_if_cancelled()
+    ctx = contextvars.copy_context()
+    future = _call_pool.submit(ctx.run, fn, *args, **kwargs)
+    while True:
+        done, _ = wait([future], timeout=POLL_SECONDS)
+        if done:
+            return future.result()
+        if token.is_cancelled():
+            if not future.cancel():
+                _track_abandoned(future)
+            token.raise_if_cancelled()
+
+
+def _track_abandoned(future) -> None:
+    """Учёт брошенного вызова до его завершения: зависший API не должен незаметно съедать потоки _call_pool."""
+    global _abandoned
+    with _abandoned_lock:
+        _abandoned += 1
+        count = _abandoned
+    logger.warning("[cancel] Брошенный вызов API дорабатывает в фоне (всего таких: %s)", count)
+
+    def _released(_):
+        global _abandoned
+        with _abandoned_lock:
+            _abandoned -= 1
+
+    future.add_done_callback(_released)
+
+
+def abandoned_calls() -> int:
+    """Сколько брошенных при отмене вызовов API ещё выполняется."""
+    with _abandoned_lock:
+        return _abandoned
@@ -0,0 +1,81 @@
+"""Контрольные точки пайплайна в каталоге задачи (STORAGE_PATH/<task_id>).
+Результат каждого этапа (текст, сценарий, голосовая дорожка, обложка) сохраняется в файл и отмечается
+в checkpoints.json; повтор задачи (POST /api/tasks/<id>/retry) пропускает отмеченные этапы.
+Файл этапа записывается целиком до отметки — оборванная запись при падении не считается готовой.
+"""
+import json
+import os
+import tempfile
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Optional, Union
+
+MANIFEST = "checkpoints.json"
+# Этапы в порядке выполнения и их файлы
+STAGE_FILES = {
+    "extract": "text.txt",
+    "script": "script.json",
+    "tts": "voice.mp3",
+    "cover": "cover.jpg",
+}
+
+
+# Манифест обновляется чтением-изменением-записью: отметки этапов (поток пайплайна, io-пул) — по очереди
+_manifest_lock = threading.Lock()
+
+
+def _write_atomic(path: Path, data: Union[bytes, str]) -> None:
+    """Запись через уникальный временный файл рядом с path и os.replace."""
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=path.name + ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data.encode("utf-8") if isinstance(data, str) else data)
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+
+
+def load_checkpoints(task_dir: Path) -> dict:
+    """Отметки готовых этапов: {stage: {"file", "saved_at"}}. Нет манифеста или он повреждён — пусто."""
+    try:
+        data = json.loads((task_dir / MANIFEST).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+def save_checkpoint(task_dir: Path, stage: str, data: Union[bytes, str, None] = None) -> Path:
+    """
+    Отметить этап готовым. data — содержимое файла этапа; None — файл уже записан
+    (голосовую дорожку пишет generate_podcast_audio). Возвращает путь к файлу этапа.
+    """
+    task_dir.mkdir(parents=True, exist_ok=True)
+    path = task_dir / STAGE_FILES[stage]
+    if data is not None:
+        _write_atomic(path, data)
+    with _manifest_lock:
+        manifest = load_checkpoints(task_dir)
+        manifest[stage] = {"file": path.name, "saved_at": datetime.utcnow().isoformat()}
+        _write_atomic(task_dir / MANIFEST, json.dumps(manifest, ensure_ascii=False))
+    return path
+
+
+def checkpoint_path(task_dir: Path, stage: str) -> Optional[Path]:
+    """Файл готового этапа или None, если этап не отмечен или файл пропал."""
+    if stage not in load_checkpoints(task_dir):
+        return None
+    path = task_dir / STAGE_FILES[stage]
+    return path if path.exists() else None
+
+
+def first_incomplete_stage(task_dir: Path) -> Optional[str]:
+    """Этап, с которого продолжится задача; None — все этапы с контрольными точками готовы (осталась сборка)."""
+    for stage in STAGE_FILES:
+        if checkpoint_path(task_dir, stage) is None:
+            return stage
+    return None
@@ -8,9 +8,10 @@ from backend.config import (
     FILE_RETENTION_DAYS,
     TASK_METADATA_DAYS,
     LOG_RETENTION_DAYS,
-    BASE_DIR,
+    LOG_DIR,
 )
 from backend.database import get_connection
+from backend.services.http_fetch import HTTP_CACHE_DIR, purge_http_cache
 
 logger = logging.getLogger(__name__)
 
@@ -25,10 +26,10 @@ def run_retention_cleanup() -> dict:
     meta_cutoff = datetime.utcnow() - timedelta(days=TASK_METADATA_DAYS)
     log_cutoff = datetime.utcnow() - timedelta(days=LOG_RETENTION_DAYS)
 
-    # 1. Удалить каталоги задач в storage старше FILE_RETENTION_DAYS
+    # 1. Удалить каталоги задач в storage старше FILE_RETENTION_DAYS (HTTP-кэш чистится отдельно, шаг 3)
     if STORAGE_PATH.exists():
         for p in STORAGE_PATH.iterdir():
-            if not p.is_dir():
+            if not p.is_dir() or p == HTTP_CACHE_DIR:
                 continue
             try:
                 mtime = datetime.fromtimestamp(p.stat().st_mtime)
@@ -54,14 +55,35 @@ def run_retention_cleanup() -> dict:
         for row in old_tasks:
             try:
                 if row["result_id"]:
-                    conn.execute("DELETE FROM result WHERE id = ?", (row["result_id"],))
+                    # Результат общий с объединёнными задачами — удаляется вместе с последней из них
+                    conn.execute(
+                        "DELETE FROM result WHERE id = ? AND NOT EXISTS (SELECT 1 FROM task WHERE result_id = ? AND id <> ?)",
+                        (row["result_id"], row["result_id"], row["id"]),
+                    )
+                conn.execute("DELETE FROM api_call WHERE task_id = ?", (row["id"],))
+                conn.execute("DELETE FROM queue_item WHERE task_id = ?", (row["id"],))
                 conn.execute("DELETE FROM task WHERE id = ?", (row["id"],))
                 stats["task_records"] += 1
             except Exception as e:
                 logger.warning("[cleanup] Удаление записи task %s: %s", row["id"], e)
+        # Вызовы вне задач (превью голосов, /api/script)
+        conn.execute("DELETE FROM api_call WHERE task_id IS NULL AND created_at < ?", (meta_cutoff.isoformat(),))
+        # Замеры этапов для прогноза ETA: модели нужны только свежие
+        conn.execute("DELETE FROM stage_timing WHERE created_at < ?", (meta_cutoff.isoformat(),))
 
-    # 3. Удалить старые логи (файлы в logs/ старше LOG_RETENTION_DAYS)
-    log_dir = BASE_DIR / "logs"
+    # 3. Кэш извлечения текста (EXTRACTION_CACHE_TTL_HOURS) и HTTP-кэш страниц (HTTP_CACHE_MAX_AGE_DAYS, HTTP_CACHE_MAX_MB)
+    try:
+        from backend.services.extraction_cache import purge_expired
+        stats["extractions"] = purge_expired()
+    except Exception as e:
+        logger.warning("[cleanup] Очистка кэша извлечения: %s", e)
+    try:
+        stats["http_cache"] = purge_http_cache()
+    except OSError as e:
+        logger.warning("[cleanup] Очистка HTTP-кэша: %s", e)
+
+    # 4. Удалить старые логи (файлы в LOG_PATH старше LOG_RETENTION_DAYS)
+    log_dir = LOG_DIR
     if log_dir.exists():
         for p in log_dir.iterdir():
             if p.is_file():
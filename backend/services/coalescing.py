@@ -0,0 +1,76 @@
+"""Объединение одинаковых задач. Отпечаток задачи — хеш содержимого источника и параметров генерации.
+Новая задача с отпечатком выполняемой становится её последователем (task.leader_task_id): пайплайн лидера
+обновляет и её статус/прогресс, результат общий. Совпадение с недавно завершённой задачей отвечается сразу.
+"""
+import hashlib
+import json
+from datetime import datetime, timedelta
+from typing import Optional
+
+from backend.config import COALESCE_RESULT_TTL_SECONDS
+
+# Параметры, от которых зависит результат (priority, base_url запроса и т.п. не влияют)
+GENERATION_PARAMS = (
+    "format", "style", "duration", "presentation", "voice_map", "voice_speed",
+    "music_id", "music_volume_db", "title", "description", "cover_prompt",
+)
+
+
+def _source_key(params: dict, extraction: Optional[dict]) -> Optional[str]:
+    if extraction:
+        return "text:" + hashlib.sha256(extraction["text"].encode("utf-8")).hexdigest()
+    if params.get("source") == "file" and params.get("content_hash"):
+        return "file:" + params["content_hash"]
+    # Страница по url загружается при создании задачи (источник становится extraction); по одному адресу
+    # не объединяем — содержимое могло измениться
+    return None
+
+
+def task_fingerprint(params: dict, extraction: Optional[dict] = None) -> Optional[str]:
+    """Отпечаток задачи или None, если источник не удаётся однозначно определить."""
+    source = _source_key(params, extraction)
+    if source is None:
+        return None
+    gen = {}
+    for key in GENERATION_PARAMS:
+        value = params.get(key)
+        if key in ("voice_speed", "music_volume_db") and value is not None:
+            try:
+                value = float(value)
+            except (TypeError, ValueError):
+                pass
+        gen[key] = value
+    payload = json.dumps({"source": source, "params": gen}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def find_leader(conn, fingerprint: str) -> Optional[dict]:
+    """
+    Задача, к которой можно присоединиться: выполняемая (pending/running) лидер с тем же отпечатком,
+    иначе завершённая не раньше COALESCE_RESULT_TTL_SECONDS назад. Вызывать внутри транзакции создания задачи.
+    """
+    row = conn.execute(
+        """SELECT * FROM task WHERE fingerprint = ? AND status IN ('pending', 'running') AND leader_task_id IS NULL
+           ORDER BY created_at LIMIT 1""",
+        (fingerprint,),
+    ).fetchone()
+    if row:
+        return dict(row)
+    if COALESCE_RESULT_TTL_SECONDS <= 0:
+        return None
+    since = (datetime.utcnow() - timedelta(seconds=COALESCE_RESULT_TTL_SECONDS)).isoformat()
+    row = conn.execute(
+        """SELECT t.* FROM task t JOIN result r ON r.id = t.result_id
+           WHERE t.fingerprint = ? AND t.status = 'completed' AND r.created_at >= ?
+           ORDER BY r.created_at DESC LIMIT 1""",
+        (fingerprint, since),
+    ).fetchone()
+    return dict(row) if row else None
+
+
+def live_followers(conn, task_id: str) -> int:
+    """Число ожидающих результата последователей задачи."""
+    row = conn.execute(
+        "SELECT COUNT(*) AS n FROM task WHERE leader_task_id = ? AND status IN ('pending', 'running')", (task_id,),
+    ).fetchone()
+    return row["n"]
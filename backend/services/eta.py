@@ -0,0 +1,148 @@
+"""Прогноз длительности задач. Пайплайн записывает фактическое время этапов (таблица stage_timing) вместе
+с признаками задачи: длина текста, число реплик, доля реплик из кэша TTS. По каждому этапу — линейная модель
+«секунды = a + b·x» (x — главный признак этапа), взвешенная в пользу свежих замеров. Модель пересчитывается,
+как только в таблице появляется новый замер (в т.ч. от воркера другого процесса).
+"""
+import json
+import logging
+import threading
+import time
+from datetime import datetime
+from typing import Optional
+
+from backend.config import MAX_TEXT_LENGTH
+from backend.database import get_connection
+from backend.services.scheduling import DEFAULT_DURATION_MINUTES, DURATION_MINUTES
+
+logger = logging.getLogger(__name__)
+
+STAGE_ORDER = ("extract", "script", "tts", "music_cover", "rss")
+# Модель без истории: (a, b) по этапам
+DEFAULT_COEFS = {
+    "extract": (2.0, 0.1),
+    "script": (10.0, 1.5),
+    "tts": (1.0, 2.0),
+    "music_cover": (3.0, 0.3),
+    "rss": (1.0, 0.0),
+}
+DEFAULT_REPLICAS_PER_MINUTE = 6.0
+# Замеров на этап для подгонки и затухание веса с возрастом замера
+HISTORY_SIZE = 200
+DECAY = 0.98
+
+_model = {"version": None, "coefs": dict(DEFAULT_COEFS), "replicas_per_minute": DEFAULT_REPLICAS_PER_MINUTE}
+_model_lock = threading.Lock()
+
+
+def stage_x(stage: str, features: dict) -> float:
+    """Главный признак этапа: от чего в основном зависит его длительность."""
+    if stage == "extract":
+        return features["text_length"] / 1000
+    if stage == "tts":
+        return features["replicas"] * (1 - features["cache_hit_ratio"])
+    if stage in ("script", "music_cover"):
+        return features["replicas"]
+    return 1.0
+
+
+def record_stage(task_id: str, stage: str, seconds: float, features: dict) -> None:
+    """Замер выполненного этапа (этапы, восстановленные из контрольных точек, не записываются)."""
+    try:
+        with get_connection() as conn:
+            conn.execute(
+                """INSERT INTO stage_timing (task_id, stage, seconds, text_length, replicas, cache_hit_ratio, duration_minutes, created_at)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+                (task_id, stage, round(seconds, 3), features.get("text_length"), features.get("replicas"),
+                 features.get("cache_hit_ratio"), features.get("duration_minutes"), datetime.utcnow().isoformat()),
+            )
+    except Exception as e:
+        logger.warning("[eta] Замер этапа %s задачи %s не записан: %s", stage, task_id, e)
+
+
+def _fit(samples: list, default: tuple) -> tuple:
+    """Взвешенный МНК для y = a + b·x; samples — (x, y) от новых к старым. Коэффициенты не отрицательные."""
+    w_sum = sx = sy = sxx = sxy = 0.0
+    for age, (x, y) in enumerate(samples):
+        w = DECAY ** age
+        w_sum += w
+        sx += w * x
+        sy += w * y
+        sxx += w * x * x
+        sxy += w * x * y
+    if not w_sum:
+        return default
+    mean_x, mean_y = sx / w_sum, sy / w_sum
+    denom = w_sum * sxx - sx * sx
+    if len(samples) >= 3 and denom > 1e-9:
+        b = max(0.0, (w_sum * sxy - sx * sy) / denom)
+    else:
+        b = default[1]  # мало замеров или одинаковый x — наклон по умолчанию, сдвиг по данным
+    return max(0.0, mean_y - b * mean_x), b
+
+
+def get_model() -> dict:
+    """Текущая модель; пересчёт, если с прошлого раза добавились замеры."""
+    with get_connection(readonly=True) as conn:
+        version = conn.execute("SELECT MAX(id) AS v FROM stage_timing").fetchone()["v"]
+        with _model_lock:
+            if version == _model["version"]:
+                return dict(_model)
+        coefs = {}
+        for stage in STAGE_ORDER:
+            rows = conn.execute(
+                """SELECT seconds, text_length, replicas, cache_hit_ratio FROM stage_timing WHERE stage = ?
+                   ORDER BY id DESC LIMIT ?""",
+                (stage, HISTORY_SIZE),
+            ).fetchall()
+            samples = [
+                (stage_x(stage, {"text_length": r["text_length"] or 0, "replicas": r["replicas"] or 0,
+                                 "cache_hit_ratio": r["cache_hit_ratio"] or 0.0}), r["seconds"])
+                for r in rows
+            ]
+            coefs[stage] = _fit(samples, DEFAULT_COEFS[stage])
+        row = conn.execute(
+            """SELECT SUM(replicas) AS r, SUM(duration_minutes) AS m FROM
+               (SELECT replicas, duration_minutes FROM stage_timing WHERE stage = 'script' AND replicas > 0
+                AND duration_minutes > 0 ORDER BY id DESC LIMIT ?)""",
+            (HISTORY_SIZE,),
+        ).fetchone()
+    rpm = row["r"] / row["m"] if row["m"] else DEFAULT_REPLICAS_PER_MINUTE
+    with _model_lock:
+        _model.update(version=version, coefs=coefs, replicas_per_minute=rpm)
+        return dict(_model)
+
+
+def task_features(params: dict, known: Optional[dict] = None, model: Optional[dict] = None) -> dict:
+    """Признаки задачи: известные по ходу выполнения (features_json задачи) или оценки по параметрам."""
+    known = known or {}
+    model = model or _model
+    duration_minutes = DURATION_MINUTES.get(str(params.get("duration") or "standard").lower(), DEFAULT_DURATION_MINUTES)
+    return {
+        "text_length": known.get("text_length", MAX_TEXT_LENGTH // 2),
+        "duration_minutes": duration_minutes,
+        "replicas": known.get("replicas", round(duration_minutes * model["replicas_per_minute"])),
+        "cache_hit_ratio": known.get("cache_hit_ratio", 0.0),
+    }
+
+
+def predict_stage(stage: str, features: dict, model: dict) -> float:
+    a, b = model["coefs"].get(stage, DEFAULT_COEFS[stage])
+    return a + b * stage_x(stage, features)
+
+
+def remaining_seconds(task: dict, now: float, model: dict) -> float:
+    """Оставшееся время задачи: ожидающая — все этапы; выполняемая — остаток текущего этапа и следующие."""
+    params = json.loads(task.get("params_json") or "{}")
+    known = json.loads(task.get("features_json") or "{}")
+    features = task_features(params, known, model)
+    stage = (task.get("stage") or "").lower()
+    if task.get("status") != "running" or stage not in STAGE_ORDER:
+        return sum(predict_stage(s, features, model) for s in STAGE_ORDER)
+    idx = STAGE_ORDER.index(stage)
+    elapsed = now - (task.get("stage_started_at") or now)
+    current = max(0.0, predict_stage(stage, features, model) - elapsed)
+    return current + sum(predict_stage(s, features, model) for s in STAGE_ORDER[idx + 1:])
+
+
+def iso_at(seconds_from_now: float, now: Optional[float] = None) -> str:
+    return datetime.utcfromtimestamp((now or time.time()) + seconds_from_now).isoformat()
@@ -0,0 +1,166 @@
+"""Общие пулы исполнения этапов задач.
+io — потоки для сетевых вызовов (реплики TTS, обложка): ожидание ответа API не держит воркер очереди.
+cpu — процессы по числу ядер для тяжёлых вычислений (декодирование/кодирование аудио pydub, разбор PDF):
+GIL не мешает, и пока одна задача сводит аудио, другие воркеры заняты своими сетевыми этапами.
+Вычисление, брошенное при отмене или по истечении времени, не должно навсегда занимать процесс: пул процессов
+пересоздаётся (его процессы и их ffmpeg завершаются), вычисления других задач перезапускаются в новом пуле.
+"""
+import contextvars
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional
+
+from backend.config import CPU_WORKERS, IO_WORKERS
+from backend.services.cancellation import abandoned_calls, current_token
+
+logger = logging.getLogger(__name__)
+
+# Как часто ожидающий результата CPU-задачи поток проверяет отмену, сек
+POLL_SECONDS = 0.2
+# Сколько раз вычисление перезапускается, если его пул пересоздали из-за брошенного вычисления другой задачи
+RECYCLE_RETRIES = 2
+
+_io_pool: Optional[ThreadPoolExecutor] = None
+_cpu_pool: Optional[ProcessPoolExecutor] = None
+_lock = threading.Lock()
+# Брошенная работа для /api/status: пересозданные пулы процессов и ещё не завершившиеся вызовы в io-пуле
+_stats = {"cpu_pool_recycled": 0, "io_abandoned": 0}
+
+
+def io_pool() -> ThreadPoolExecutor:
+    global _io_pool
+    with _lock:
+        if _io_pool is None:
+            _io_pool = ThreadPoolExecutor(max_workers=max(1, IO_WORKERS), thread_name_prefix="io")
+        return _io_pool
+
+
+def cpu_pool() -> Optional[ProcessPoolExecutor]:
+    """Пул процессов; None при CPU_WORKERS < 1 (тяжёлые операции выполняются в вызывающем потоке)."""
+    global _cpu_pool
+    if CPU_WORKERS < 1:
+        return None
+    with _lock:
+        if _cpu_pool is None:
+            # spawn: воркер веб-сервера многопоточный (и может работать под gevent), fork небезопасен
+            _cpu_pool = ProcessPoolExecutor(max_workers=CPU_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        return _cpu_pool
+
+
+def _recycle_cpu_pool(pool: ProcessPoolExecutor) -> None:
+    """
+    Завершить процессы пула с брошенным вычислением; следующий cpu_pool() создаст новый.
+    Ожидающие результата вычисления других задач получат BrokenProcessPool и перезапустятся (CpuCall.result).
+    """
+    global _cpu_pool
+    with _lock:
+        if _cpu_pool is not pool:
+            return  # уже пересоздан
+        _cpu_pool = None
+        _stats["cpu_pool_recycled"] += 1
+    processes = list((getattr(pool, "_processes", None) or {}).values())
+    logger.warning("[executors] Брошенное вычисление: пул процессов пересоздаётся, завершаем процессов: %s", len(processes))
+    for process in processes:
+        try:
+            process.kill()  # pipe к ffmpeg закрывается вместе с процессом — ffmpeg завершается сам
+        except Exception as e:
+            logger.debug("[executors] kill %s: %s", process, e)
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+class CpuCall:
+    """Вычисление в пуле процессов (submit_cpu); result() перезапускает его, если пул пересоздали."""
+
+    def __init__(self, fn, args):
+        self.fn = fn
+        self.args = args
+        self._submit()
+
+    def _submit(self) -> None:
+        self.pool = cpu_pool()
+        self.future = self.pool.submit(self.fn, *self.args)
+
+    def cancel(self) -> bool:
+        return self.future.cancel()
+
+    def result(self):
+        for attempt in range(RECYCLE_RETRIES + 1):
+            try:
+                return wait_result(self.future, self.pool)
+            except BrokenProcessPool:
+                with _lock:
+                    recycled = _cpu_pool is not self.pool
+                if not recycled or attempt == RECYCLE_RETRIES:
+                    raise
+                token = current_token()
+                if token is not None:
+                    token.raise_if_cancelled()
+                logger.info("[executors] Пул процессов пересоздан — вычисление %s запускается заново", getattr(self.fn, "__name__", self.fn))
+                self._submit()
+
+
+def submit_cpu(fn, *args) -> CpuCall:
+    """Запуск fn(*args) в пуле процессов (пул должен быть, см. cpu_pool); fn и аргументы сериализуются pickle."""
+    return CpuCall(fn, args)
+
+
+def submit_io(fn, *args, **kwargs) -> Future:
+    """Запуск в io-пуле с копией контекста: учёт api_call по задаче и токен отмены работают и в потоке пула."""
+    ctx = contextvars.copy_context()
+    return io_pool().submit(ctx.run, fn, *args, **kwargs)
+
+
+def run_cpu(fn, *args):
+    """
+    Выполнить fn(*args) в пуле процессов и дождаться результата (fn и аргументы должны сериализоваться pickle).
+    При отмене задачи или истечении её времени ожидание прекращается сразу (TaskCancelled / TaskTimedOut),
+    а начатое вычисление прерывается пересозданием пула (_recycle_cpu_pool).
+    """
+    if cpu_pool() is None:
+        return fn(*args)
+    return submit_cpu(fn, *args).result()
+
+
+def wait_result(future: Future, pool: Optional[ProcessPoolExecutor] = None):
+    """
+    Результат future с проверкой токена текущей задачи каждые POLL_SECONDS. pool — пул процессов future:
+    при отмене уже начатое вычисление прерывается его пересозданием; брошенный вызов io-пула учитывается
+    в get_stats, пока не завершится.
+    """
+    token = current_token()
+    if token is None:
+        return future.result()
+    while True:
+        done, _ = wait([future], timeout=POLL_SECONDS)
+        if done:
+            return future.result()
+        if token.is_cancelled():
+            if not future.cancel():
+                _abandon(future, pool)
+            token.raise_if_cancelled()
+
+
+def _abandon(future: Future, pool: Optional[ProcessPoolExecutor]) -> None:
+    if pool is not None:
+        _recycle_cpu_pool(pool)
+        return
+    with _lock:
+        _stats["io_abandoned"] += 1
+    logger.warning("[executors] Брошенный вызов занимает поток io-пула до завершения")
+
+    def _released(_):
+        with _lock:
+            _stats["io_abandoned"] -= 1
+
+    future.add_done_callback(_released)
+
+
+def get_stats() -> dict:
+    """Брошенная при отмене работа: пересозданий пула процессов, занятых потоков io-пула и прерываемых вызовов API."""
+    with _lock:
+        out = dict(_stats)
+    out["calls_abandoned"] = abandoned_calls()
+    return out
@@ -0,0 +1,141 @@
+"""Кэш результатов извлечения текста.
+Ключ — хеш содержимого файла или нормализованный URL + хеш тела страницы. /api/extract возвращает extraction_id,
+/api/tasks принимает его — пайплайн не извлекает текст повторно и файл не загружается второй раз.
+"""
+import hashlib
+import json
+import logging
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Optional
+
+from backend.config import EXTRACTION_CACHE_TTL_HOURS
+from backend.database import get_connection
+from backend.services.http_fetch import fetch_url, normalize_url
+from backend.services.text_extraction import extract_from_pdf, extract_from_docx, extract_from_html
+
+logger = logging.getLogger(__name__)
+
+_HASH_CHUNK = 1024 * 1024
+
+
+def file_content_hash(path: Path) -> str:
+    """SHA-256 содержимого файла (hex)."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(_HASH_CHUNK), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def file_key(content_hash: str) -> str:
+    return f"file:{content_hash}"
+
+
+def url_key(url: str, content_hash: str) -> str:
+    """Ключ страницы: нормализованный URL + хеш тела (после 304 — тот же хеш из HTTP-кэша)."""
+    return "url:" + hashlib.sha256(f"{normalize_url(url)}|{content_hash}".encode("utf-8")).hexdigest()
+
+
+def _cutoff() -> str:
+    return (datetime.utcnow() - timedelta(hours=EXTRACTION_CACHE_TTL_HOURS)).isoformat()
+
+
+def _row_to_result(row) -> dict:
+    removed = json.loads(row["removed_json"] or "{}")
+    return {
+        "extraction_id": row["id"],
+        "content_key": row["content_key"],
+        "source": row["source"],
+        "source_ref": row["source_ref"],
+        "text": row["text"],
+        "phones": removed.get("phones") or [],
+        "contacts": removed.get("contacts") or [],
+    }
+
+
+def lookup(content_key: str) -> Optional[dict]:
+    """Результат по ключу содержимого, если не старше EXTRACTION_CACHE_TTL_HOURS."""
+    with get_connection() as conn:
+        row = conn.execute(
+            "SELECT * FROM extraction WHERE content_key = ? AND created_at >= ?",
+            (content_key, _cutoff()),
+        ).fetchone()
+    return _row_to_result(row) if row else None
+
+
+def get_extraction(extraction_id: str) -> Optional[dict]:
+    """Результат по extraction_id (None — не найден или истёк срок хранения)."""
+    if not extraction_id:
+        return None
+    with get_connection() as conn:
+        row = conn.execute(
+            "SELECT * FROM extraction WHERE id = ? AND created_at >= ?",
+            (extraction_id, _cutoff()),
+        ).fetchone()
+    return _row_to_result(row) if row else None
+
+
+def store(content_key: str, source: str, source_ref: str, text: str, phones: list, contacts: list) -> str:
+    """Сохранить результат; при повторе ключа запись обновляется с прежним extraction_id."""
+    removed_json = json.dumps({"phones": phones or [], "contacts": contacts or []}, ensure_ascii=False)
+    with get_connection() as conn:
+        conn.execute(
+            """INSERT INTO extraction (id, content_key, source, source_ref, text, removed_json, created_at)
+               VALUES (?, ?, ?, ?, ?, ?, ?)
+               ON CONFLICT(content_key) DO UPDATE SET
+                   source = excluded.source, source_ref = excluded.source_ref, text = excluded.text,
+                   removed_json = excluded.removed_json, created_at = excluded.created_at""",
+            (str(uuid.uuid4()), content_key, source, source_ref, text, removed_json, datetime.utcnow().isoformat()),
+        )
+        row = conn.execute("SELECT id FROM extraction WHERE content_key = ?", (content_key,)).fetchone()
+    return row["id"]
+
+
+def _extract_cached(content_key: str, source: str, source_ref: str, extract, truncated_at: Optional[int] = None):
+    hit = lookup(content_key)
+    if hit:
+        logger.info("[extraction_cache] Попадание в кэш: %s", source_ref)
+        return hit["text"], hit["phones"], hit["contacts"], hit["extraction_id"]
+    text, phones, contacts = extract()
+    # Текст, обрезанный ранней остановкой, не кэшируем: другому вызывающему может понадобиться больше
+    if truncated_at is not None and len(text) >= truncated_at:
+        return text, phones, contacts, None
+    extraction_id = store(content_key, source, source_ref, text, phones, contacts)
+    return text, phones, contacts, extraction_id
+
+
+def extract_file_cached(
+    path: Path, max_chars: Optional[int] = None, content_hash: Optional[str] = None, filename: Optional[str] = None,
+):
+    """
+    Извлечение из PDF/DOCX через кэш. Возвращает (текст, телефоны, контакты, extraction_id).
+    max_chars — ранняя остановка для PDF; обрезанный текст не сохраняется (extraction_id = None).
+    content_hash — SHA-256, посчитанный при приёме загрузки (файл не перечитывается); filename — исходное имя.
+    """
+    content_hash = content_hash or file_content_hash(path)
+    ref = filename or path.name
+    if path.suffix.lower() == ".pdf":
+        extract = lambda: extract_from_pdf(path, max_chars=max_chars)  # noqa: E731
+        return _extract_cached(file_key(content_hash), "file", ref, extract, truncated_at=max_chars)
+    return _extract_cached(file_key(content_hash), "file", ref, lambda: extract_from_docx(path))
+
+
+def extract_url_cached(url: str):
+    """
+    Извлечение по URL через кэш. Возвращает (текст, телефоны, контакты, extraction_id).
+    Страница перепроверяется условным GET: не изменилась — ни загрузки тела, ни повторного разбора.
+    """
+    page = fetch_url(url)
+    return _extract_cached(
+        url_key(url, page.content_hash), "url", normalize_url(url),
+        lambda: extract_from_html(page.content, page.encoding),
+    )
+
+
+def purge_expired() -> int:
+    """Удалить записи старше EXTRACTION_CACHE_TTL_HOURS. Возвращает число удалённых."""
+    with get_connection() as conn:
+        cur = conn.execute("DELETE FROM extraction WHERE created_at < ?", (_cutoff(),))
+        return cur.rowcount
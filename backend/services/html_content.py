@@ -0,0 +1,167 @@
+"""Быстрое извлечение основного текста статьи из HTML: разбор lxml без BeautifulSoup,
+удаление служебных блоков и выбор контейнера статьи по плотности текста (в духе Readability).
+Меню, сайдбары, комментарии и прочее не попадают в промпт LLM.
+"""
+import re
+from typing import Optional
+
+import lxml.html
+from bs4.dammit import UnicodeDammit
+from lxml import etree
+
+# Теги, которые никогда не содержат текст статьи
+NOISE_TAGS = (
+    "script", "style", "noscript", "template", "svg", "canvas", "iframe", "object", "embed",
+    "nav", "footer", "header", "aside", "form", "button", "select", "input", "textarea", "dialog",
+)
+# Блоки: на их границах — перенос строки
+BLOCK_TAGS = {
+    "p", "div", "section", "article", "main", "li", "ul", "ol", "dl", "dt", "dd", "table", "tr", "td", "th",
+    "blockquote", "pre", "h1", "h2", "h3", "h4", "h5", "h6", "figure", "figcaption", "br", "hr",
+}
+# Абзацы, по которым набираются очки контейнеров
+PARAGRAPH_TAGS = ("p", "pre", "td", "blockquote", "li")
+
+_UNLIKELY = re.compile(
+    r"comment|sidebar|footer|menu|share|social|related|recommend|advert|promo|banner|cookie|"
+    r"breadcrumb|popup|modal|subscribe|newsletter|widget|sponsor|pager|pagination|disqus|rating",
+    re.IGNORECASE,
+)
+_MAYBE = re.compile(r"article|content|main|post|entry|story|text|body|column", re.IGNORECASE)
+_POSITIVE = re.compile(r"article|content|main|post|entry|story|text|body", re.IGNORECASE)
+_NEGATIVE = _UNLIKELY
+
+_XML_DECLARATION = re.compile(r"^\s*<\?xml[^>]*\?>")
+
+MIN_PARAGRAPH_CHARS = 25
+# Если у лучшего контейнера меньше текста — страница не похожа на статью, берём весь body
+MIN_MAIN_TEXT_CHARS = 250
+
+
+def _class_id(el) -> str:
+    return f"{el.get('class') or ''} {el.get('id') or ''}"
+
+
+def _text_len(el) -> int:
+    return len(" ".join(el.text_content().split()))
+
+
+def _link_density(el) -> float:
+    total = _text_len(el)
+    if not total:
+        return 1.0
+    links = sum(_text_len(a) for a in el.iter("a"))
+    return min(1.0, links / total)
+
+
+def _strip_noise(root) -> None:
+    """
+    Удалить служебные теги и блоки с «неподходящими» class/id. Блок, в котором больше половины текста body,
+    не удаляется: обёртки вида «site has-sidebar» содержат саму статью.
+    """
+    etree.strip_elements(root, etree.Comment, etree.ProcessingInstruction, *NOISE_TAGS, with_tail=False)
+    total = _text_len(root)
+    doomed = []
+    for el in root.iter(etree.Element):
+        if el.tag in ("html", "body", "article", "main"):
+            continue
+        marker = _class_id(el)
+        if marker.strip() and _UNLIKELY.search(marker) and not _MAYBE.search(marker):
+            doomed.append(el)
+    for el in doomed:
+        if el.getparent() is not None and _text_len(el) * 2 <= total:
+            el.drop_tree()
+
+
+def _class_weight(el) -> float:
+    marker = _class_id(el)
+    if not marker.strip():
+        return 0.0
+    weight = 0.0
+    if _POSITIVE.search(marker):
+        weight += 25
+    if _NEGATIVE.search(marker):
+        weight -= 25
+    return weight
+
+
+def _best_candidate(root):
+    scores = {}
+    for para in root.iter(*PARAGRAPH_TAGS):
+        text = " ".join(para.text_content().split())
+        if len(text) < MIN_PARAGRAPH_CHARS:
+            continue
+        parent = para.getparent()
+        if parent is None:
+            continue
+        score = 1 + text.count(",") + min(len(text) // 100, 3)
+        grand = parent.getparent()
+        for node, share in ((parent, 1.0), (grand, 0.5)):
+            if node is None:
+                continue
+            if node not in scores:
+                scores[node] = _class_weight(node) + (5 if node.tag in ("article", "main") else 0)
+            scores[node] += score * share
+    best, best_score = None, 0.0
+    for node, score in scores.items():
+        score *= 1 - _link_density(node)
+        if score > best_score:
+            best, best_score = node, score
+    return best
+
+
+def _block_text(el) -> str:
+    """Текст с переносами на границах блоков; строчные теги (a, b, span…) не рвут предложения."""
+    for node in el.iter(etree.Element):
+        if node.tag in BLOCK_TAGS:
+            node.text = "\n" + (node.text or "")
+            node.tail = "\n" + (node.tail or "")
+    lines = (" ".join(line.split()) for line in el.text_content().splitlines())
+    return "\n".join(line for line in lines if line)
+
+
+def _decode(content: bytes, encoding: Optional[str]) -> str:
+    """Кодировка из заголовков, иначе UTF-8, иначе определение по meta/содержимому (libxml2 без meta берёт latin-1)."""
+    if encoding:
+        try:
+            return content.decode(encoding, errors="replace")
+        except LookupError:
+            pass
+    try:
+        return content.decode("utf-8")
+    except UnicodeDecodeError:
+        return UnicodeDammit(content, is_html=True).unicode_markup
+
+
+def _parse(markup: str):
+    parser = lxml.html.HTMLParser(remove_comments=True, remove_pis=True)
+    return lxml.html.document_fromstring(markup, parser=parser)
+
+
+def _main_text(root) -> str:
+    body = root.find("body")
+    if body is None:
+        body = root
+    best = _best_candidate(body)
+    if best is not None:
+        text = _block_text(best)
+        if len(text) >= MIN_MAIN_TEXT_CHARS:
+            return text
+    return _block_text(body)
+
+
+def extract_main_text(content: bytes, encoding: Optional[str] = None) -> str:
+    """
+    Сырой текст основного содержимого страницы (без маскирования ПД и финальной очистки).
+    Если после удаления блоков по class/id текста мало — повтор на свежем разборе без этого удаления.
+    """
+    markup = _XML_DECLARATION.sub("", _decode(content, encoding), count=1)
+    root = _parse(markup)
+    _strip_noise(root)
+    text = _main_text(root)
+    if len(text) >= MIN_MAIN_TEXT_CHARS:
+        return text
+    root = _parse(markup)
+    etree.strip_elements(root, *NOISE_TAGS, with_tail=False)
+    retry = _main_text(root)
+    return retry if len(retry) > len(text) else text
@@ -0,0 +1,242 @@
+"""Загрузка веб-страниц: общий пул соединений, потоковое чтение с обрывом по лимиту размера и времени,
+локальный HTTP-кэш с перепроверкой по ETag / Last-Modified (повторная загрузка статьи — 304 без тела).
+"""
+import hashlib
+import json
+import logging
+import os
+import socket
+import tempfile
+import threading
+import time
+from datetime import datetime
+from typing import NamedTuple, Optional
+from urllib.parse import urlsplit, urlunsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import ProtocolError, ReadTimeoutError
+
+from backend.config import (
+    STORAGE_PATH,
+    MAX_FILE_SIZE_BYTES,
+    URL_FETCH_TIMEOUT_SECONDS,
+    URL_FETCH_POOL_SIZE,
+    HTTP_CACHE_ENABLED,
+    HTTP_CACHE_MAX_AGE_DAYS,
+    HTTP_CACHE_MAX_MB,
+)
+
+logger = logging.getLogger(__name__)
+
+HTTP_CACHE_DIR = STORAGE_PATH / "http_cache"
+USER_AGENT = "PodcastGenerator/1.0 (educational project)"
+CHUNK_SIZE = 64 * 1024
+# Без read1 (urllib3 1.x) чтение блока ждёт его заполнения — маленький блок, чтобы чаще сверяться со сроком
+SLOW_CHUNK_SIZE = 1024
+CONNECT_TIMEOUT = 10
+
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+
+
+class FetchResult(NamedTuple):
+    url: str
+    content: bytes
+    encoding: Optional[str]  # charset из Content-Type; None — определит парсер
+    content_hash: str
+    etag: Optional[str]
+    last_modified: Optional[str]
+    not_modified: bool  # True — сервер ответил 304, тело взято из кэша
+
+
+def normalize_url(url: str) -> str:
+    """Схема и хост в нижнем регистре, без фрагмента и порта по умолчанию, пустой путь -> '/'."""
+    parts = urlsplit((url or "").strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    port = parts.port
+    if port and not ((scheme == "http" and port == 80) or (scheme == "https" and port == 443)):
+        host = f"{host}:{port}"
+    return urlunsplit((scheme, host, parts.path or "/", parts.query, ""))
+
+
+def get_session() -> requests.Session:
+    """Общая сессия с пулом keep-alive соединений (на хост до URL_FETCH_POOL_SIZE)."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            s = requests.Session()
+            adapter = HTTPAdapter(pool_connections=URL_FETCH_POOL_SIZE, pool_maxsize=URL_FETCH_POOL_SIZE)
+            s.mount("http://", adapter)
+            s.mount("https://", adapter)
+            s.headers["User-Agent"] = USER_AGENT
+            _session = s
+        return _session
+
+
+def _cache_paths(url: str):
+    key = hashlib.sha256(normalize_url(url).encode("utf-8")).hexdigest()
+    return HTTP_CACHE_DIR / f"{key}.json", HTTP_CACHE_DIR / f"{key}.body"
+
+
+def _load_cached(url: str) -> Optional[dict]:
+    """Запись кэша или None. Тело, не совпавшее с content_hash из метаданных (запись оборвалась между файлами), не отдаётся."""
+    meta_path, body_path = _cache_paths(url)
+    if not meta_path.exists() or not body_path.exists():
+        return None
+    try:
+        meta = json.loads(meta_path.read_text(encoding="utf-8"))
+        meta["content"] = body_path.read_bytes()
+    except (OSError, ValueError) as e:
+        logger.debug("http cache read %s: %s", url, e)
+        return None
+    if hashlib.sha256(meta["content"]).hexdigest() != meta.get("content_hash"):
+        logger.debug("http cache %s: тело не совпадает с метаданными", url)
+        return None
+    return meta
+
+
+def _write_atomic(path, data: bytes) -> None:
+    """Запись через уникальный временный файл и os.replace: читатель видит старый файл или новый целиком."""
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=path.name + ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+
+
+def _save_cached(url: str, result: FetchResult) -> None:
+    meta_path, body_path = _cache_paths(url)
+    try:
+        HTTP_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        _write_atomic(body_path, result.content)
+        _write_atomic(meta_path, json.dumps({
+            "url": normalize_url(url),
+            "encoding": result.encoding,
+            "content_hash": result.content_hash,
+            "etag": result.etag,
+            "last_modified": result.last_modified,
+            "fetched_at": datetime.utcnow().isoformat(),
+        }).encode("utf-8"))
+    except OSError as e:
+        logger.warning("http cache write %s: %s", url, e)
+
+
+def purge_http_cache() -> int:
+    """
+    Удалить записи HTTP-кэша старше HTTP_CACHE_MAX_AGE_DAYS (по последней загрузке или ответу 304),
+    затем самые давние, пока кэш больше HTTP_CACHE_MAX_MB. Возвращает число удалённых записей.
+    """
+    if not HTTP_CACHE_DIR.exists():
+        return 0
+    # Запись — файлы с общим ключом: key.json, key.body и оставшиеся от оборванной записи key.*.tmp
+    entries = {}
+    for path in HTTP_CACHE_DIR.iterdir():
+        try:
+            st = path.stat()
+        except OSError:
+            continue
+        entry = entries.setdefault(path.name.split(".", 1)[0], {"mtime": 0.0, "size": 0, "paths": []})
+        entry["mtime"] = max(entry["mtime"], st.st_mtime)
+        entry["size"] += st.st_size
+        entry["paths"].append(path)
+    cutoff = time.time() - HTTP_CACHE_MAX_AGE_DAYS * 86400
+    budget = HTTP_CACHE_MAX_MB * 1024 * 1024
+    total = sum(e["size"] for e in entries.values())
+    removed = 0
+    for entry in sorted(entries.values(), key=lambda e: e["mtime"]):
+        if entry["mtime"] >= cutoff and total <= budget:
+            break
+        for path in entry["paths"]:
+            path.unlink(missing_ok=True)
+        total -= entry["size"]
+        removed += 1
+    return removed
+
+
+def _charset(resp: requests.Response) -> Optional[str]:
+    """Кодировка только если явно указана в Content-Type (requests подставляет ISO-8859-1 для text/* без charset)."""
+    content_type = resp.headers.get("Content-Type") or ""
+    return resp.encoding if "charset=" in content_type.lower() else None
+
+
+def _iter_body(resp: requests.Response, deadline: float, read_timeout: float):
+    """
+    Тело ответа по мере поступления с общим сроком deadline (time.monotonic). Каждое чтение сокета ждёт
+    не дольше оставшегося времени, а блок отдаётся сразу, как только что-то пришло (read1), —
+    сервер, присылающий по нескольку байт, не растянет загрузку дальше срока.
+    """
+    raw = resp.raw
+    read1 = getattr(raw, "read1", None)
+    while True:
+        left = deadline - time.monotonic()
+        if left <= 0:
+            raise ValueError("Страница загружается слишком долго")
+        _set_socket_timeout(raw, min(left, read_timeout))
+        try:
+            chunk = read1(CHUNK_SIZE, decode_content=True) if read1 else raw.read(SLOW_CHUNK_SIZE, decode_content=True)
+        except (ReadTimeoutError, socket.timeout, ProtocolError) as e:
+            if time.monotonic() >= deadline:
+                raise ValueError("Страница загружается слишком долго")
+            raise requests.exceptions.ConnectionError(e)
+        if not chunk:
+            return
+        yield chunk
+
+
+def _set_socket_timeout(raw, seconds: float) -> None:
+    sock = getattr(getattr(raw, "_connection", None), "sock", None)
+    if sock is not None:
+        sock.settimeout(max(0.01, seconds))
+
+
+def fetch_url(url: str, max_bytes: int = MAX_FILE_SIZE_BYTES, timeout: float = URL_FETCH_TIMEOUT_SECONDS) -> FetchResult:
+    """
+    GET страницы с потоковым чтением. Превышение max_bytes (по Content-Length или по факту) или общего
+    времени timeout — ValueError сразу, без дочитывания. Ошибки HTTP — requests.exceptions.RequestException.
+    """
+    cached = _load_cached(url) if HTTP_CACHE_ENABLED else None
+    headers = {}
+    if cached:
+        if cached.get("etag"):
+            headers["If-None-Match"] = cached["etag"]
+        if cached.get("last_modified"):
+            headers["If-Modified-Since"] = cached["last_modified"]
+    started = time.monotonic()
+    with get_session().get(url, headers=headers, stream=True, timeout=(CONNECT_TIMEOUT, timeout)) as resp:
+        if resp.status_code == 304 and cached:
+            logger.info("[http_fetch] %s: 304 Not Modified, тело из кэша", url)
+            try:
+                os.utime(_cache_paths(url)[0])  # запись подтверждена — срок хранения отсчитывается заново
+            except OSError:
+                pass
+            return FetchResult(
+                url, cached["content"], cached.get("encoding"), cached["content_hash"],
+                cached.get("etag"), cached.get("last_modified"), True,
+            )
+        resp.raise_for_status()
+        length = resp.headers.get("Content-Length")
+        if length and length.isdigit() and int(length) > max_bytes:
+            raise ValueError("Размер страницы превышает допустимый лимит")
+        buf = bytearray()
+        digest = hashlib.sha256()
+        for chunk in _iter_body(resp, started + timeout, timeout):
+            buf += chunk
+            digest.update(chunk)
+            if len(buf) > max_bytes:
+                raise ValueError("Размер страницы превышает допустимый лимит")
+        result = FetchResult(
+            url, bytes(buf), _charset(resp), digest.hexdigest(),
+            resp.headers.get("ETag"), resp.headers.get("Last-Modified"), False,
+        )
+        no_store = "no-store" in (resp.headers.get("Cache-Control") or "").lower()
+    if HTTP_CACHE_ENABLED and (result.etag or result.last_modified) and not no_store:
+        _save_cached(url, result)
+    return result
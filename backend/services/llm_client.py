@@ -1,12 +1,15 @@
 """Универсальный клиент к OpenAPI-совместимому LLM. ТЗ 4.2: кастомный URL + API_KEY."""
 import logging
 import re
+import time
 from typing import List, Dict, Any, Optional
 
 from openai import OpenAI
 from openai import APITimeoutError, APIError
 
 from backend.config import OPENAPI_LLM_URL, OPENAPI_LLM_API_KEY, OPENAPI_LLM_MODEL
+from backend.services.cancellation import TaskCancelled, abortable_client, call_abortable
+from backend.services.usage import record_call, elapsed_ms
 
 logger = logging.getLogger(__name__)
 
@@ -129,19 +132,41 @@ def generate_script(
     model = OPENAPI_LLM_MODEL or "gpt-3.5-turbo"
     prompt = build_prompt(text, format_type, style, duration, presentation)
     last_error = None
+    started = time.monotonic()
+    prompt_bytes = len(prompt.encode("utf-8"))
     for attempt in range(3):
         try:
-            resp = client.chat.completions.create(
-                model=model,
-                messages=[{"role": "user", "content": prompt}],
-                timeout=120.0,
-            )
+            # Прерываемый вызов: при отмене задачи воркер не ждёт ответа LLM (до 120 с)
+            with abortable_client(client):
+                resp = call_abortable(
+                    client.chat.completions.create,
+                    model=model,
+                    messages=[{"role": "user", "content": prompt}],
+                    timeout=120.0,
+                )
             content = (resp.choices[0].message.content or "").strip()
+            usage = getattr(resp, "usage", None)
+            record_call(
+                "llm", "script", elapsed_ms(started), retries=attempt,
+                prompt_tokens=getattr(usage, "prompt_tokens", None),
+                completion_tokens=getattr(usage, "completion_tokens", None),
+                chars=len(prompt), bytes_sent=prompt_bytes, bytes_received=len(content.encode("utf-8")),
+            )
             return parse_scenario_response(content)
+        except TaskCancelled as e:
+            record_call(
+                "llm", "script", elapsed_ms(started), retries=attempt, ok=False,
+                chars=len(prompt), bytes_sent=prompt_bytes, error_message=str(e),
+            )
+            raise
         except APITimeoutError as e:
             last_error = e
             logger.warning("LLM timeout attempt %s: %s", attempt + 1, e)
         except APIError as e:
             last_error = e
             logger.warning("LLM API error attempt %s: %s", attempt + 1, e)
+    record_call(
+        "llm", "script", elapsed_ms(started), retries=2, ok=False,
+        chars=len(prompt), bytes_sent=prompt_bytes, error_message=str(last_error),
+    )
     raise last_error or RuntimeError("LLM failed")
@@ -1,6 +1,7 @@
 """Музыкальная библиотека и микширование; генерация обложки. ТЗ 2.1.5, 3.5."""
 import logging
 import random
+import time
 from pathlib import Path
 from typing import Optional
 
@@ -19,6 +20,9 @@ from backend.config import (
     OPENAPI_IMAGE_QUALITY,
     STORAGE_PATH,
 )
+from backend.services.cancellation import abortable_client, call_abortable
+from backend.services.executors import run_cpu
+from backend.services.usage import record_call, elapsed_ms
 
 logger = logging.getLogger(__name__)
 
@@ -62,9 +66,14 @@ def pick_music_by_style(style: str, voice_speed: float) -> Optional[str]:
 
 
 def mix_voice_with_music(voice_path: Path, music_path: Optional[Path], output_path: Path, music_volume_db: float = MUSIC_VOLUME_DB) -> Path:
-    """Микширование: голос + музыка. Громкость музыки регулируемая. ТЗ 2.1.5, 7.1."""
+    """Микширование: голос + музыка. Громкость музыки регулируемая. ТЗ 2.1.5, 7.1. Выполняется в пуле процессов."""
     if AudioSegment is None:
         raise RuntimeError("pydub недоступен (нужен audioop). Используйте Python 3.12 или установите pyaudioop.")
+    run_cpu(_mix_voice_with_music, voice_path, music_path, output_path, music_volume_db)
+    return output_path
+
+
+def _mix_voice_with_music(voice_path: Path, music_path: Optional[Path], output_path: Path, music_volume_db: float) -> Path:
     voice = AudioSegment.from_file(str(voice_path))
     if not music_path or not music_path.exists():
         voice.export(str(output_path), format="mp3", bitrate="128k")
@@ -105,11 +114,31 @@ def generate_cover_image(prompt: str, size: int = COVER_SIZE, custom_prompt: Opt
     """
     if not OPENAPI_IMAGE_URL or not OPENAPI_IMAGE_API_KEY:
         raise RuntimeError("Генерация изображений не настроена: OPENAPI_IMAGE_URL, OPENAPI_IMAGE_API_KEY")
+    started = time.monotonic()
+    stats = {"requests": 0, "chars": 0, "bytes_sent": 0}
+    try:
+        image = _request_cover_image(prompt, size, custom_prompt, stats)
+    except Exception as e:
+        record_call(
+            "image", "cover", elapsed_ms(started), retries=max(stats["requests"] - 1, 0), ok=False,
+            chars=stats["chars"], bytes_sent=stats["bytes_sent"], error_message=str(e),
+        )
+        raise
+    record_call(
+        "image", "cover", elapsed_ms(started), retries=max(stats["requests"] - 1, 0),
+        chars=stats["chars"], bytes_sent=stats["bytes_sent"], bytes_received=len(image),
+    )
+    return image
+
+
+def _request_cover_image(prompt: str, size: int, custom_prompt: Optional[str], stats: dict) -> bytes:
+    """Запросы к API изображений (с повторами без model/response_format). stats — счётчики для учёта."""
     raw = (custom_prompt or prompt or "podcast cover art").strip()
     # Не передаём в API промпты с кириллицей — избегаем текста на русском на картинке
     if _has_cyrillic(raw):
         raw = prompt.strip() if prompt else "Professional podcast cover art, abstract illustration, no text"
     text_prompt = (raw + _COVER_NO_TEXT_SUFFIX if _COVER_NO_TEXT_SUFFIX not in raw else raw)[:1000]
+    stats["chars"] = len(text_prompt)
     url = OPENAPI_IMAGE_URL.rstrip("/")
     # OpenAI-стиль: эндпоинт картинок — /v1/images/generations (если base заканчивается на /v1)
     if url.endswith("/v1"):
@@ -128,8 +157,10 @@ def generate_cover_image(prompt: str, size: int = COVER_SIZE, custom_prompt: Opt
     quality = OPENAPI_IMAGE_QUALITY or (("gpt-image-1.5" in (use_model or "").lower()) and "low" or None)
     if quality:
         payload["quality"] = quality.lower()
-    with httpx.Client(timeout=120.0) as client:
-        resp = client.post(url, json=payload, headers=headers)
+    with httpx.Client(timeout=120.0) as client, abortable_client(client):
+        stats["requests"] += 1
+        stats["bytes_sent"] += len(text_prompt.encode("utf-8"))
+        resp = call_abortable(client.post, url, json=payload, headers=headers)
         if not resp.is_success:
             body = (resp.text or "")[:500]
             logger.warning("[music_cover] API изображений ответил %s: %s", resp.status_code, body)
@@ -137,7 +168,9 @@ def generate_cover_image(prompt: str, size: int = COVER_SIZE, custom_prompt: Opt
             if resp.status_code == 400 and "model" in body.lower() and "model" in payload:
                 logger.info("[music_cover] Повтор запроса без параметра model")
                 del payload["model"]
-                resp = client.post(url, json=payload, headers=headers)
+                stats["requests"] += 1
+                stats["bytes_sent"] += len(text_prompt.encode("utf-8"))
+                resp = call_abortable(client.post, url, json=payload, headers=headers)
                 if not resp.is_success:
                     body = (resp.text or "")[:500]
                     logger.warning("[music_cover] Повтор без model: %s %s", resp.status_code, body)
@@ -147,7 +180,9 @@ def generate_cover_image(prompt: str, size: int = COVER_SIZE, custom_prompt: Opt
             if not resp.is_success and resp.status_code == 400 and "response_format" in body.lower() and "response_format" in payload:
                 logger.info("[music_cover] Повтор запроса без параметра response_format")
                 del payload["response_format"]
-                resp = client.post(url, json=payload, headers=headers)
+                stats["requests"] += 1
+                stats["bytes_sent"] += len(text_prompt.encode("utf-8"))
+                resp = call_abortable(client.post, url, json=payload, headers=headers)
                 if not resp.is_success:
                     logger.warning("[music_cover] Повтор без response_format: %s %s", resp.status_code, (resp.text or "")[:300])
         resp.raise_for_status()
@@ -160,7 +195,8 @@ def generate_cover_image(prompt: str, size: int = COVER_SIZE, custom_prompt: Opt
                 return base64.b64decode(b64)
             url_out = data.get("data", [{}])[0].get("url") or data.get("url")
             if url_out:
-                r2 = client.get(url_out)
+                stats["requests"] += 1
+                r2 = call_abortable(client.get, url_out)
                 r2.raise_for_status()
                 return r2.content
             raise ValueError("Ответ API изображений без data/url")
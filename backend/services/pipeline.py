@@ -3,15 +3,16 @@ import json
 import logging
 import os
 import sqlite3
+import time
 import uuid
 from pathlib import Path
 from datetime import datetime
 
-from backend.config import STORAGE_PATH, MAX_TEXT_LENGTH, BASE_URL
+from backend.config import STORAGE_PATH, MAX_TEXT_LENGTH, BASE_URL, STAGE_TIMEOUTS, TASK_TIMEOUT_SECONDS
 from backend.database import get_connection
-from backend.services.text_extraction import extract_from_pdf, extract_from_docx, extract_from_url
+from backend.services.extraction_cache import extract_file_cached, extract_url_cached, get_extraction
 from backend.services.llm_client import generate_script
-from backend.services.tts_client import generate_podcast_audio
+from backend.services.tts_client import cached_replica_ratio, generate_podcast_audio
 from backend.services.music_cover import (
     list_music_tracks,
     pick_music_by_style,
@@ -20,6 +21,14 @@ from backend.services.music_cover import (
     generate_cover_image,
 )
 from backend.services.rss_export import build_rss, write_id3, get_mp3_duration_seconds
+from backend.services.cancellation import TaskCancelled, TaskTimedOut, cancellation_scope, check_cancelled, enter_stage
+from backend.services.coalescing import live_followers
+from backend.services.eta import record_stage, task_features
+from backend.services.executors import submit_io, wait_result
+from backend.services.progress_bus import publish
+from backend.services import task_progress
+from backend.services.checkpoints import checkpoint_path, first_incomplete_stage, load_checkpoints, save_checkpoint
+from backend.services.usage import task_context
 
 logger = logging.getLogger(__name__)
 
@@ -27,42 +36,76 @@ STAGES = ["extract", "script", "tts", "music_cover", "rss", "done"]
 
 
 def _update_task(task_id: str, status: str, stage: str = None, error_message: str = None, result_id: str = None, progress: int = None, activity_message: str = None):
+    """
+    Обновление статуса/прогресса задачи и её последователей. Отменённые задачи не перезаписываются.
+    Изменения внутри этапа (реплики TTS и т.п.) копятся в памяти и пишутся не чаще PROGRESS_FLUSH_SECONDS
+    (services/task_progress.py); смена статуса или этапа пишется сразу.
+    """
+    msg = (activity_message[:500] if activity_message else "") if activity_message is not None else None
+    fields = {
+        "status": status, "stage": stage or "", "error_message": error_message or "", "result_id": result_id or "",
+        "progress": progress, "activity_message": msg,
+    }
+    task_progress.update(task_id, fields, _write_task)
+    publish(task_id)  # последователи подписаны и на id лидера
+
+
+def _write_task(task_id: str, fields: dict, count: int, expect_status: str = None) -> None:
+    """
+    Запись накопленного состояния задачи. Версия растёт на число вошедших изменений (count) —
+    столько же, сколько видели читатели буфера. expect_status — запись из буфера не перекрывает новый статус.
+    """
+    sets = ["status = ?", "stage = ?", "error_message = ?", "result_id = ?", "updated_at = ?", "version = version + ?"]
+    args = [fields["status"], fields["stage"], fields["error_message"], fields["result_id"], datetime.utcnow().isoformat(), count]
+    for key in ("progress", "activity_message"):
+        if fields.get(key) is not None:
+            sets.append(f"{key} = ?")
+            args.append(fields[key])
+    where = "(id = ? OR leader_task_id = ?) AND status <> 'cancelled'"
+    args += [task_id, task_id]
+    if expect_status:
+        where += " AND status = ?"
+        args.append(expect_status)
     with get_connection() as conn:
-        now = datetime.utcnow().isoformat()
-        row = (status, stage or "", error_message or "", result_id or "", now, task_id)
-        msg = (activity_message[:500] if activity_message else "") if activity_message is not None else None
-        try:
-            if progress is not None and msg is not None:
-                conn.execute(
-                    "UPDATE task SET status = ?, stage = ?, error_message = ?, result_id = ?, updated_at = ?, progress = ?, activity_message = ? WHERE id = ?",
-                    (*row[:5], progress, msg, task_id),
-                )
-            elif progress is not None:
-                conn.execute(
-                    "UPDATE task SET status = ?, stage = ?, error_message = ?, result_id = ?, updated_at = ?, progress = ? WHERE id = ?",
-                    (*row[:5], progress, task_id),
-                )
-            elif msg is not None:
-                conn.execute(
-                    "UPDATE task SET status = ?, stage = ?, error_message = ?, result_id = ?, updated_at = ?, activity_message = ? WHERE id = ?",
-                    (*row[:5], msg, task_id),
-                )
-            else:
-                conn.execute(
-                    "UPDATE task SET status = ?, stage = ?, error_message = ?, result_id = ?, updated_at = ? WHERE id = ?",
-                    row,
-                )
-        except sqlite3.OperationalError:
-            if progress is not None:
-                conn.execute(
-                    "UPDATE task SET status = ?, stage = ?, error_message = ?, result_id = ?, updated_at = ?, progress = ? WHERE id = ?",
-                    (*row[:5], progress, task_id),
-                )
-            else:
-                conn.execute(
-                    "UPDATE task SET status = ?, stage = ?, error_message = ?, result_id = ?, updated_at = ? WHERE id = ?",
-                    row,
-                )
+        conn.execute(f"UPDATE task SET {', '.join(sets)} WHERE {where}", args)
+
+
+def _begin_stage(task_id: str, stage: str) -> float:
+    """
+    Начало этапа: отсчёт его бюджета (STAGE_TIMEOUTS) и отметка для ETA выполняемой задачи.
+    Возвращает момент начала для замера длительности.
+    """
+    enter_stage(stage, STAGE_TIMEOUTS.get(stage))
+    with get_connection() as conn:
+        conn.execute("UPDATE task SET stage_started_at = ? WHERE id = ? OR leader_task_id = ?", (time.time(), task_id, task_id))
+    return time.monotonic()
+
+
+def _save_features(task_id: str, known: dict) -> None:
+    with get_connection() as conn:
+        conn.execute("UPDATE task SET features_json = ? WHERE id = ? OR leader_task_id = ?", (json.dumps(known), task_id, task_id))
+
+
+def _generate_cover(text: str, custom_prompt: str = None) -> bytes:
+    """Обложка по тексту (выполняется в io-пуле; контрольную точку пишет поток пайплайна)."""
+    return generate_cover_image(generate_cover_prompt(text), custom_prompt=custom_prompt)
+
+
+def _runs_for_followers(task: dict) -> bool:
+    """Лидер отменён, но его результата ждут последователи — пайплайн выполняется для них."""
+    if task["status"] != "cancelled":
+        return False
+    with get_connection() as conn:
+        return live_followers(conn, task["id"]) > 0
+
+
+def _result_owner(conn, task_id: str, result_id: str) -> str:
+    """Задача, от имени которой публикуется результат: лидер, если он завершён, иначе самый ранний последователь."""
+    row = conn.execute(
+        "SELECT id FROM task WHERE result_id = ? AND status = 'completed' ORDER BY id = ? DESC, created_at, id LIMIT 1",
+        (result_id, task_id),
+    ).fetchone()
+    return row["id"] if row else task_id
 
 
 def _get_task(task_id: str):
@@ -76,48 +119,119 @@ def _ensure_session(session_id: str):
         conn.execute("INSERT OR IGNORE INTO session (id, created_at) VALUES (?, ?)", (session_id, datetime.utcnow().isoformat()))
 
 
+def _skipped_work(state: dict) -> dict:
+    """Внешние вызовы, которые не понадобились из-за отмены (оценка по тому, что успели сделать)."""
+    script = state["script"]
+    if script is None:
+        replicas, chars = None, None  # сценария ещё нет — объём озвучки неизвестен
+    else:
+        texts = [(item.get("text") or "").strip() for item in script]
+        left = [t for t in texts if t][state["replicas_done"]:]
+        replicas, chars = len(left), sum(len(t) for t in left)
+    return {
+        "llm_calls": 1 if script is None else 0,
+        "tts_replicas": replicas,
+        "tts_chars": chars,
+        "image_calls": 0 if state["cover_done"] else 1,
+    }
+
+
+def _record_cancellation(task_id: str, state: dict) -> None:
+    """Отчёт об отмене: на каком этапе остановились и сколько вызовов API сэкономлено."""
+    report = {"stage": state["stage"], "skipped": _skipped_work(state), "cancelled_at": datetime.utcnow().isoformat()}
+    logger.info("[pipeline] Задача %s: отменена на этапе %s, не выполнено: %s", task_id, state["stage"], report["skipped"])
+    with get_connection() as conn:
+        conn.execute(
+            "UPDATE task SET status = 'cancelled', cancel_report_json = ?, activity_message = ?, updated_at = ? WHERE id = ?",
+            (json.dumps(report), "Отменено", datetime.utcnow().isoformat(), task_id),
+        )
+    publish(task_id)
+
+
 def run_pipeline(task_id: str, progress_cb=None):
     """
-    Выполнение пайплайна для задачи. progress_cb(stage, progress_0_1) опционально для WebSocket.
+    Выполнение пайплайна для задачи. progress_cb(stage, progress_0_1) опционально; изменения статуса
+    и прогресса публикуются в шину services/progress_bus.py (WebSocket).
+    Внешние вызовы (LLM, TTS, обложка) учитываются в api_call с привязкой к задаче.
+    Отмена (POST /api/tasks/<id>/cancel) прерывает задачу между этапами, репликами и во время вызовов API.
+    Так же прерывается задача дольше TASK_TIMEOUT_SECONDS или этап дольше своего бюджета — со статусом failed.
+    Готовые этапы сохраняются как контрольные точки (services/checkpoints.py): повтор начинается с первого несделанного.
     """
+    try:
+        with task_context(task_id), cancellation_scope(task_id, timeout=TASK_TIMEOUT_SECONDS):
+            _run_pipeline(task_id, progress_cb)
+    finally:
+        task_progress.forget(task_id)
+
+
+def _run_pipeline(task_id: str, progress_cb=None):
     logger.info("[pipeline] Задача %s: старт", task_id)
     task = _get_task(task_id)
-    if not task or task["status"] != "pending":
+    if not task or (task["status"] != "pending" and not _runs_for_followers(task)):
         logger.info("[pipeline] Задача %s: пропуск (нет задачи или status != pending)", task_id)
         return
     params = json.loads(task["params_json"] or "{}")
     session_id = task["session_id"]
     _update_task(task_id, "running", "extract", progress=0, activity_message="Подготовка…")
+    task_dir = STORAGE_PATH / task_id
+    if load_checkpoints(task_dir):
+        logger.info("[pipeline] Задача %s: повтор, продолжаем с этапа %s", task_id, first_incomplete_stage(task_dir) or "rss")
+    # Что уже сделано — для отчёта о сэкономленных вызовах при отмене
+    state = {"stage": "extract", "script": None, "replicas_done": 0, "cover_done": False}
+    # Признаки задачи для прогноза ETA (services/eta.py), по мере того как они становятся известны
+    known = {}
+    cover_future = None
 
     try:
         # 1. Извлечение текста
+        stage_t0 = _begin_stage(task_id, state["stage"])
         logger.info("[pipeline] Задача %s: этап 1 — извлечение текста", task_id)
         if progress_cb:
             progress_cb("extract", 0.0)
         _update_task(task_id, "running", "extract", progress=5, activity_message="Извлечение текста…")
         source = params.get("source", "file")
         text = ""
-        if source == "url":
+        extraction = get_extraction(params.get("extraction_id"))
+        text_checkpoint = checkpoint_path(task_dir, "extract")
+        if text_checkpoint:
+            text = text_checkpoint.read_text(encoding="utf-8")
+            logger.info("[pipeline] Задача %s: текст из контрольной точки", task_id)
+        elif extraction:
+            # Текст уже извлечён в /api/extract — этап извлечения пропускается
+            text = extraction["text"]
+            logger.info("[pipeline] Задача %s: текст из кэша извлечения %s", task_id, extraction["extraction_id"])
+        elif source == "url" or (source == "extraction" and params.get("url")):
             url = params.get("url", "").strip()
             if not url:
                 raise ValueError("Не указан URL")
-            text, _, _ = extract_from_url(url)
+            text, _, _, _ = extract_url_cached(url)
+        elif source == "extraction":
+            raise ValueError("Результат извлечения не найден (истёк срок хранения). Загрузите материал заново.")
         else:
             path = Path(params.get("file_path", ""))
             if not path.exists():
                 raise ValueError("Файл не найден")
-            if path.suffix.lower() == ".pdf":
-                text, _, _ = extract_from_pdf(path)
-            else:
-                text, _, _ = extract_from_docx(path)
+            # Всё сверх MAX_TEXT_LENGTH отбрасывается — дальше лимита страницы PDF не читаем
+            text, _, _, _ = extract_file_cached(
+                path, max_chars=MAX_TEXT_LENGTH, content_hash=params.get("content_hash"), filename=params.get("filename"),
+            )
         if len(text) > MAX_TEXT_LENGTH:
             text = text[:MAX_TEXT_LENGTH]
+        if not text_checkpoint:
+            save_checkpoint(task_dir, "extract", text)
+        known["text_length"] = len(text)
+        _save_features(task_id, known)
+        if not text_checkpoint and not extraction:
+            record_stage(task_id, "extract", time.monotonic() - stage_t0, task_features(params, known))
         if progress_cb:
             progress_cb("extract", 1.0)
         _update_task(task_id, "running", "extract", progress=20, activity_message="Текст извлечён")
         logger.info("[pipeline] Задача %s: извлечение готово, символов: %s", task_id, len(text))
 
         # 2. Сценарий
+        check_cancelled()
+        state["stage"] = "script"
+        stage_t0 = _begin_stage(task_id, state["stage"])
         logger.info("[pipeline] Задача %s: этап 2 — генерация сценария", task_id)
         _update_task(task_id, "running", "script", progress=25, activity_message="Генерация сценария…")
         if progress_cb:
@@ -126,16 +240,35 @@ def run_pipeline(task_id: str, progress_cb=None):
         style = params.get("style", "conversational")
         duration = params.get("duration", "standard")
         presentation = params.get("presentation", "neutral")
-        script = generate_script(text, format_type=format_type, style=style, duration=duration, presentation=presentation)
+        script_checkpoint = checkpoint_path(task_dir, "script")
+        if script_checkpoint:
+            script = json.loads(script_checkpoint.read_text(encoding="utf-8"))
+            logger.info("[pipeline] Задача %s: сценарий из контрольной точки", task_id)
+        else:
+            script = generate_script(text, format_type=format_type, style=style, duration=duration, presentation=presentation)
+            save_checkpoint(task_dir, "script", json.dumps(script, ensure_ascii=False))
+        state["script"] = script
+        known["replicas"] = len([item for item in script if (item.get("text") or "").strip()])
+        _save_features(task_id, known)
+        if not script_checkpoint:
+            record_stage(task_id, "script", time.monotonic() - stage_t0, task_features(params, known))
         if progress_cb:
             progress_cb("script", 1.0)
         _update_task(task_id, "running", "script", progress=40, activity_message="Сценарий готов")
         logger.info("[pipeline] Задача %s: сценарий готов, реплик: %s", task_id, len(script))
 
+        # Обложка зависит только от текста: запрос к API изображений идёт в io-пуле параллельно с озвучкой и сведением
+        if not checkpoint_path(task_dir, "cover"):
+            cover_future = submit_io(_generate_cover, text, params.get("cover_prompt"))
+
         # 3. TTS
+        check_cancelled()
+        state["stage"] = "tts"
+        stage_t0 = _begin_stage(task_id, state["stage"])
         logger.info("[pipeline] Задача %s: этап 3 — TTS (озвучка)", task_id)
         n_replicas = len(script)
         def on_replica_done(i: int, total: int):
+            state["replicas_done"] = i
             p = 45 + int(25 * i / total) if total else 45
             _update_task(task_id, "running", "tts", progress=min(p, 69), activity_message="Озвучка: реплика %d/%d" % (i, total))
         _update_task(task_id, "running", "tts", progress=45, activity_message="Синтез речи…")
@@ -143,20 +276,32 @@ def run_pipeline(task_id: str, progress_cb=None):
         voice_speed = float(params.get("voice_speed", 1.0))
         if voice_speed < 0.5 or voice_speed > 2.0:
             voice_speed = 1.0
-        task_dir = STORAGE_PATH / task_id
         task_dir.mkdir(parents=True, exist_ok=True)
-        voice_path = task_dir / "voice.mp3"
-        generate_podcast_audio(
-            script, voice_map, voice_path, speed=voice_speed,
-            on_replica_done=on_replica_done,
-            per_voice_dir=task_dir,
-        )
+        voice_path = checkpoint_path(task_dir, "tts")
+        if voice_path:
+            state["replicas_done"] = len([item for item in script if (item.get("text") or "").strip()])
+            logger.info("[pipeline] Задача %s: озвучка из контрольной точки", task_id)
+        else:
+            # Озвученные реплики берутся из кэша TTS — повтор после сбоя на середине не платит за них снова
+            voice_path = task_dir / "voice.mp3"
+            known["cache_hit_ratio"] = cached_replica_ratio(script, voice_map, speed=voice_speed)
+            _save_features(task_id, known)
+            generate_podcast_audio(
+                script, voice_map, voice_path, speed=voice_speed,
+                on_replica_done=on_replica_done,
+                per_voice_dir=task_dir,
+            )
+            save_checkpoint(task_dir, "tts")
+            record_stage(task_id, "tts", time.monotonic() - stage_t0, task_features(params, known))
         if progress_cb:
             progress_cb("tts", 1.0)
         _update_task(task_id, "running", "tts", progress=70, activity_message="Озвучка готова")
         logger.info("[pipeline] Задача %s: TTS готов", task_id)
 
         # 4. Музыка и обложка (музыка накладывается только при явном выборе music_id или "auto" по стилю)
+        check_cancelled()
+        state["stage"] = "music_cover"
+        stage_t0 = _begin_stage(task_id, state["stage"])
         logger.info("[pipeline] Задача %s: этап 4 — музыка и обложка", task_id)
         _update_task(task_id, "running", "music_cover", progress=75, activity_message="Музыка и обложка…")
         music_path = None
@@ -174,19 +319,27 @@ def run_pipeline(task_id: str, progress_cb=None):
         mixed_path = task_dir / "mixed.mp3"
         mix_voice_with_music(voice_path, music_path, mixed_path, params.get("music_volume_db", -20))
         cover_path = task_dir / "cover.jpg"
-        try:
-            prompt = generate_cover_prompt(text)
-            custom = params.get("cover_prompt")
-            img_bytes = generate_cover_image(prompt, custom_prompt=custom)
-            cover_path.write_bytes(img_bytes)
-            logger.info("[pipeline] Задача %s: обложка сгенерирована", task_id)
-        except Exception as e:
-            logger.warning("[pipeline] Задача %s: обложка не создана — %s", task_id, e)
+        if cover_future is None:
+            state["cover_done"] = True
+            logger.info("[pipeline] Задача %s: обложка из контрольной точки", task_id)
+        else:
+            try:
+                save_checkpoint(task_dir, "cover", wait_result(cover_future))
+                state["cover_done"] = True
+                logger.info("[pipeline] Задача %s: обложка сгенерирована", task_id)
+            except TaskCancelled:
+                raise
+            except Exception as e:
+                logger.warning("[pipeline] Задача %s: обложка не создана — %s", task_id, e)
+        record_stage(task_id, "music_cover", time.monotonic() - stage_t0, task_features(params, known))
         if progress_cb:
             progress_cb("music_cover", 1.0)
         _update_task(task_id, "running", "music_cover", progress=85, activity_message="Музыка и обложка готовы")
 
         # 5. RSS и метаданные
+        check_cancelled()
+        state["stage"] = "rss"
+        stage_t0 = _begin_stage(task_id, state["stage"])
         logger.info("[pipeline] Задача %s: этап 5 — RSS и ID3", task_id)
         _update_task(task_id, "running", "rss", progress=90, activity_message="Финализация RSS и метаданных…")
         title = params.get("title") or text[:100].replace("\n", " ")
@@ -196,41 +349,61 @@ def run_pipeline(task_id: str, progress_cb=None):
         result_id = str(uuid.uuid4())
         rss_path = task_dir / "feed.xml"
         base_url = (BASE_URL or params.get("base_url") or "").strip().rstrip("/")
-        mp3_url = f"{base_url}/api/files/{task_id}/mp3" if base_url else ""
-        cover_url = f"{base_url}/api/files/{task_id}/cover" if base_url else ""
-        rss_content = build_rss(title, description, mp3_url, cover_url, duration_sec, datetime.utcnow(), f"{base_url}/api/files/{task_id}/rss")
-        rss_path.write_text(rss_content, encoding="utf-8")
         def _rel(p: Path) -> str:
             try:
                 return p.relative_to(STORAGE_PATH).as_posix()
             except ValueError:
                 return str(p)
         cover_rel = _rel(cover_path) if cover_path.exists() else ""
+        task_progress.flush(task_id)
         with get_connection() as conn:
-            conn.execute(
-                "INSERT INTO result (id, task_id, mp3_path, cover_path, rss_path, title, description, duration_seconds, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
-                (result_id, task_id, _rel(mixed_path), cover_rel, _rel(rss_path), title, description, duration_sec, datetime.utcnow().isoformat()),
-            )
+            # Статус completed (задаче и её последователям) — только если их не отменили, пока шла финализация
             logger.info("[pipeline] Задача %s: записываю в БД status=completed progress=100 result_id=%s", task_id, result_id)
             try:
-                conn.execute(
-                    "UPDATE task SET result_id = ?, status = ?, stage = ?, updated_at = ?, progress = ?, activity_message = ? WHERE id = ?",
-                    (result_id, "completed", "done", datetime.utcnow().isoformat(), 100, "Готово", task_id),
+                cur = conn.execute(
+                    "UPDATE task SET result_id = ?, status = ?, stage = ?, updated_at = ?, progress = ?, activity_message = ? WHERE (id = ? OR leader_task_id = ?) AND status = 'running'",
+                    (result_id, "completed", "done", datetime.utcnow().isoformat(), 100, "Готово", task_id, task_id),
                 )
             except sqlite3.OperationalError:
-                conn.execute(
-                    "UPDATE task SET result_id = ?, status = ?, stage = ?, updated_at = ?, progress = ? WHERE id = ?",
-                    (result_id, "completed", "done", datetime.utcnow().isoformat(), 100, task_id),
+                cur = conn.execute(
+                    "UPDATE task SET result_id = ?, status = ?, stage = ?, updated_at = ?, progress = ? WHERE (id = ? OR leader_task_id = ?) AND status = 'running'",
+                    (result_id, "completed", "done", datetime.utcnow().isoformat(), 100, task_id, task_id),
                 )
+            if cur.rowcount == 0:
+                raise TaskCancelled(f"Задача {task_id} отменена")
+            # Ссылки ленты и result.task_id — на задачу, получившую результат: лидер, а если его отменили,
+            # пока пайплайн работал для последователей, — первый из них
+            owner = _result_owner(conn, task_id, result_id)
+            mp3_url = f"{base_url}/api/files/{owner}/mp3" if base_url else ""
+            cover_url = f"{base_url}/api/files/{owner}/cover" if base_url else ""
+            rss_content = build_rss(title, description, mp3_url, cover_url, duration_sec, datetime.utcnow(), f"{base_url}/api/files/{owner}/rss")
+            rss_path.write_text(rss_content, encoding="utf-8")
+            conn.execute(
+                "INSERT INTO result (id, task_id, mp3_path, cover_path, rss_path, title, description, duration_seconds, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (result_id, owner, _rel(mixed_path), cover_rel, _rel(rss_path), title, description, duration_sec, datetime.utcnow().isoformat()),
+            )
             logger.info("[pipeline] Задача %s: БД обновлена (status=completed), следующий GET /api/tasks/%s должен вернуть completed", task_id, task_id)
+        publish(task_id)
+        record_stage(task_id, "rss", time.monotonic() - stage_t0, task_features(params, known))
         if progress_cb:
             progress_cb("rss", 1.0)
         logger.info(
             "[pipeline] Задача %s: завершена успешно | result_id=%s | mp3=%s | cover=%s | rss=%s | длительность=%s с",
             task_id, result_id, _rel(mixed_path), cover_rel or "(нет)", _rel(rss_path), duration_sec,
         )
+    except TaskTimedOut as e:
+        err_msg = str(e)
+        logger.error("[pipeline] Задача %s: %s", task_id, err_msg)
+        _update_task(task_id, "failed", e.stage, error_message=err_msg, activity_message="Ошибка: " + err_msg)
+    except TaskCancelled:
+        _record_cancellation(task_id, state)
     except Exception as e:
         err_msg = str(e)[:500]
         logger.exception("[pipeline] Задача %s: ошибка — %s", task_id, e)
         current = _get_task(task_id) or task
         _update_task(task_id, "failed", current.get("stage") or "tts", error_message=err_msg, activity_message="Ошибка: " + err_msg[:200])
+    finally:
+        # Этап упал раньше сборки: ещё не начатый запрос обложки снимается с io-пула; уже идущий завершится сам,
+        # не трогая каталог задачи — контрольные точки пишет только этот поток
+        if cover_future is not None and not cover_future.done():
+            cover_future.cancel()
@@ -0,0 +1,190 @@
+"""Шина событий прогресса задач внутри процесса.
+Пайплайн, очередь и API публикуют факт изменения (publish): id задачи или QUEUE — изменился порядок очереди.
+Подписчики (WebSocket) ждут событий своих тем и читают состояние задачи только после события —
+ожидающий клиент не стоит запросов к БД.
+События других процессов (воркеры при EMBEDDED_WORKERS=0, другие веб-процессы gunicorn со своими воркерами)
+сюда не доходят: их восполняет поток-наблюдатель, пока есть подписчики. Раз в QUEUE_POLL_SECONDS он одним запросом
+сверяет версии задач, на которые есть подписка, порядок очереди и число задач подписанных сессий.
+"""
+import logging
+import threading
+import time
+from typing import Optional
+
+from backend.config import QUEUE_POLL_SECONDS
+from backend.database import get_connection
+
+logger = logging.getLogger(__name__)
+
+# Тема «изменился порядок очереди» — позиции всех ожидающих задач
+QUEUE = "queue"
+# Префикс темы «в сессии появилась задача» (session_topic)
+SESSION_PREFIX = "session:"
+
+_topics = {}  # тема -> множество подписок
+_queue_generation = 0  # число событий QUEUE с запуска — ключ общих для всех клиентов расчётов по очереди
+_lock = threading.Lock()
+_watcher: Optional[threading.Thread] = None
+
+
+class Subscription:
+    """Подписка на темы (id задач, QUEUE, session_topic). Закрывать после использования — удобнее через with."""
+
+    def __init__(self, topics=()):
+        self._event = threading.Event()
+        self._changed = set()
+        self._own = set()
+        self.add(*topics)
+
+    @property
+    def topics(self) -> set:
+        with _lock:
+            return set(self._own)
+
+    def add(self, *topics) -> None:
+        with _lock:
+            for topic in topics:
+                if topic and topic not in self._own:
+                    self._own.add(topic)
+                    _topics.setdefault(topic, set()).add(self)
+        _ensure_watcher()
+
+    def remove(self, *topics) -> None:
+        with _lock:
+            for topic in topics:
+                if topic not in self._own:
+                    continue
+                self._own.discard(topic)
+                subs = _topics.get(topic)
+                if subs is not None:
+                    subs.discard(self)
+                    if not subs:
+                        del _topics[topic]
+
+    def wait(self, timeout: Optional[float] = None) -> set:
+        """Темы, изменившиеся с прошлого вызова; пустое множество — истёк timeout."""
+        self._event.wait(timeout)
+        with _lock:
+            changed, self._changed = self._changed, set()
+            self._event.clear()
+        return changed
+
+    def notify(self, topic: str) -> None:
+        """Разбудить ожидающего только этой подписки (например, клиент добавил задачи)."""
+        with _lock:
+            self._notify(topic)
+
+    def close(self) -> None:
+        self.remove(*self.topics)
+
+    def _notify(self, topic: str) -> None:
+        self._changed.add(topic)
+        self._event.set()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def subscribe(*topics) -> Subscription:
+    return Subscription(topics)
+
+
+def session_topic(session_id: str) -> str:
+    return SESSION_PREFIX + session_id
+
+
+def publish(*topics) -> None:
+    """Сообщить подписчикам об изменении; без подписчиков ничего не стоит."""
+    global _queue_generation
+    with _lock:
+        if QUEUE in topics:
+            _queue_generation += 1
+        for topic in topics:
+            for sub in _topics.get(topic, ()):
+                sub._notify(topic)
+
+
+def queue_generation() -> int:
+    """Меняется при каждом сдвиге очереди, известном этому процессу (см. tasks_queue._cached_forecast)."""
+    with _lock:
+        return _queue_generation
+
+
+def subscriber_count() -> int:
+    with _lock:
+        return len({sub for subs in _topics.values() for sub in subs})
+
+
+def _poll_db(seen: dict) -> None:
+    """
+    Один проход наблюдателя: изменения задач с подписчиками (версия строки), порядка очереди
+    и состава подписанных сессий с прошлого прохода.
+    Впервые увиденная тема тоже публикуется — изменение между подпиской и первым проходом не теряется.
+    """
+    with _lock:
+        watched = [t for t in _topics if t != QUEUE and not t.startswith(SESSION_PREFIX)]
+        sessions = [t[len(SESSION_PREFIX):] for t in _topics if t.startswith(SESSION_PREFIX)]
+        want_queue = QUEUE in _topics
+    changed = []
+    with get_connection(readonly=True) as conn:
+        for i in range(0, len(watched), 500):
+            chunk = watched[i:i + 500]
+            marks = ",".join("?" * len(chunk))
+            for row in conn.execute(
+                f"SELECT id, status, version FROM task WHERE id IN ({marks})", chunk,
+            ).fetchall():
+                sig = (row["status"], row["version"])
+                if seen.get(row["id"]) != sig:
+                    changed.append(row["id"])
+                seen[row["id"]] = sig
+        for i in range(0, len(sessions), 500):
+            chunk = sessions[i:i + 500]
+            marks = ",".join("?" * len(chunk))
+            for row in conn.execute(
+                f"SELECT session_id, COUNT(*) AS n, MAX(created_at) AS last FROM task WHERE session_id IN ({marks}) GROUP BY session_id",
+                chunk,
+            ).fetchall():
+                topic = session_topic(row["session_id"])
+                if seen.get(topic) != (row["n"], row["last"]):
+                    changed.append(topic)
+                seen[topic] = (row["n"], row["last"])
+        if want_queue:
+            row = conn.execute(
+                "SELECT COUNT(*) AS n, SUM(state = 'leased') AS leased, MAX(enqueued_at) AS last FROM queue_item",
+            ).fetchone()
+            sig = (row["n"], row["leased"], row["last"])
+            if seen.get(QUEUE) != sig:
+                changed.append(QUEUE)
+            seen[QUEUE] = sig
+    live = set(watched) | {session_topic(s) for s in sessions}
+    for topic in [t for t in seen if t not in live and t != QUEUE]:
+        del seen[topic]  # подписчиков на задачу не осталось
+    if changed:
+        publish(*changed)
+
+
+def _watch_loop() -> None:
+    global _watcher
+    seen = {}
+    while True:
+        time.sleep(QUEUE_POLL_SECONDS)
+        with _lock:
+            if not _topics:
+                _watcher = None  # подписчиков нет — поток завершается, следующая подписка запустит новый
+                return
+        try:
+            _poll_db(seen)
+        except Exception as e:
+            logger.warning("[progress] наблюдение за БД: %s", e)
+
+
+def _ensure_watcher() -> None:
+    global _watcher
+    with _lock:
+        if _watcher is not None or not _topics:
+            return
+        _watcher = threading.Thread(target=_watch_loop, name="progress-watcher", daemon=True)
+        _watcher.start()
@@ -0,0 +1,80 @@
+"""Порядок выдачи задач из очереди: приоритет, round-robin по сессиям, короткие задачи раньше длинных.
+Одна функция schedule() используется и для выбора следующей задачи воркером, и для расчёта позиции в очереди.
+"""
+from typing import Dict, List, Optional
+
+from backend.config import MAX_TEXT_LENGTH, QUEUE_AGING_SECONDS
+
+# Ожидаемая длительность подкаста, минут (по значениям duration из llm_client.DURATION_MAP)
+DURATION_MINUTES = {
+    "very_short": 1,
+    "микро": 1,
+    "short": 4,
+    "краткий": 4,
+    "standard": 8.5,
+    "стандартный": 8.5,
+}
+DEFAULT_DURATION_MINUTES = 8.5
+# Вклад текста в оценку: 10 000 символов ≈ минута работы (извлечение, промпт LLM)
+CHARS_PER_WORK_UNIT = 10000
+
+PRIORITY_MIN = -10
+PRIORITY_MAX = 10
+
+
+def parse_priority(value) -> int:
+    """Приоритет из запроса: целое в [PRIORITY_MIN, PRIORITY_MAX], по умолчанию 0. Некорректное значение — ValueError."""
+    if value is None or value == "":
+        return 0
+    try:
+        priority = int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"Поле 'priority' должно быть целым числом от {PRIORITY_MIN} до {PRIORITY_MAX}")
+    return max(PRIORITY_MIN, min(PRIORITY_MAX, priority))
+
+
+def estimate_work(params: dict, text_length: Optional[int] = None) -> float:
+    """
+    Оценка объёма работы (условные минуты): длительность подкаста + длина текста.
+    Длина неизвестна (URL, файл до извлечения) — берём половину MAX_TEXT_LENGTH.
+    """
+    minutes = DURATION_MINUTES.get(str(params.get("duration") or "standard").lower(), DEFAULT_DURATION_MINUTES)
+    if text_length is None:
+        text_length = MAX_TEXT_LENGTH // 2
+    return round(minutes + min(text_length, MAX_TEXT_LENGTH) / CHARS_PER_WORK_UNIT, 3)
+
+
+def effective_work(item: dict, now: float) -> float:
+    """Оценка с поправкой на ожидание: чем дольше задача ждёт, тем «короче» она считается (длинные не голодают)."""
+    waited = max(0.0, now - item["enqueued_at"])
+    return (item.get("est_work") or 0.0) / (1.0 + waited / QUEUE_AGING_SECONDS)
+
+
+def schedule(items: List[dict], last_claimed: Dict[str, float], now: float) -> List[dict]:
+    """
+    Полный порядок выдачи элементов очереди (task_id, session_id, priority, est_work, enqueued_at).
+    Внутри сессии — по приоритету, затем по effective_work. Между сессиями — сначала более высокий приоритет
+    головной задачи, затем сессия, которую дольше всех не обслуживали (round-robin), затем более короткая задача.
+    last_claimed — время последней выдачи задачи по сессии.
+    """
+    by_session = {}
+    for item in items:
+        by_session.setdefault(item.get("session_id") or "", []).append(item)
+    for queue in by_session.values():
+        queue.sort(key=lambda it: (-(it.get("priority") or 0), effective_work(it, now), it["enqueued_at"]))
+    served = dict(last_claimed)
+    tick = max([now] + list(served.values()))
+    order = []
+    while by_session:
+        def _key(session_id):
+            head = by_session[session_id][0]
+            return (-(head.get("priority") or 0), served.get(session_id) or 0.0, effective_work(head, now), head["enqueued_at"])
+
+        session_id = min(by_session, key=_key)
+        queue = by_session[session_id]
+        order.append(queue.pop(0))
+        tick += 1.0
+        served[session_id] = tick
+        if not queue:
+            del by_session[session_id]
+    return order
@@ -0,0 +1,136 @@
+"""Буфер прогресса выполняемых задач. Пайплайн сообщает о каждой реплике и подэтапе, но в БД пишется
+не чаще раза в PROGRESS_FLUSH_SECONDS на задачу; смена статуса или этапа пишется сразу (вместе с накопленным).
+Читатели этого процесса (GET /api/tasks, long-poll, WebSocket) накладывают состояние из памяти на строку
+из БД (overlay) и видят прогресс без задержки. Версия задачи учитывает и незаписанные изменения:
+при записи она увеличивается на их число, так что для клиента не убывает.
+"""
+import logging
+import threading
+import time
+from typing import Callable, Optional
+
+from backend.config import PROGRESS_FLUSH_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Поля, которые пайплайн обновляет через буфер
+FIELDS = ("status", "stage", "error_message", "result_id", "progress", "activity_message")
+
+# task_id -> {"state": последнее состояние, "pending": незаписанные поля, "count": их число,
+#             "flushed_at": время записи, "writer": функция записи,
+#             "write_lock": записи задачи по очереди — от забора накопленного до конца UPDATE,
+#             "written_status": статус последней записи (под write_lock)}
+_tasks = {}
+_lock = threading.Lock()
+_due = threading.Condition(_lock)
+_flusher: Optional[threading.Thread] = None
+
+
+def _merge(target: dict, fields: dict) -> None:
+    for key, value in fields.items():
+        if value is not None or key not in ("progress", "activity_message"):
+            target[key] = value
+
+
+def update(task_id: str, fields: dict, writer: Callable[[str, dict, int, Optional[str]], None]) -> None:
+    """
+    Изменение состояния задачи. writer(task_id, fields, count, expect_status) пишет поля в БД
+    (count — сколько изменений включает запись, expect_status — статус, при котором запись ещё актуальна).
+    """
+    now = time.monotonic()
+    with _lock:
+        entry = _tasks.get(task_id)
+        if entry is None:
+            entry = _tasks[task_id] = {
+                "state": {}, "pending": {}, "count": 0, "flushed_at": 0.0, "writer": writer,
+                "write_lock": threading.Lock(), "written_status": None,
+            }
+        prev = entry["state"]
+        transition = prev.get("status") != fields.get("status") or prev.get("stage") != fields.get("stage")
+        _merge(entry["state"], fields)
+        _merge(entry["pending"], fields)
+        entry["count"] += 1
+        if not transition and now - entry["flushed_at"] < PROGRESS_FLUSH_SECONDS:
+            _ensure_flusher()
+            _due.notify()
+            return
+    _write(task_id, entry, conditional=False)
+
+
+def _take(entry: dict, now: float):
+    """Забрать накопленное для записи (под _lock)."""
+    pending, count = entry["pending"], entry["count"]
+    entry["pending"], entry["count"], entry["flushed_at"] = {}, 0, now
+    return pending, count
+
+
+def overlay(task: dict) -> dict:
+    """Строка задачи из БД с ещё не записанными изменениями (последователь — по состоянию лидера)."""
+    key = task.get("leader_task_id") or task.get("id")
+    with _lock:
+        entry = _tasks.get(key)
+        if entry is None or entry["state"].get("status") != task.get("status"):
+            return task  # статус в БД новее буфера (отмена, завершение) — буфер не применяется
+        state, count = dict(entry["state"]), entry["count"]
+    out = dict(task)
+    _merge(out, {k: v for k, v in state.items() if k in FIELDS and k not in ("status", "result_id")})
+    out["version"] = (task.get("version") or 0) + count
+    return out
+
+
+def flush(task_id: str) -> None:
+    """Записать накопленное по задаче сейчас."""
+    with _lock:
+        entry = _tasks.get(task_id)
+        if entry is None or not entry["count"]:
+            return
+    _write(task_id, entry, conditional=True)
+
+
+def _write(task_id: str, entry: dict, conditional: bool) -> None:
+    """
+    Запись накопленного. Забор и UPDATE — под write_lock задачи: иначе пачка, забранная потоком записи,
+    могла бы попасть в БД после более новой смены этапа и откатить этап и прогресс.
+    conditional — только если статус в БД тот, что записан последним (не сменился извне).
+    """
+    with entry["write_lock"]:
+        with _lock:
+            if not entry["count"]:
+                return  # накопленное уже записал другой поток
+            pending, count = _take(entry, time.monotonic())
+        entry["writer"](task_id, pending, count, entry["written_status"] if conditional else None)
+        entry["written_status"] = pending.get("status", entry["written_status"])
+
+
+def forget(task_id: str) -> None:
+    """Задача завершена: дописать накопленное и освободить память."""
+    try:
+        flush(task_id)
+    except Exception as e:
+        logger.warning("[progress] Задача %s: запись прогресса: %s", task_id, e)
+    with _lock:
+        _tasks.pop(task_id, None)
+
+
+def _flush_loop() -> None:
+    while True:
+        with _lock:
+            now = time.monotonic()
+            due = [t for t, e in _tasks.items() if e["count"] and now - e["flushed_at"] >= PROGRESS_FLUSH_SECONDS]
+            if not due:
+                waits = [e["flushed_at"] + PROGRESS_FLUSH_SECONDS - now for e in _tasks.values() if e["count"]]
+                _due.wait(min(waits) if waits else None)
+                continue
+        for task_id in due:
+            try:
+                flush(task_id)
+            except Exception as e:
+                logger.warning("[progress] Задача %s: запись прогресса: %s", task_id, e)
+
+
+def _ensure_flusher() -> None:
+    """Запуск потока записи (под _lock)."""
+    global _flusher
+    if _flusher is None:
+        _flusher = threading.Thread(target=_flush_loop, name="progress-flush", daemon=True)
+        _flusher.start()
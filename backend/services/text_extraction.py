@@ -1,15 +1,18 @@
 """Извлечение текста из PDF, DOCX и URL. Без внешних API. ТЗ 2.1.1."""
 import re
 import logging
+from collections import deque
 from pathlib import Path
-from typing import Optional
+from typing import Iterator, Optional
 
 import fitz  # PyMuPDF
 from docx import Document as DocxDocument
-import requests
 from bs4 import BeautifulSoup
 
-from backend.config import MAX_FILE_SIZE_BYTES
+from backend.config import MAX_FILE_SIZE_BYTES, PDF_PARALLEL_MIN_PAGES, PDF_PAGES_PER_CHUNK, PDF_WORKERS, HTML_EXTRACTOR
+from backend.services.executors import cpu_pool, submit_cpu
+from backend.services.html_content import MIN_MAIN_TEXT_CHARS, extract_main_text
+from backend.services.http_fetch import fetch_url
 
 logger = logging.getLogger(__name__)
 
@@ -28,23 +31,35 @@ PHONE_PATTERNS = [
 # Паттерн: непробельные символы слева от @, потом @, потом непробельные справа
 EMAIL_OR_CONTACT_PATTERN = re.compile(r"\S+@\S+")
 
+PHONE_MASK = "[телефон скрыт]"
+CONTACT_MASK = "[контакт скрыт]"
+
+# Однопроходный движок: все паттерны в одной альтернации, один sub по тексту вместо finditer+sub на каждый паттерн;
+# замены не перепроверяются следующими паттернами. Контакт проверяется первым и только с начала слова —
+# слово с @ маскируется целиком, даже если начинается с цифр. Телефонные ветки пробуются только с [+\d(]
+# (с этих символов начинаются все PHONE_PATTERNS) — на обычных буквах движок не тратит время.
+PII_PATTERN = re.compile(
+    r"(?<!\S)(?P<contact>" + EMAIL_OR_CONTACT_PATTERN.pattern + ")"
+    + r"|(?=[+\d(])(?P<phone>" + "|".join(p.pattern for p in PHONE_PATTERNS) + ")"
+)
+
 
 def mask_pii(text: str):
     """
-    Удаление/маскирование телефонов и контактов с @ (email, TG и т.д.).
+    Удаление/маскирование телефонов и контактов с @ (email, TG и т.д.) за один проход.
     Возвращает (очищенный_текст, список_удалённых_телефонов, список_удалённых_контактов_с_@).
     """
     removed_phones = []
     removed_contacts = []
-    out = text
-    for pat in PHONE_PATTERNS:
-        for m in pat.finditer(out):
-            removed_phones.append(m.group(0))
-        out = pat.sub("[телефон скрыт]", out)
-    for m in EMAIL_OR_CONTACT_PATTERN.finditer(out):
-        removed_contacts.append(m.group(0))
-    out = EMAIL_OR_CONTACT_PATTERN.sub("[контакт скрыт]", out)
-    return out, removed_phones, removed_contacts
+
+    def _replace(m):
+        if m.lastgroup == "contact":
+            removed_contacts.append(m.group(0))
+            return CONTACT_MASK
+        removed_phones.append(m.group(0))
+        return PHONE_MASK
+
+    return PII_PATTERN.sub(_replace, text), removed_phones, removed_contacts
 
 
 def mask_pii_legacy(text: str) -> str:
@@ -71,32 +86,116 @@ def clean_and_format(text: str) -> str:
     return "\n\n".join(lines)
 
 
-def _extract_raw_pdf(file_path: Path) -> str:
+def _check_file_size(file_path: Path) -> None:
     if file_path.stat().st_size > MAX_SIZE:
         raise ValueError(f"Файл превышает лимит {MAX_SIZE // (1024*1024)} МБ")
-    text_parts = []
+
+
+def _extract_pdf_page_range(file_path: str, start: int, stop: int) -> list:
+    """Тексты страниц [start, stop). Выполняется в процессе пула."""
     doc = fitz.open(file_path)
     try:
-        for page in doc:
-            text_parts.append(page.get_text())
+        return [doc[i].get_text() for i in range(start, min(stop, doc.page_count))]
     finally:
         doc.close()
-    return "\n".join(text_parts)
+
+
+def _iter_pdf_pages(file_path: Path) -> Iterator[str]:
+    """
+    Тексты страниц по порядку. Небольшие документы — последовательно в текущем процессе;
+    от PDF_PARALLEL_MIN_PAGES страниц — диапазонами в общем пуле процессов (executors.cpu_pool), не более PDF_WORKERS диапазонов в работе
+    (при ранней остановке оставшиеся диапазоны не запускаются).
+    """
+    doc = fitz.open(file_path)
+    page_count = doc.page_count
+    pool = cpu_pool()
+    if pool is None or PDF_WORKERS < 2 or page_count < PDF_PARALLEL_MIN_PAGES:
+        try:
+            for page in doc:
+                yield page.get_text()
+        finally:
+            doc.close()
+        return
+    doc.close()
+    chunk = max(1, PDF_PAGES_PER_CHUNK)
+    ranges = iter([(start, min(start + chunk, page_count)) for start in range(0, page_count, chunk)])
+    pending = deque()
+    try:
+        for _ in range(PDF_WORKERS):
+            r = next(ranges, None)
+            if r is None:
+                break
+            pending.append(submit_cpu(_extract_pdf_page_range, str(file_path), *r))
+        while pending:
+            pages = pending.popleft().result()
+            r = next(ranges, None)
+            if r is not None:
+                pending.append(submit_cpu(_extract_pdf_page_range, str(file_path), *r))
+            yield from pages
+    finally:
+        for f in pending:
+            f.cancel()
+
+
+def _extract_raw_pdf(file_path: Path) -> str:
+    """Сырой текст PDF (все страницы)."""
+    _check_file_size(file_path)
+    pages = _iter_pdf_pages(file_path)
+    try:
+        return "\n".join(pages)
+    finally:
+        pages.close()
 
 
 def _extract_raw_docx(file_path: Path) -> str:
-    if file_path.stat().st_size > MAX_SIZE:
-        raise ValueError(f"Файл превышает лимит {MAX_SIZE // (1024*1024)} МБ")
+    _check_file_size(file_path)
     doc = DocxDocument(file_path)
     parts = [p.text for p in doc.paragraphs if p.text.strip()]
     return "\n\n".join(parts)
 
 
-def extract_from_pdf(file_path: Path):
-    """Извлечение текста из PDF. Возвращает (текст, удалённые_телефоны, удалённые_контакты_с_@)."""
-    raw = _extract_raw_pdf(file_path)
-    raw, phones, contacts = mask_pii(raw)
-    return clean_and_format(raw), phones, contacts
+def extract_from_pdf(file_path: Path, max_chars: Optional[int] = None):
+    """
+    Извлечение текста из PDF. Возвращает (текст, удалённые_телефоны, удалённые_контакты_с_@).
+    max_chars — ранняя остановка: страницы читаются, пока очищенный текст не наберёт max_chars символов,
+    результат обрезается до max_chars (для проверки превышения лимита передавайте лимит + 1).
+    """
+    if max_chars is None:
+        raw = _extract_raw_pdf(file_path)
+        raw, phones, contacts = mask_pii(raw)
+        return clean_and_format(raw), phones, contacts
+    _check_file_size(file_path)
+    # Каждая страница маскируется и очищается по мере чтения, склейка — один раз в конце (clean_and_format
+    # построчная: склейка очищенных страниц через абзац совпадает с очисткой всего текста). Последняя непустая
+    # строка страницы придерживается до следующей — телефон, разорванный переносом страницы, тоже маскируется.
+    cleaned, phones, contacts = [], [], []
+    length = -2  # "\n\n" между частями: до первой части разделителя нет
+    tail = ""
+    pages = _iter_pdf_pages(file_path)
+
+    def _add(raw: str) -> None:
+        nonlocal length
+        masked, p, c = mask_pii(raw)
+        phones.extend(p)
+        contacts.extend(c)
+        text = clean_and_format(masked)
+        if text:
+            cleaned.append(text)
+            length += len(text) + 2
+
+    try:
+        for page_text in pages:
+            chunk = f"{tail}\n{page_text}" if tail else page_text
+            cut = chunk.rstrip().rfind("\n")
+            head, tail = chunk[:max(cut, 0)], chunk[cut + 1:]
+            _add(head)
+            if length >= max_chars:
+                break
+        else:
+            _add(tail)
+        return "\n\n".join(cleaned)[:max_chars], phones, contacts
+    finally:
+        pages.close()
 
 
 def extract_from_docx(file_path: Path):
@@ -106,30 +205,54 @@ def extract_from_docx(file_path: Path):
     return clean_and_format(raw), phones, contacts
 
 
-def extract_from_url(url: str):
-    """Извлечение текста с веб-страницы. Возвращает (текст, удалённые_телефоны, удалённые_контакты_с_@)."""
-    headers = {"User-Agent": "PodcastGenerator/1.0 (educational project)"}
-    resp = requests.get(url, timeout=30, headers=headers)
-    resp.raise_for_status()
-    if len(resp.content) > MAX_SIZE:
-        raise ValueError("Размер страницы превышает допустимый лимит")
-    soup = BeautifulSoup(resp.text, "lxml")
+def _extract_raw_html_soup(content: bytes, encoding: Optional[str] = None) -> str:
+    """Весь текст body через BeautifulSoup (без script/style/nav/footer/header)."""
+    soup = BeautifulSoup(content, "lxml", from_encoding=encoding)
     for tag in soup(["script", "style", "nav", "footer", "header"]):
         tag.decompose()
     body = soup.find("body") or soup
     if not body:
         raise ValueError("Не удалось извлечь контент страницы")
-    raw = body.get_text(separator="\n", strip=True)
+    return body.get_text(separator="\n", strip=True)
+
+
+def _extract_raw_html(content: bytes, encoding: Optional[str] = None, extractor: Optional[str] = None) -> str:
+    if (extractor or HTML_EXTRACTOR) != "density":
+        return _extract_raw_html_soup(content, encoding)
+    try:
+        text = extract_main_text(content, encoding)
+    except Exception as e:
+        logger.warning("Извлечение основного текста не удалось (%s), используем BeautifulSoup", e)
+        return _extract_raw_html_soup(content, encoding)
+    if len(text) >= MIN_MAIN_TEXT_CHARS:
+        return text
+    # Короткий или пустой результат: весь body через BeautifulSoup, если в нём больше текста
+    soup_text = _extract_raw_html_soup(content, encoding)
+    return soup_text if len(soup_text) > len(text) else text
+
+
+def extract_from_html(content: bytes, encoding: Optional[str] = None, extractor: Optional[str] = None):
+    """
+    Текст из HTML (байты; encoding — charset из заголовков, иначе определяет парсер).
+    extractor: density — только основной текст статьи, soup — весь body; по умолчанию HTML_EXTRACTOR.
+    """
+    raw = _extract_raw_html(content, encoding, extractor)
     raw, phones, contacts = mask_pii(raw)
     return clean_and_format(raw), phones, contacts
 
 
-def extract_text(source: str, file_path: Optional[Path] = None):
+def extract_from_url(url: str):
+    """Извлечение текста с веб-страницы. Возвращает (текст, удалённые_телефоны, удалённые_контакты_с_@)."""
+    page = fetch_url(url, max_bytes=MAX_SIZE)
+    return extract_from_html(page.content, page.encoding)
+
+
+def extract_text(source: str, file_path: Optional[Path] = None, max_chars: Optional[int] = None):
     """Единая точка входа. Возвращает (текст, phones, contacts)."""
     if file_path is not None:
         suf = file_path.suffix.lower()
         if suf == ".pdf":
-            return extract_from_pdf(file_path)
+            return extract_from_pdf(file_path, max_chars=max_chars)
         if suf in (".docx", ".doc"):
             return extract_from_docx(file_path)
         raise ValueError(f"Неподдерживаемый формат файла: {suf}. Поддерживаются PDF и DOCX.")
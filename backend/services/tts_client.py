@@ -3,7 +3,8 @@ import io
 import hashlib
 import logging
 import threading
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from pathlib import Path
 from typing import List, Dict, Optional, Callable
 
@@ -22,8 +23,12 @@ from backend.config import (
     OPENAPI_TTS_VOICES_LIST_URL,
     OPENAPI_TTS_MODEL,
     STORAGE_PATH,
+    TTS_CONCURRENCY,
     VOICE_SAMPLES_DIR,
 )
+from backend.services.cancellation import TaskCancelled, abortable_client, call_abortable, check_cancelled
+from backend.services.executors import run_cpu, submit_io
+from backend.services.usage import record_call, elapsed_ms
 
 logger = logging.getLogger(__name__)
 
@@ -247,27 +252,47 @@ def call_tts(text: str, voice_id: str, speed: float = 1.0) -> bytes:
     if speed != 1.0:
         payload["speed"] = speed
     last_error = None
-    with httpx.Client(timeout=60.0) as client:
+    started = time.monotonic()
+    attempts = 0
+    sent = len(text[:5000].encode("utf-8"))
+    with httpx.Client(timeout=60.0) as client, abortable_client(client):
         for url in urls:
             url = url.rstrip("/")
+            attempts += 1
             try:
-                resp = client.post(url, json=payload, headers=headers)
+                resp = call_abortable(client.post, url, json=payload, headers=headers)
                 resp.raise_for_status()
                 content_type = (resp.headers.get("content-type") or "").lower()
                 if "application/json" in content_type:
                     data = resp.json()
                     import base64
                     b64 = data.get("audio") or data.get("data")
-                    if b64:
-                        return base64.b64decode(b64)
-                    raise ValueError("Ответ TTS: JSON без поля audio/data")
-                return resp.content
+                    if not b64:
+                        raise ValueError("Ответ TTS: JSON без поля audio/data")
+                    audio = base64.b64decode(b64)
+                else:
+                    audio = resp.content
+                record_call(
+                    "tts", "speech", elapsed_ms(started), retries=attempts - 1,
+                    chars=len(payload["input"]), bytes_sent=sent, bytes_received=len(resp.content),
+                )
+                return audio
+            except TaskCancelled as e:
+                record_call(
+                    "tts", "speech", elapsed_ms(started), retries=attempts - 1, ok=False,
+                    chars=len(payload["input"]), bytes_sent=sent, error_message=str(e),
+                )
+                raise
             except (HTTPStatusError, httpx.RequestError, ValueError) as e:
                 last_error = e
                 logger.debug("TTS %s failed: %s, trying next URL", url, e)
                 continue
     if last_error is None:
         last_error = RuntimeError("Нет доступных TTS URL")
+    record_call(
+        "tts", "speech", elapsed_ms(started), retries=max(attempts - 1, 0), ok=False,
+        chars=len(payload["input"]), bytes_sent=sent, error_message=str(last_error),
+    )
     if isinstance(last_error, HTTPStatusError) and last_error.response.status_code == 404:
         raise RuntimeError(
             "TTS недоступен: оба URL вернули ошибку (по первому — 404). Укажите правильный OPENAPI_TTS_URL и при необходимости OPENAPI_TTS_URL2 (эндпоинты синтеза речи). Либо добавьте локальные сэмплы в static/voice_samples/ для превью."
@@ -304,6 +329,38 @@ def concatenate_audio_segments(segments: List[Path], output_path: Path) -> Path:
     return output_path
 
 
+def cached_replica_ratio(script: List[Dict[str, str]], voice_map: Dict[str, str], speed: float = 1.0) -> float:
+    """Доля реплик сценария, уже озвученных в кэше TTS (для прогноза длительности озвучки)."""
+    default_voice = DEFAULT_VOICES[0]["id"] if DEFAULT_VOICES else "male_1"
+    total = hits = 0
+    for item in script:
+        text = (item.get("text") or "").strip()
+        if not text:
+            continue
+        speaker = item.get("speaker", "1")
+        total += 1
+        if get_cached_audio(text, voice_map.get(speaker) or voice_map.get("1") or default_voice, speed):
+            hits += 1
+    return round(hits / total, 3) if total else 0.0
+
+
+def _render_podcast_audio(segments: List[tuple], output_path: str, per_voice_dir: Optional[str]) -> str:
+    """Склейка реплик в итоговый трек и дорожки по голосам. Выполняется в пуле процессов (executors.run_cpu)."""
+    output_path = Path(output_path)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    concatenate_audio_segments([Path(p) for _, p in segments], output_path)
+    # Раздельные дорожки по голосам (ТЗ 3.3)
+    if per_voice_dir and AudioSegment is not None:
+        per_speaker: Dict[str, List[Path]] = {}
+        for speaker, path in segments:
+            per_speaker.setdefault(speaker, []).append(Path(path))
+        voice_dir = Path(per_voice_dir)
+        voice_dir.mkdir(parents=True, exist_ok=True)
+        for speaker, paths in per_speaker.items():
+            concatenate_audio_segments(paths, voice_dir / f"voice_{speaker}.mp3")
+    return str(output_path)
+
+
 def generate_podcast_audio(
     script: List[Dict[str, str]],
     voice_map: Dict[str, str],
@@ -315,36 +372,43 @@ def generate_podcast_audio(
     """
     script: [ {"speaker": "1"|"2", "text": "..."}, ... ]
     voice_map: {"1": "male_1", "2": "female_1"}. speed: 0.5–2.0.
-    on_replica_done(i, total) вызывается после каждой реплики (i — номер реплики 1..total).
+    on_replica_done(i, total) вызывается после каждой реплики (i — число готовых реплик 1..total).
     per_voice_dir: если задан, сохраняются раздельные дорожки voice_1.mp3, voice_2.mp3 (ТЗ 3.3).
+    Реплики синтезируются в io-пуле, до TTS_CONCURRENCY одновременно; склейка — в пуле процессов.
     """
-    segments = []  # (speaker, path) для сохранения по голосам
+    if AudioSegment is None:
+        raise RuntimeError("pydub недоступен. Используйте Python 3.12 или установите pyaudioop.")
     default_voice = DEFAULT_VOICES[0]["id"] if DEFAULT_VOICES else "male_1"
-    total = len([item for item in script if (item.get("text") or "").strip()])
-    done = 0
+    replicas = []  # (speaker, text, voice_id) в порядке сценария
     for item in script:
-        speaker = item.get("speaker", "1")
         text = (item.get("text") or "").strip()
         if not text:
             continue
-        voice_id = voice_map.get(speaker) or voice_map.get("1") or default_voice
-        path = synthesize_replica(text, voice_id, speed=speed)
-        segments.append((speaker, path))
-        done += 1
-        if on_replica_done and total:
-            on_replica_done(done, total)
-    if not segments:
+        speaker = item.get("speaker", "1")
+        replicas.append((speaker, text, voice_map.get(speaker) or voice_map.get("1") or default_voice))
+    if not replicas:
         raise ValueError("Сценарий не содержит реплик")
-    output_path.parent.mkdir(parents=True, exist_ok=True)
-    seg_paths = [p for _, p in segments]
-    concatenate_audio_segments(seg_paths, output_path)
-    # Раздельные дорожки по голосам (ТЗ 3.3)
-    if per_voice_dir and AudioSegment is not None:
-        per_speaker: Dict[str, List[Path]] = {}
-        for speaker, path in segments:
-            per_speaker.setdefault(speaker, []).append(path)
-        per_voice_dir.mkdir(parents=True, exist_ok=True)
-        for speaker, paths in per_speaker.items():
-            out_voice = per_voice_dir / f"voice_{speaker}.mp3"
-            concatenate_audio_segments(paths, out_voice)
+    total = len(replicas)
+    paths: List[Optional[Path]] = [None] * total
+    in_flight = {}  # future -> индекс реплики
+    next_index = 0
+    done = 0
+    try:
+        while done < total:
+            while next_index < total and len(in_flight) < max(1, TTS_CONCURRENCY):
+                check_cancelled()
+                _, text, voice_id = replicas[next_index]
+                in_flight[submit_io(synthesize_replica, text, voice_id, speed=speed)] = next_index
+                next_index += 1
+            finished, _ = wait(list(in_flight), return_when=FIRST_COMPLETED)
+            for future in finished:
+                paths[in_flight.pop(future)] = future.result()
+                done += 1
+                if on_replica_done:
+                    on_replica_done(done, total)
+    finally:
+        for future in in_flight:
+            future.cancel()
+    segments = [(speaker, str(path)) for (speaker, _, _), path in zip(replicas, paths)]
+    run_cpu(_render_podcast_audio, segments, str(output_path), str(per_voice_dir) if per_voice_dir else None)
     return output_path
@@ -0,0 +1,44 @@
+"""Приём загружаемых файлов: потоковая запись в уникальный временный файл с проверкой лимита размера
+по мере поступления байтов и подсчётом SHA-256 за тот же проход (ключ кэша извлечения и дедупликации).
+"""
+import hashlib
+import logging
+import os
+import tempfile
+from pathlib import Path
+from typing import Tuple
+
+from backend.config import MAX_FILE_SIZE_BYTES
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 256 * 1024
+
+
+def save_upload(file_storage, dest_dir: Path, max_bytes: int = MAX_FILE_SIZE_BYTES) -> Tuple[Path, str, int]:
+    """
+    Сохранить загрузку (werkzeug FileStorage) в dest_dir под уникальным именем с исходным расширением.
+    Возвращает (путь, sha256_hex, размер). Превышение max_bytes — ValueError, частичный файл удаляется.
+    """
+    dest_dir.mkdir(parents=True, exist_ok=True)
+    suffix = Path(file_storage.filename or "").suffix.lower()
+    fd, tmp_name = tempfile.mkstemp(prefix="upload_", suffix=suffix, dir=str(dest_dir))
+    path = Path(tmp_name)
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while True:
+                chunk = file_storage.stream.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise ValueError(f"Файл превышает лимит {max_bytes // (1024 * 1024)} МБ")
+                digest.update(chunk)
+                out.write(chunk)
+    except BaseException:
+        path.unlink(missing_ok=True)
+        raise
+    logger.debug("upload %s -> %s (%s байт)", file_storage.filename, path.name, size)
+    return path, digest.hexdigest(), size
@@ -0,0 +1,133 @@
+"""Учёт внешних вызовов (LLM, TTS, изображения): токены, символы, байты, задержка, повторы.
+Каждый вызов — запись в таблице api_call с привязкой к задаче (если вызов сделан внутри run_pipeline).
+"""
+import contextvars
+import logging
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Optional
+
+from backend.database import get_connection
+
+logger = logging.getLogger(__name__)
+
+SERVICES = ("llm", "tts", "image")
+
+# Текущая задача для вызовов из пайплайна (contextvar — корректно для потоков и greenlet-ов)
+_current_task = contextvars.ContextVar("usage_task_id", default=None)
+
+
+@contextmanager
+def task_context(task_id: str):
+    """Все вызовы record_call внутри блока привязываются к task_id."""
+    token = _current_task.set(task_id)
+    try:
+        yield
+    finally:
+        _current_task.reset(token)
+
+
+def current_task_id() -> Optional[str]:
+    return _current_task.get()
+
+
+def elapsed_ms(started: float) -> int:
+    """Миллисекунды от started (time.monotonic())."""
+    return int((time.monotonic() - started) * 1000)
+
+
+def record_call(
+    service: str,
+    operation: str,
+    latency_ms: int,
+    retries: int = 0,
+    ok: bool = True,
+    prompt_tokens: Optional[int] = None,
+    completion_tokens: Optional[int] = None,
+    chars: Optional[int] = None,
+    bytes_sent: Optional[int] = None,
+    bytes_received: Optional[int] = None,
+    error_message: Optional[str] = None,
+    task_id: Optional[str] = None,
+) -> None:
+    """Записать один внешний вызов. Ошибки записи не прерывают основной сценарий."""
+    task_id = task_id or _current_task.get()
+    try:
+        with get_connection() as conn:
+            conn.execute(
+                """INSERT INTO api_call (task_id, service, operation, prompt_tokens, completion_tokens, chars,
+                       bytes_sent, bytes_received, latency_ms, retries, ok, error_message, created_at)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                (
+                    task_id, service, operation, prompt_tokens, completion_tokens, chars,
+                    bytes_sent, bytes_received, int(latency_ms), int(retries), 1 if ok else 0,
+                    (error_message or "")[:500] or None, datetime.utcnow().isoformat(),
+                ),
+            )
+    except Exception as e:
+        logger.warning("[usage] Не удалось записать вызов %s/%s: %s", service, operation, e)
+
+
+_TOTALS_SQL = """
+    SELECT service,
+           COUNT(*) AS calls,
+           SUM(CASE WHEN ok = 0 THEN 1 ELSE 0 END) AS errors,
+           SUM(retries) AS retries,
+           COALESCE(SUM(prompt_tokens), 0) AS prompt_tokens,
+           COALESCE(SUM(completion_tokens), 0) AS completion_tokens,
+           COALESCE(SUM(chars), 0) AS chars,
+           COALESCE(SUM(bytes_sent), 0) AS bytes_sent,
+           COALESCE(SUM(bytes_received), 0) AS bytes_received,
+           SUM(latency_ms) AS latency_ms_total,
+           MAX(latency_ms) AS latency_ms_max
+    FROM api_call
+"""
+
+
+def _totals_from_rows(rows) -> dict:
+    by_service = {}
+    for row in rows:
+        r = dict(row)
+        service = r.pop("service")
+        r["latency_ms_avg"] = int(r["latency_ms_total"] / r["calls"]) if r["calls"] else 0
+        by_service[service] = r
+    return by_service
+
+
+def get_task_usage(task_id: str) -> dict:
+    """Сводка по задаче: по каждому сервису — вызовы, токены, символы, байты, задержка, повторы."""
+    with get_connection(readonly=True) as conn:
+        rows = conn.execute(_TOTALS_SQL + " WHERE task_id = ? GROUP BY service", (task_id,)).fetchall()
+    by_service = _totals_from_rows(rows)
+    return {
+        "by_service": by_service,
+        "latency_ms_total": sum(s["latency_ms_total"] for s in by_service.values()),
+    }
+
+
+def get_usage_summary(since: Optional[str] = None, top: int = 10) -> dict:
+    """
+    Агрегат за период (since — ISO-время UTC; None — за всё время):
+    итоги по сервисам и задачи с наибольшим суммарным временем внешних вызовов.
+    """
+    where = " WHERE created_at >= ?" if since else ""
+    args = (since,) if since else ()
+    with get_connection(readonly=True) as conn:
+        rows = conn.execute(_TOTALS_SQL + where + " GROUP BY service", args).fetchall()
+        top_rows = conn.execute(
+            """SELECT task_id, COUNT(*) AS calls, SUM(latency_ms) AS latency_ms_total,
+                      COALESCE(SUM(prompt_tokens), 0) + COALESCE(SUM(completion_tokens), 0) AS tokens,
+                      COALESCE(SUM(chars), 0) AS chars
+               FROM api_call
+               WHERE task_id IS NOT NULL""" + (" AND created_at >= ?" if since else "") + """
+               GROUP BY task_id
+               ORDER BY latency_ms_total DESC
+               LIMIT ?""",
+            (*args, top),
+        ).fetchall()
+    return {
+        "since": since,
+        "by_service": _totals_from_rows(rows),
+        "top_tasks": [dict(r) for r in top_rows],
+    }
@@ -1,78 +1,551 @@
-"""Простая очередь задач: один воркер в потоке. ТЗ 2.1.7, 6."""
+"""Очередь задач в SQLite (таблица queue_item) и пул из TASK_WORKERS воркеров-потоков. ТЗ 2.1.7, 6.
+Порядок выдачи — services/scheduling.py: приоритет, round-robin по сессиям, короткие задачи раньше длинных.
+Долгая задача (например, таймаут LLM) занимает один воркер, остальные продолжают разбирать очередь.
+Очередь переживает перезапуск: воркер берёт задачу в аренду атомарным claim-запросом и продлевает аренду
+heartbeat-ом; аренда, не продлённая вовремя (процесс упал или перезапущен), истекает, и задачу берёт другой воркер.
+Пул работает внутри веб-процесса (EMBEDDED_WORKERS=1) или в отдельном процессе: python -m backend.worker.
+"""
+import atexit
+import heapq
+import json
 import logging
+import math
+import os
+import socket
 import threading
-import queue
+import time
+from datetime import datetime
+from typing import Optional
 
+from backend.config import (
+    TASK_WORKERS, TASK_LEASE_SECONDS, TASK_MAX_ATTEMPTS, QUEUE_POLL_SECONDS, EMBEDDED_WORKERS,
+    QUEUE_MAX_DEPTH, QUEUE_MAX_PER_SESSION, QUEUE_SLOTS,
+)
+from backend.database import get_connection
+from backend.services import cancellation, eta, progress_bus
 from backend.services.pipeline import run_pipeline
+from backend.services.scheduling import estimate_work, schedule
 
 logger = logging.getLogger(__name__)
-_task_queue = queue.Queue()
-_worker_started = False
-_progress_subscribers = {}  # task_id -> list of callables(stage, progress)
+# Как часто воркеры проверяют в БД отмену выполняемых задач, сек
+CANCEL_POLL_SECONDS = 1.0
 
+# Состояние пула: имя воркера -> поток и счётчики для /api/status
+_workers = {}
+_workers_lock = threading.Lock()
+_stopping = threading.Event()
+# Будит воркеры при постановке задачи в этом процессе (задачи других процессов — по опросу раз в QUEUE_POLL_SECONDS)
+_wakeup = threading.Condition()
+_heartbeat_thread = None
 
-def subscribe_progress(task_id: str, callback):
-    if task_id not in _progress_subscribers:
-        _progress_subscribers[task_id] = []
-    _progress_subscribers[task_id].append(callback)
+_OWNER_PREFIX = f"{socket.gethostname()}:{os.getpid()}"
 
+# Скорость разбора очереди — по задачам, завершённым за это окно (сек); при меньшем числе замеров — по модели ETA
+DRAIN_WINDOW_SECONDS = 900
+DRAIN_MIN_SAMPLES = 3
+RETRY_AFTER_MAX_SECONDS = 3600
+# Счётчики допуска задач в очередь (с запуска процесса) для /api/status
+_admission = {"queued": 0, "coalesced": 0, "queue_full": 0, "session_limit": 0}
+_admission_lock = threading.Lock()
+# Прогноз очереди общий для всех клиентов: пересчёт после сдвига очереди (событие QUEUE шины прогресса),
+# смены модели ETA или раз в столько секунд (сдвиги из других процессов без подписчиков, истёкшие аренды)
+FORECAST_CACHE_SECONDS = 2.0
+_forecast_cache = {"key": None, "at": 0.0, "starts": {}, "wait": 0.0}
+_forecast_lock = threading.Lock()
 
-def unsubscribe_progress(task_id: str, callback):
-    if task_id in _progress_subscribers:
-        try:
-            _progress_subscribers[task_id].remove(callback)
-        except ValueError:
-            pass
+
+_AVAILABLE = "(state = 'queued' OR (state = 'leased' AND lease_expires_at < ?))"
+
+
+def _schedule(conn, now: float) -> list:
+    """Доступные элементы очереди в порядке выдачи (см. scheduling.schedule)."""
+    items = [dict(r) for r in conn.execute(
+        f"SELECT task_id, state, attempts, session_id, priority, est_work, enqueued_at FROM queue_item WHERE {_AVAILABLE}",
+        (now,),
+    ).fetchall()]
+    if not items:
+        return []
+    sessions = {it["session_id"] for it in items if it["session_id"]}
+    last_claimed = {}
+    if sessions:
+        marks = ",".join("?" * len(sessions))
+        for r in conn.execute(f"SELECT id, last_claimed_at FROM session WHERE id IN ({marks})", tuple(sessions)).fetchall():
+            if r["last_claimed_at"]:
+                last_claimed[r["id"]] = r["last_claimed_at"]
+    return schedule(items, last_claimed, now)
+
+
+def _claim(owner: str) -> Optional[str]:
+    """
+    Взять следующую задачу в аренду: свободную или с истёкшей арендой, в порядке планировщика.
+    BEGIN IMMEDIATE — выбор и захват в одной транзакции под блокировкой записи, два воркера
+    (в т.ч. из разных процессов) одну задачу не получат. Задачи, исчерпавшие попытки, помечаются failed,
+    и берётся следующая — воркер не засыпает, пока в очереди есть работа.
+    """
+    now = time.time()
+    task_id, touched = None, []
+    with get_connection() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        for row in _schedule(conn, now):
+            touched.append(row["task_id"])
+            if row["state"] == "leased":
+                # Предыдущий воркер пропал посреди задачи
+                if row["attempts"] >= TASK_MAX_ATTEMPTS:
+                    logger.warning("[queue] Задача %s: аренда истекла %s раз, помечаем failed", row["task_id"], row["attempts"])
+                    conn.execute("DELETE FROM queue_item WHERE task_id = ?", (row["task_id"],))
+                    conn.execute(
+                        "UPDATE task SET status = 'failed', error_message = ?, updated_at = ? WHERE id = ? AND status IN ('pending', 'running')",
+                        ("Обработка прерывалась перезапуском сервиса. Создайте задачу заново.", datetime.utcnow().isoformat(), row["task_id"]),
+                    )
+                    continue
+                logger.info("[queue] Задача %s: аренда истекла, перезапуск (попытка %s)", row["task_id"], row["attempts"] + 1)
+                conn.execute("UPDATE task SET status = 'pending' WHERE id = ? AND status = 'running'", (row["task_id"],))
+            task_id = row["task_id"]
+            conn.execute(
+                """UPDATE queue_item SET state = 'leased', lease_owner = ?, lease_expires_at = ?, attempts = attempts + 1
+                   WHERE task_id = ?""",
+                (owner, now + TASK_LEASE_SECONDS, task_id),
+            )
+            if row["session_id"]:
+                conn.execute("UPDATE session SET last_claimed_at = ? WHERE id = ?", (now, row["session_id"]))
+            break
+    # Очередь сдвинулась: позиции ожидающих изменились
+    if touched:
+        progress_bus.publish(*touched, progress_bus.QUEUE)
+    return task_id
+
+
+def _release(task_id: str, owner: str) -> None:
+    """Задача обработана — удалить из очереди (только если аренда всё ещё наша)."""
+    with get_connection() as conn:
+        conn.execute("DELETE FROM queue_item WHERE task_id = ? AND lease_owner = ?", (task_id, owner))
+    progress_bus.publish(progress_bus.QUEUE)
+
+
+def _check_cancelled(task_ids: list) -> None:
+    """
+    Задачи, отменённые в БД (в т.ч. из другого процесса), — отменить их токены, чтобы воркер освободился.
+    Отменённый лидер, результата которого ждут последователи, продолжает работу.
+    """
+    marks = ",".join("?" * len(task_ids))
+    with get_connection() as conn:
+        rows = conn.execute(
+            f"""SELECT id FROM task t WHERE id IN ({marks}) AND status = 'cancelled' AND NOT EXISTS
+                (SELECT 1 FROM task f WHERE f.leader_task_id = t.id AND f.status IN ('pending', 'running'))""",
+            task_ids,
+        ).fetchall()
+    for row in rows:
+        cancellation.cancel(row["id"])
+
+
+def _register_process(conn, now: float) -> None:
+    """Heartbeat процесса в queue_worker: число его живых воркеров; записи давно молчащих процессов удаляются."""
+    with _workers_lock:
+        slots = sum(1 for s in _workers.values() if s["thread"].is_alive())
+    conn.execute(
+        "INSERT OR REPLACE INTO queue_worker (process_id, slots, heartbeat_at) VALUES (?, ?, ?)",
+        (_OWNER_PREFIX, slots, now),
+    )
+    conn.execute("DELETE FROM queue_worker WHERE heartbeat_at < ?", (now - 10 * TASK_LEASE_SECONDS,))
 
 
-def _notify_progress(task_id: str, stage: str, progress: float):
-    for cb in _progress_subscribers.get(task_id, []):
+def _live_slots(conn, now: float) -> int:
+    """Сколько задач очередь выполняет одновременно: QUEUE_SLOTS или воркеры процессов с heartbeat не старше аренды."""
+    if QUEUE_SLOTS > 0:
+        return QUEUE_SLOTS
+    row = conn.execute(
+        "SELECT COALESCE(SUM(slots), 0) AS n FROM queue_worker WHERE heartbeat_at >= ?", (now - TASK_LEASE_SECONDS,),
+    ).fetchone()
+    return max(1, row["n"])
+
+
+def _heartbeat_loop():
+    """
+    Продление аренды задач, которые обрабатывают воркеры этого процесса, проверка их отмены
+    и heartbeat процесса в queue_worker.
+    """
+    interval = max(1.0, TASK_LEASE_SECONDS / 3)
+    next_heartbeat = time.monotonic() + interval
+    while not _stopping.wait(CANCEL_POLL_SECONDS):
+        with _workers_lock:
+            leases = [(s["owner"], s["task_id"]) for s in _workers.values() if s["task_id"]]
+        if leases:
+            try:
+                _check_cancelled([task_id for _, task_id in leases])
+            except Exception as e:
+                logger.warning("[queue] проверка отмены: %s", e)
+        if time.monotonic() < next_heartbeat:
+            continue
+        next_heartbeat = time.monotonic() + interval
         try:
-            cb(stage, progress)
+            now = time.time()
+            with get_connection() as conn:
+                conn.executemany(
+                    "UPDATE queue_item SET lease_expires_at = ? WHERE task_id = ? AND lease_owner = ?",
+                    [(now + TASK_LEASE_SECONDS, task_id, owner) for owner, task_id in leases],
+                )
+                _register_process(conn, now)
         except Exception as e:
-            logger.warning("progress callback error: %s", e)
+            logger.warning("[queue] heartbeat: %s", e)
+
+
+def recover_queue() -> int:
+    """
+    Восстановление после перезапуска: задачи pending/running без записи в очереди (остались от старой
+    in-memory очереди или потеряны) ставятся в очередь заново. Возвращает число восстановленных задач.
+    Задачи с истёкшей арендой отдельно не трогаем — их подберёт _claim.
+    """
+    now = time.time()
+    with get_connection() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        rows = conn.execute(
+            """SELECT id, session_id, params_json FROM task t WHERE status IN ('pending', 'running')
+               AND NOT EXISTS (SELECT 1 FROM queue_item q WHERE q.task_id = t.id)
+               ORDER BY created_at""",
+        ).fetchall()
+        for i, row in enumerate(rows):
+            try:
+                params = json.loads(row["params_json"] or "{}")
+            except ValueError:
+                params = {}
+            conn.execute("UPDATE task SET status = 'pending' WHERE id = ? AND status = 'running'", (row["id"],))
+            conn.execute(
+                """INSERT OR IGNORE INTO queue_item (task_id, state, attempts, enqueued_at, session_id, priority, est_work)
+                   VALUES (?, 'queued', 0, ?, ?, ?, ?)""",
+                (row["id"], now + i * 1e-6, row["session_id"], params.get("priority") or 0, estimate_work(params)),
+            )
+    if rows:
+        logger.info("[queue] Восстановлено задач после перезапуска: %s", len(rows))
+    return len(rows)
 
 
-def _worker():
-    while True:
+def _task_status(task_id: str) -> Optional[str]:
+    try:
+        with get_connection() as conn:
+            row = conn.execute("SELECT status, result_id FROM task WHERE id = ?", (task_id,)).fetchone()
+    except Exception:
+        return None
+    if row:
+        logger.info("[worker] Задача %s обработана: status=%s, result_id=%s", task_id, row["status"], row["result_id"] or "—")
+        return row["status"]
+    logger.info("[worker] Задача %s обработана", task_id)
+    return None
+
+
+def _worker(name: str):
+    state = _workers[name]
+    owner = state["owner"]
+    while not _stopping.is_set():
         try:
-            task_id = _task_queue.get()
+            task_id = _claim(owner)
             if task_id is None:
-                break
-            logger.info("[worker] Взята задача из очереди: task_id=%s", task_id)
+                with _wakeup:
+                    _wakeup.wait(QUEUE_POLL_SECONDS)
+                continue
+            logger.info("[%s] Взята задача из очереди: task_id=%s", name, task_id)
+            with _workers_lock:
+                state.update(task_id=task_id, task_started_at=time.time())
             try:
-                run_pipeline(task_id, progress_cb=lambda s, p: _notify_progress(task_id, s, p))
+                run_pipeline(task_id)
             finally:
-                _task_queue.task_done()
-            from backend.database import get_connection
-            try:
-                with get_connection() as conn:
-                    row = conn.execute("SELECT status, result_id FROM task WHERE id = ?", (task_id,)).fetchone()
-                    if row:
-                        logger.info("[worker] Задача %s обработана: status=%s, result_id=%s, очередь: %s", task_id, row["status"], row["result_id"] or "—", _task_queue.qsize())
-                    else:
-                        logger.info("[worker] Задача %s обработана, очередь: %s", task_id, _task_queue.qsize())
-            except Exception:
-                logger.info("[worker] Задача %s обработана, очередь: %s", task_id, _task_queue.qsize())
+                _release(task_id, owner)
+                with _workers_lock:
+                    state.update(task_id=None, task_started_at=None, last_task_at=time.time())
+                    state["processed"] += 1
+            if _task_status(task_id) == "failed":
+                with _workers_lock:
+                    state["failed"] += 1
         except Exception as e:
-            logger.exception("[worker] Ошибка воркера: %s", e)
+            logger.exception("[%s] Ошибка воркера: %s", name, e)
+            with _workers_lock:
+                state["last_error"] = str(e)[:500]
+            _stopping.wait(QUEUE_POLL_SECONDS)
+    logger.info("[%s] остановлен", name)
 
 
-def start_worker():
-    global _worker_started
-    if _worker_started:
+def start_worker(workers: Optional[int] = None):
+    """
+    Запуск пула из workers (по умолчанию TASK_WORKERS) воркеров и восстановление очереди.
+    Повторный вызов — только перезапуск упавших потоков.
+    """
+    global _heartbeat_thread
+    if _stopping.is_set():
         return
-    _worker_started = True
-    t = threading.Thread(target=_worker, daemon=True)
-    t.start()
-    logger.info("Task worker started")
+    with _workers_lock:
+        started = bool(_workers)
+    if not started:
+        try:
+            recover_queue()
+        except Exception as e:
+            logger.exception("[queue] Восстановление очереди: %s", e)
+    count = max(1, workers or TASK_WORKERS)
+    with _workers_lock:
+        for i in range(count):
+            name = f"worker-{i + 1}"
+            state = _workers.get(name)
+            if state and state["thread"].is_alive():
+                continue
+            t = threading.Thread(target=_worker, args=(name,), name=name, daemon=True)
+            _workers[name] = {
+                "thread": t, "owner": f"{_OWNER_PREFIX}:{name}", "task_id": None, "task_started_at": None,
+                "last_task_at": None, "processed": state["processed"] if state else 0,
+                "failed": state["failed"] if state else 0, "last_error": state["last_error"] if state else None,
+                "started_at": time.time(),
+            }
+            t.start()
+        if _heartbeat_thread is None or not _heartbeat_thread.is_alive():
+            _heartbeat_thread = threading.Thread(target=_heartbeat_loop, name="queue-heartbeat", daemon=True)
+            _heartbeat_thread.start()
+    try:
+        with get_connection() as conn:
+            _register_process(conn, time.time())
+    except Exception as e:
+        logger.warning("[queue] Регистрация воркеров: %s", e)
+    if not started:
+        atexit.register(stop_workers)
+        logger.info("Task workers started: %s", count)
+
 
+def stop_workers(timeout: float = 30) -> bool:
+    """
+    Плавная остановка: новые задачи не берутся, текущие дорабатываются (не дольше timeout секунд).
+    Недоработанные задачи остаются в очереди и после истечения аренды достанутся следующему запуску.
+    Возвращает True, если все воркеры завершились.
+    """
+    _stopping.set()
+    with _wakeup:
+        _wakeup.notify_all()
+    with _workers_lock:
+        threads = [s["thread"] for s in _workers.values()]
+    deadline = time.monotonic() + timeout
+    for t in threads:
+        t.join(max(0.0, deadline - time.monotonic()))
+    alive = [t.name for t in threads if t.is_alive()]
+    try:
+        with get_connection() as conn:
+            conn.execute("DELETE FROM queue_worker WHERE process_id = ?", (_OWNER_PREFIX,))
+    except Exception as e:
+        logger.warning("[queue] Снятие регистрации воркеров: %s", e)
+    if alive:
+        logger.warning("Воркеры не завершились за %s с: %s", timeout, ", ".join(alive))
+    return not alive
 
-def enqueue(task_id: str):
+
+def enqueue(task_id: str, priority: int = 0, est_work: Optional[float] = None):
+    """
+    Поставить задачу в очередь. priority — выше выдаётся раньше; est_work — оценка объёма работы
+    (scheduling.estimate_work; None — по параметрам задачи). При EMBEDDED_WORKERS задачу сразу берёт
+    пул этого процесса, иначе — отдельный процесс воркеров (python -m backend.worker) при очередном опросе.
+    """
+    with get_connection() as conn:
+        if est_work is None:
+            row = conn.execute("SELECT params_json FROM task WHERE id = ?", (task_id,)).fetchone()
+            est_work = estimate_work(json.loads(row["params_json"] or "{}") if row else {})
+        conn.execute(
+            """INSERT OR IGNORE INTO queue_item (task_id, state, attempts, enqueued_at, session_id, priority, est_work)
+               VALUES (?, 'queued', 0, ?, (SELECT session_id FROM task WHERE id = ?), ?, ?)""",
+            (task_id, time.time(), task_id, priority, est_work),
+        )
+    progress_bus.publish(progress_bus.QUEUE)
+    if not EMBEDDED_WORKERS:
+        return
     start_worker()
-    _task_queue.put(task_id)
+    with _wakeup:
+        _wakeup.notify()
+
+
+def get_queue_position(task_id: str) -> Optional[int]:
+    """Позиция задачи в очереди (1 — следующая на выдачу); None — задача не ждёт воркера."""
+    return get_queue_positions([task_id])[task_id]
+
+
+def get_queue_positions(task_ids) -> dict:
+    """Позиции нескольких задач по общему расчёту очереди: {task_id: позиция или None}."""
+    starts, _, _ = _cached_forecast(time.time(), eta.get_model())
+    return {task_id: starts[task_id][0] if task_id in starts else None for task_id in task_ids}
+
+
+def _forecast(conn, now: float, model: dict):
+    """
+    Проигрывание очереди на _live_slots воркерах всех процессов по прогнозу длительностей (services/eta.py).
+    Возвращает {task_id: (позиция, старт через N сек)} для ожидающих задач и через сколько секунд
+    освободится воркер для новой задачи.
+    """
+    order = _schedule(conn, now)
+    leased = conn.execute(
+        """SELECT t.* FROM queue_item q JOIN task t ON t.id = q.task_id
+           WHERE q.state = 'leased' AND q.lease_expires_at >= ?""",
+        (now,),
+    ).fetchall()
+    tasks = {}
+    if order:
+        marks = ",".join("?" * len(order))
+        tasks = {r["id"]: dict(r) for r in conn.execute(
+            f"SELECT * FROM task WHERE id IN ({marks})", [it["task_id"] for it in order],
+        ).fetchall()}
+    slots = sorted(eta.remaining_seconds(dict(r), now, model) for r in leased)
+    slots += [0.0] * max(0, _live_slots(conn, now) - len(slots))
+    heapq.heapify(slots)
+    starts = {}
+    for pos, item in enumerate(order, 1):
+        start = heapq.heappop(slots)
+        starts[item["task_id"]] = (pos, start)
+        task = tasks.get(item["task_id"])
+        heapq.heappush(slots, start + (eta.remaining_seconds(task, now, model) if task else 0.0))
+    return starts, slots[0]
+
+
+def _cached_forecast(now: float, model: dict):
+    """
+    _forecast один раз на поколение очереди: клиенты, разбуженные одним сдвигом очереди (long-poll, SSE, WebSocket),
+    делят один расчёт, пока считает первый — остальные ждут его результата.
+    Возвращает общие (не изменять) starts и wait на момент расчёта и сколько секунд прошло с него.
+    """
+    key = (progress_bus.queue_generation(), model.get("version"))
+    with _forecast_lock:
+        cache = _forecast_cache
+        if cache["key"] != key or not 0 <= now - cache["at"] < FORECAST_CACHE_SECONDS:
+            with get_connection(readonly=True) as conn:
+                starts, wait = _forecast(conn, now, model)
+            cache.update(key=key, at=now, starts=starts, wait=wait)
+        return cache["starts"], cache["wait"], now - cache["at"]
+
+
+def get_task_forecast(task: dict) -> dict:
+    """
+    Позиция в очереди, прогноз начала (predicted_start_at) и окончания (eta_seconds, eta_at) задачи,
+    для выполняемой — progress_estimate (0–99) по прогнозу времени.
+    Последователь объединённой задачи получает прогноз лидера; для завершённых задач — пустые значения.
+    """
+    out = {"queue_position": None, "predicted_start_at": None, "eta_seconds": None, "eta_at": None, "progress_estimate": None}
+    if task["status"] not in ("pending", "running"):
+        return out
+    now = time.time()
+    model = eta.get_model()
+    with get_connection(readonly=True) as conn:
+        if task.get("leader_task_id"):
+            row = conn.execute("SELECT * FROM task WHERE id = ?", (task["leader_task_id"],)).fetchone()
+            task = dict(row) if row else task
+        if task["status"] == "pending":
+            starts, _, elapsed = _cached_forecast(now, model)
+            if task["id"] not in starts:
+                return out
+            position, start = starts[task["id"]]
+            start = max(0.0, start - elapsed)
+            remaining = start + eta.remaining_seconds(task, now, model)
+            out.update(queue_position=position, predicted_start_at=eta.iso_at(start, now))
+        else:
+            remaining = eta.remaining_seconds(task, now, model)
+            total = eta.remaining_seconds(dict(task, status="pending"), now, model)
+            # Доля прогнозируемого времени, которая уже прошла: плавный прогресс между отметками этапов
+            out["progress_estimate"] = max(0, min(99, round(100 * (1 - remaining / total)))) if total else None
+    out.update(eta_seconds=round(remaining), eta_at=eta.iso_at(remaining, now))
+    return out
+
+
+def get_predicted_wait() -> float:
+    """Через сколько секунд воркер возьмёт новую задачу (по прогнозу)."""
+    _, wait, elapsed = _cached_forecast(time.time(), eta.get_model())
+    return round(max(0.0, wait - elapsed))
 
 
 def get_queue_size() -> int:
-    """Число задач в очереди (включая обрабатываемую)."""
-    return _task_queue.qsize()
+    """Число задач, ожидающих воркера (без обрабатываемых; см. get_queue_stats)."""
+    with get_connection(readonly=True) as conn:
+        row = conn.execute(f"SELECT COUNT(*) AS n FROM queue_item WHERE {_AVAILABLE}", (time.time(),)).fetchone()
+    return row["n"]
+
+
+def get_queue_stats() -> dict:
+    """
+    Очередь и пул: queued — ждут воркера, in_flight — в обработке (во всех процессах, по действующим арендам),
+    workers — состояние воркеров этого процесса.
+    """
+    now = time.time()
+    with get_connection(readonly=True) as conn:
+        row = conn.execute(
+            """SELECT SUM(CASE WHEN state = 'leased' AND lease_expires_at >= ? THEN 0 ELSE 1 END) AS queued,
+                      SUM(CASE WHEN state = 'leased' AND lease_expires_at >= ? THEN 1 ELSE 0 END) AS in_flight
+               FROM queue_item""",
+            (now, now),
+        ).fetchone()
+    workers = []
+    with _workers_lock:
+        for name, s in _workers.items():
+            busy = s["task_id"] is not None
+            workers.append({
+                "name": name,
+                "alive": s["thread"].is_alive(),
+                "state": "busy" if busy else ("idle" if s["thread"].is_alive() else "stopped"),
+                "task_id": s["task_id"],
+                "busy_seconds": round(now - s["task_started_at"], 1) if busy else None,
+                "processed": s["processed"],
+                "failed": s["failed"],
+                "last_error": s["last_error"],
+            })
+    return {"queued": row["queued"] or 0, "in_flight": row["in_flight"] or 0, "workers": workers}
+
+
+def _drain_rate(conn, now: float) -> float:
+    """Задач в секунду, которые очередь отдаёт завершёнными (последователи объединённых задач не считаются)."""
+    since = datetime.utcfromtimestamp(now - DRAIN_WINDOW_SECONDS).isoformat()
+    row = conn.execute(
+        """SELECT COUNT(*) AS n FROM task WHERE leader_task_id IS NULL AND status IN ('completed', 'failed')
+           AND updated_at >= ?""",
+        (since,),
+    ).fetchone()
+    if row["n"] >= DRAIN_MIN_SAMPLES:
+        return row["n"] / DRAIN_WINDOW_SECONDS
+    # Истории мало: все воркеры заняты задачами средней по модели длительности
+    task_seconds = eta.remaining_seconds({"status": "pending"}, now, eta.get_model())
+    return _live_slots(conn, now) / max(1.0, task_seconds)
+
+
+def check_admission(conn, session_id: str) -> Optional[dict]:
+    """
+    Допуск новой задачи в очередь; вызывать в транзакции создания задачи.
+    None — можно ставить в очередь, иначе {"reason": "queue_full" | "session_limit", "limit", "retry_after"}.
+    Retry-After — время, за которое при текущей скорости разбора освободится место: для лимита сессии
+    учитывается, что воркеры делятся между сессиями по очереди.
+    """
+    now = time.time()
+    rejection = None
+    if QUEUE_MAX_DEPTH > 0:
+        depth = conn.execute(f"SELECT COUNT(*) AS n FROM queue_item WHERE {_AVAILABLE}", (now,)).fetchone()["n"]
+        if depth >= QUEUE_MAX_DEPTH:
+            rejection = {"reason": "queue_full", "limit": QUEUE_MAX_DEPTH, "backlog": depth - QUEUE_MAX_DEPTH + 1, "share": 1}
+    if rejection is None and QUEUE_MAX_PER_SESSION > 0:
+        own = conn.execute("SELECT COUNT(*) AS n FROM queue_item WHERE session_id = ?", (session_id,)).fetchone()["n"]
+        if own >= QUEUE_MAX_PER_SESSION:
+            sessions = conn.execute("SELECT COUNT(DISTINCT session_id) AS n FROM queue_item").fetchone()["n"]
+            rejection = {"reason": "session_limit", "limit": QUEUE_MAX_PER_SESSION,
+                         "backlog": own - QUEUE_MAX_PER_SESSION + 1, "share": max(1, sessions)}
+    if rejection is None:
+        return None
+    seconds = rejection.pop("backlog") * rejection.pop("share") / _drain_rate(conn, now)
+    rejection["retry_after"] = max(1, min(RETRY_AFTER_MAX_SECONDS, math.ceil(seconds)))
+    return rejection
+
+
+def record_admission(outcome: str) -> None:
+    """outcome: queued, coalesced (присоединена к другой задаче) или причина отказа из check_admission."""
+    with _admission_lock:
+        _admission[outcome] = _admission.get(outcome, 0) + 1
+
+
+def get_admission_stats() -> dict:
+    """Лимиты, счётчики допуска этого процесса и текущая скорость разбора очереди."""
+    with _admission_lock:
+        counts = dict(_admission)
+    with get_connection(readonly=True) as conn:
+        rate = _drain_rate(conn, time.time())
+    return {
+        "max_depth": QUEUE_MAX_DEPTH,
+        "max_per_session": QUEUE_MAX_PER_SESSION,
+        "queued": counts["queued"],
+        "coalesced": counts["coalesced"],
+        "rejected": counts["queue_full"] + counts["session_limit"],
+        "rejected_queue_full": counts["queue_full"],
+        "rejected_session_limit": counts["session_limit"],
+        "drain_rate_per_minute": round(rate * 60, 2),
+    }
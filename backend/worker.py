@@ -0,0 +1,64 @@
+"""Отдельный процесс воркеров: python -m backend.worker [--workers N].
+Берёт задачи из общей очереди в БД (queue_item) — веб-процесс (EMBEDDED_WORKERS=0) только ставит их в очередь.
+Веб и воркеры масштабируются независимо: несколько процессов воркеров на одной машине или на нескольких,
+если у них общие БД и STORAGE_PATH. SIGTERM/SIGINT — плавная остановка: текущие задачи дорабатываются.
+"""
+import argparse
+import logging
+import signal
+import threading
+
+from backend.config import DATA_DIR, LOG_DIR, STORAGE_PATH, UPLOAD_PATH, TASK_WORKERS
+
+LOG_FILE = LOG_DIR / "worker.log"
+log_fmt = "%(asctime)s %(levelname)s [%(name)s] %(message)s"
+
+logger = logging.getLogger("backend.worker")
+
+
+def _setup_logging():
+    LOG_DIR.mkdir(parents=True, exist_ok=True)
+    logging.basicConfig(level=logging.INFO, format=log_fmt)
+    try:
+        fh = logging.FileHandler(LOG_FILE, encoding="utf-8")
+        fh.setFormatter(logging.Formatter(log_fmt))
+        fh.setLevel(logging.DEBUG)
+        logging.getLogger().addHandler(fh)
+    except Exception:
+        pass
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Воркеры очереди задач генератора подкастов")
+    parser.add_argument("--workers", type=int, default=TASK_WORKERS, help=f"число потоков-воркеров (по умолчанию {TASK_WORKERS})")
+    parser.add_argument("--shutdown-timeout", type=float, default=60, help="сколько ждать текущие задачи при остановке, сек")
+    args = parser.parse_args(argv)
+    _setup_logging()
+
+    from backend.database import init_db
+    from backend.tasks_queue import start_worker, stop_workers
+
+    for d in (DATA_DIR, STORAGE_PATH, UPLOAD_PATH):
+        d.mkdir(parents=True, exist_ok=True)
+    init_db()
+
+    stop = threading.Event()
+
+    def _on_signal(signum, frame):
+        logger.info("Получен сигнал %s, останавливаем воркеры", signum)
+        stop.set()
+
+    signal.signal(signal.SIGTERM, _on_signal)
+    signal.signal(signal.SIGINT, _on_signal)
+
+    start_worker(args.workers)
+    logger.info("Воркеры запущены: %s", args.workers)
+    while not stop.wait(1):
+        pass
+    ok = stop_workers(timeout=args.shutdown_timeout)
+    logger.info("Воркеры остановлены%s", "" if ok else " (часть задач вернётся в очередь по истечении аренды)")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""Бенчмарк конкурентного доступа к SQLite: прежняя схема (новое соединение на каждый блок, журнал DELETE)
+против пула соединений backend.database (WAL, synchronous=NORMAL, busy_timeout, соединения только для чтения).
+Нагрузка как у сервиса под опросом статуса: читатели — строка задачи и размер очереди (GET /api/tasks, /ws),
+писатели — обновление прогресса задачи отдельной транзакцией (воркеры пайплайна).
+Запуск из корня проекта (БД создаются во временном каталоге):
+    python scripts/bench_db_concurrency.py
+    python scripts/bench_db_concurrency.py --readers 32 --writers 4 --seconds 10
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+_TMP = Path(tempfile.mkdtemp(prefix="bench_db_"))
+os.environ["DATABASE_URL"] = f"sqlite:///{(_TMP / 'pooled.db').as_posix()}"
+
+from backend.database import get_connection, init_db  # noqa: E402
+
+LEGACY_PATH = _TMP / "legacy.db"
+
+
+@contextmanager
+def legacy_connection(readonly: bool = False):
+    """Прежний get_connection: mkdir и новое соединение с настройками по умолчанию на каждый вызов."""
+    LEGACY_PATH.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(str(LEGACY_PATH))
+    conn.row_factory = sqlite3.Row
+    try:
+        yield conn
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+def prepare(n_tasks: int) -> list:
+    """Схема в обеих БД (legacy — копия схемы, журнал DELETE) и n_tasks выполняемых задач."""
+    init_db()
+    with get_connection() as conn:
+        schema = [r["sql"] for r in conn.execute(
+            """SELECT sql FROM sqlite_master WHERE sql IS NOT NULL AND name NOT LIKE 'sqlite_%'
+               ORDER BY CASE type WHEN 'table' THEN 0 WHEN 'index' THEN 1 ELSE 2 END"""
+        ).fetchall()]
+    with legacy_connection() as conn:
+        conn.execute("PRAGMA journal_mode = DELETE")
+        for sql in schema:
+            conn.execute(sql)
+    now = datetime.utcnow().isoformat()
+    ids = [f"bench-{i}" for i in range(n_tasks)]
+    for connect in (legacy_connection, get_connection):
+        with connect() as conn:
+            conn.execute("INSERT OR IGNORE INTO session (id, created_at) VALUES ('bench', ?)", (now,))
+            conn.executemany(
+                "INSERT INTO task (id, session_id, status, stage, params_json, created_at, updated_at) VALUES (?, 'bench', 'running', 'tts', '{}', ?, ?)",
+                [(task_id, now, now) for task_id in ids],
+            )
+            conn.executemany(
+                "INSERT INTO queue_item (task_id, state, enqueued_at, session_id) VALUES (?, 'leased', ?, 'bench')",
+                [(task_id, time.time()) for task_id in ids],
+            )
+    return ids
+
+
+def _reader(connect, ids, stop, out):
+    rnd = random.Random()
+    while not stop.is_set():
+        started = time.perf_counter()
+        try:
+            with connect(readonly=True) as conn:
+                conn.execute("SELECT * FROM task WHERE id = ?", (rnd.choice(ids),)).fetchone()
+                conn.execute("SELECT COUNT(*) FROM queue_item WHERE state = 'queued'").fetchone()
+        except sqlite3.OperationalError:
+            out["errors"] += 1
+            continue
+        out["lat"].append(time.perf_counter() - started)
+
+
+def _writer(connect, ids, stop, out):
+    rnd = random.Random()
+    while not stop.is_set():
+        started = time.perf_counter()
+        try:
+            with connect() as conn:
+                conn.execute(
+                    "UPDATE task SET progress = ?, activity_message = ?, updated_at = ? WHERE id = ?",
+                    (rnd.randint(0, 99), "Озвучка: реплика", datetime.utcnow().isoformat(), rnd.choice(ids)),
+                )
+        except sqlite3.OperationalError:
+            out["errors"] += 1
+            continue
+        out["lat"].append(time.perf_counter() - started)
+
+
+def _percentile(values: list, q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] * 1000
+
+
+def run(name: str, connect, ids: list, readers: int, writers: int, seconds: float) -> dict:
+    stop = threading.Event()
+    reads = [{"lat": [], "errors": 0} for _ in range(readers)]
+    writes = [{"lat": [], "errors": 0} for _ in range(writers)]
+    threads = [threading.Thread(target=_reader, args=(connect, ids, stop, r)) for r in reads]
+    threads += [threading.Thread(target=_writer, args=(connect, ids, stop, w)) for w in writes]
+    for t in threads:
+        t.start()
+    time.sleep(seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+    read_lat = [x for r in reads for x in r["lat"]]
+    write_lat = [x for w in writes for x in w["lat"]]
+    stats = {
+        "reads_per_s": len(read_lat) / seconds,
+        "read_p50": _percentile(read_lat, 0.5),
+        "read_p99": _percentile(read_lat, 0.99),
+        "writes_per_s": len(write_lat) / seconds,
+        "write_p50": _percentile(write_lat, 0.5),
+        "write_p99": _percentile(write_lat, 0.99),
+        "errors": sum(r["errors"] for r in reads) + sum(w["errors"] for w in writes),
+    }
+    print(
+        f"  {name:<8} чтений/с={stats['reads_per_s']:8.0f}  p50={stats['read_p50']:6.2f} мс  p99={stats['read_p99']:7.2f} мс | "
+        f"записей/с={stats['writes_per_s']:6.0f}  p50={stats['write_p50']:6.2f} мс  p99={stats['write_p99']:7.2f} мс | "
+        f"ошибок блокировки={stats['errors']}"
+    )
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--readers", type=int, default=16, help="потоков-читателей")
+    parser.add_argument("--writers", type=int, default=2, help="потоков-писателей")
+    parser.add_argument("--seconds", type=float, default=5.0, help="длительность каждого прогона, с")
+    parser.add_argument("--tasks", type=int, default=500, help="задач в БД")
+    args = parser.parse_args()
+    ids = prepare(args.tasks)
+    print(f"БД: {_TMP}; читателей={args.readers}, писателей={args.writers}, {args.seconds:.0f} с на прогон")
+    before = run("прежняя", legacy_connection, ids, args.readers, args.writers, args.seconds)
+    after = run("пул+WAL", get_connection, ids, args.readers, args.writers, args.seconds)
+    print(
+        f"  чтения: x{after['reads_per_s'] / max(before['reads_per_s'], 1e-9):.2f}, "
+        f"записи: x{after['writes_per_s'] / max(before['writes_per_s'], 1e-9):.2f}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""Бенчмарк извлечения текста из HTML: density (lxml + плотность текста) против soup (BeautifulSoup, весь body).
+Корпус — каталог с .html-файлами или синтетические «тяжёлые» страницы (меню, сайдбары, комментарии, скрипты).
+Запуск из корня проекта:
+    python scripts/bench_html_extract.py                      # синтетический корпус
+    python scripts/bench_html_extract.py path/to/pages --repeat 5
+    python scripts/bench_html_extract.py --save-corpus /tmp/corpus   # сохранить синтетический корпус
+"""
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from backend.services.text_extraction import extract_from_html  # noqa: E402
+
+_WORDS = (
+    "подкаст исследование команда результат данные рынок продукт стратегия клиент сервис развитие "
+    "технология решение анализ проект опыт вопрос задача модель качество процесс"
+).split()
+
+
+def _sentence(rnd: random.Random, n: int) -> str:
+    return " ".join(rnd.choice(_WORDS) for _ in range(n)).capitalize() + "."
+
+
+def synthetic_page(rnd: random.Random, paragraphs: int, comments: int, nav_links: int) -> str:
+    """Страница новостного сайта: статья окружена навигацией, виджетами, комментариями и скриптами."""
+    nav = "".join(f'<li><a href="/s/{i}">{rnd.choice(_WORDS)} {i}</a></li>' for i in range(nav_links))
+    article = "".join(
+        f"<p>{' '.join(_sentence(rnd, rnd.randint(8, 18)) for _ in range(rnd.randint(2, 5)))}"
+        f' <a href="/ref/{i}">{rnd.choice(_WORDS)}</a>, {_sentence(rnd, 6)}</p>'
+        for i in range(paragraphs)
+    )
+    sidebar = "".join(
+        f'<div class="widget"><h3>{_sentence(rnd, 3)}</h3><ul>'
+        + "".join(f'<li><a href="/w/{j}">{_sentence(rnd, 5)}</a></li>' for j in range(8))
+        + "</ul></div>"
+        for _ in range(6)
+    )
+    thread = "".join(
+        f'<div class="comment"><span class="author">user{i}</span><p>{_sentence(rnd, rnd.randint(6, 30))}</p>'
+        f'<a href="#reply-{i}">Ответить</a></div>'
+        for i in range(comments)
+    )
+    script = "<script>window.__STATE__ = {" + ",".join(f'"k{i}": "{"x" * 40}"' for i in range(400)) + "};</script>"
+    style = "<style>" + "".join(f".c{i}{{margin:{i}px}}" for i in range(300)) + "</style>"
+    return (
+        f"<!DOCTYPE html><html><head><meta charset='utf-8'><title>{_sentence(rnd, 5)}</title>{style}{script}</head>"
+        f'<body><header><div class="logo">Logo</div><nav><ul>{nav}</ul></nav></header>'
+        f'<div class="layout"><main><article class="post-content"><h1>{_sentence(rnd, 7)}</h1>{article}</article>'
+        f'<section id="comments" class="comments">{thread}</section></main>'
+        f'<aside class="sidebar">{sidebar}</aside></div>'
+        f'<div class="related-posts">' + "".join(f'<a href="/r/{i}">{_sentence(rnd, 6)}</a>' for i in range(20)) + "</div>"
+        f"<footer>{_sentence(rnd, 20)}</footer>{script}</body></html>"
+    )
+
+
+def synthetic_corpus(count: int, seed: int = 7) -> list:
+    rnd = random.Random(seed)
+    return [
+        (f"synthetic_{i:02d}.html", synthetic_page(rnd, rnd.randint(8, 60), rnd.randint(0, 300), rnd.randint(30, 400)).encode("utf-8"))
+        for i in range(count)
+    ]
+
+
+def _time(extractor: str, content: bytes, repeat: int):
+    best, text = None, ""
+    for _ in range(repeat):
+        started = time.perf_counter()
+        text, _, _ = extract_from_html(content, extractor=extractor)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, text
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("corpus", nargs="?", help="каталог с .html (по умолчанию — синтетический корпус)")
+    parser.add_argument("--pages", type=int, default=20, help="число синтетических страниц")
+    parser.add_argument("--repeat", type=int, default=3, help="повторов на страницу (берётся лучшее время)")
+    parser.add_argument("--save-corpus", help="сохранить синтетический корпус в каталог и выйти")
+    args = parser.parse_args()
+    if args.save_corpus:
+        out = Path(args.save_corpus)
+        out.mkdir(parents=True, exist_ok=True)
+        for name, content in synthetic_corpus(args.pages):
+            (out / name).write_bytes(content)
+        print(f"Сохранено страниц: {args.pages} в {out}")
+        return
+    if args.corpus:
+        pages = [(p.name, p.read_bytes()) for p in sorted(Path(args.corpus).glob("*.htm*"))]
+    else:
+        pages = synthetic_corpus(args.pages)
+    totals = {"soup": [0.0, 0], "density": [0.0, 0]}
+    print(f"{'страница':<28}{'КБ':>7}{'soup, мс':>11}{'density, мс':>13}{'soup, симв':>12}{'density, симв':>15}")
+    for name, content in pages:
+        row = {}
+        for extractor in ("soup", "density"):
+            elapsed, text = _time(extractor, content, args.repeat)
+            totals[extractor][0] += elapsed
+            totals[extractor][1] += len(text)
+            row[extractor] = (elapsed, len(text))
+        print(
+            f"{name[:27]:<28}{len(content) // 1024:>7}{row['soup'][0] * 1000:>11.1f}{row['density'][0] * 1000:>13.1f}"
+            f"{row['soup'][1]:>12}{row['density'][1]:>15}"
+        )
+    soup_t, soup_chars = totals["soup"]
+    dens_t, dens_chars = totals["density"]
+    print(f"\nВсего страниц: {len(pages)}")
+    print(f"soup:    {soup_t:.3f} с, {soup_chars} символов")
+    print(f"density: {dens_t:.3f} с, {dens_chars} символов")
+    if dens_t and soup_chars:
+        print(f"ускорение: x{soup_t / dens_t:.2f}, объём текста: {dens_chars / soup_chars:.0%} от soup")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""Бенчмарк маскирования ПД: однопроходный mask_pii против прежней схемы (finditer + sub на каждый паттерн).
+Запуск из корня проекта:
+    python scripts/bench_mask_pii.py                 # синтетический текст ~10 МБ
+    python scripts/bench_mask_pii.py doc1.pdf doc2.pdf --repeat 3
+"""
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from backend.services.text_extraction import (  # noqa: E402
+    PHONE_PATTERNS,
+    EMAIL_OR_CONTACT_PATTERN,
+    mask_pii,
+    _extract_raw_pdf,
+)
+
+
+def mask_pii_multipass(text: str):
+    """Прежняя реализация: 5 паттернов телефонов и паттерн контактов, каждый — finditer и sub (12 проходов)."""
+    removed_phones = []
+    removed_contacts = []
+    out = text
+    for pat in PHONE_PATTERNS:
+        for m in pat.finditer(out):
+            removed_phones.append(m.group(0))
+        out = pat.sub("[телефон скрыт]", out)
+    for m in EMAIL_OR_CONTACT_PATTERN.finditer(out):
+        removed_contacts.append(m.group(0))
+    out = EMAIL_OR_CONTACT_PATTERN.sub("[контакт скрыт]", out)
+    return out, removed_phones, removed_contacts
+
+
+_WORDS = (
+    "подкаст материал компания клиент договор услуга отчёт квартал рост выручка продукт команда "
+    "исследование данные результат рынок стратегия документ раздел таблица приложение"
+).split()
+
+
+def synthetic_text(size_mb: float, seed: int = 42) -> str:
+    """Текст в духе PDF-отчёта: абзацы, числа, изредка телефоны и e-mail."""
+    rnd = random.Random(seed)
+    target = int(size_mb * 1024 * 1024)
+    parts = []
+    total = 0
+    while total < target:
+        words = [rnd.choice(_WORDS) for _ in range(rnd.randint(8, 25))]
+        r = rnd.random()
+        if r < 0.03:
+            words.insert(rnd.randrange(len(words)), f"+7 ({rnd.randint(900, 999)}) {rnd.randint(100, 999)}-{rnd.randint(10, 99)}-{rnd.randint(10, 99)}")
+        elif r < 0.05:
+            words.insert(rnd.randrange(len(words)), f"user{rnd.randint(1, 999)}@example.com")
+        elif r < 0.15:
+            words.insert(rnd.randrange(len(words)), f"{rnd.randint(1, 2025)} г., стр. {rnd.randint(1, 300)}")
+        line = " ".join(words)
+        parts.append(line)
+        total += len(line) + 1
+    return "\n".join(parts)
+
+
+def _bench(fn, text: str, repeat: int):
+    best = None
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn(text)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def run(name: str, text: str, repeat: int) -> None:
+    old_t, (old_out, old_phones, old_contacts) = _bench(mask_pii_multipass, text, repeat)
+    new_t, (new_out, new_phones, new_contacts) = _bench(mask_pii, text, repeat)
+    mb = len(text.encode("utf-8")) / (1024 * 1024)
+    print(f"{name}: {mb:.1f} МБ, {len(text)} символов")
+    print(f"  многопроходный: {old_t:.3f} с  телефонов={len(old_phones)} контактов={len(old_contacts)}")
+    print(f"  однопроходный:  {new_t:.3f} с  телефонов={len(new_phones)} контактов={len(new_contacts)}")
+    print(f"  ускорение: x{old_t / new_t:.2f}, совпадение текста: {'да' if old_out == new_out else 'нет'}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("pdf", nargs="*", help="PDF-файлы (по умолчанию — синтетический текст)")
+    parser.add_argument("--size-mb", type=float, default=10.0, help="размер синтетического текста, МБ")
+    parser.add_argument("--repeat", type=int, default=3, help="число повторов (берётся лучшее время)")
+    args = parser.parse_args()
+    if args.pdf:
+        import backend.services.text_extraction as te
+        te.MAX_SIZE = 1 << 40  # бенчмарк: без лимита размера файла
+        for p in args.pdf:
+            run(p, _extract_raw_pdf(Path(p)), args.repeat)
+    else:
+        run("synthetic", synthetic_text(args.size_mb), args.repeat)
+
+
+if __name__ == "__main__":
+    main()
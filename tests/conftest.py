@@ -1,5 +1,7 @@
 """Pytest fixtures."""
+import os
 import sys
+import tempfile
 from pathlib import Path
 
 import pytest
@@ -7,10 +9,35 @@ import pytest
 # Project root
 sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
 
+# Отдельные БД и каталоги для тестов (до импорта backend.config)
+_TEST_DIR = Path(tempfile.mkdtemp(prefix="podcast_gen_tests_"))
+os.environ["DATABASE_URL"] = f"sqlite:///{(_TEST_DIR / 'test.db').as_posix()}"
+os.environ["STORAGE_PATH"] = str(_TEST_DIR / "storage")
+os.environ["UPLOAD_PATH"] = str(_TEST_DIR / "uploads")
+os.environ["LOG_PATH"] = str(_TEST_DIR / "logs")
+
 
 @pytest.fixture
 def client():
     from backend.app import app
     app.config["TESTING"] = True
     with app.test_client() as c:
+        with c.session_transaction() as sess:
+            sess["logged_in"] = True
         yield c
+
+
+@pytest.fixture
+def pages(monkeypatch):
+    """Страницы для /api/tasks с url без сети: {url: html}; адрес без записи — страница с самим адресом."""
+    import hashlib
+    import backend.services.extraction_cache as extraction_cache
+    from backend.services.http_fetch import FetchResult
+    content = {}
+
+    def fake_fetch(url, **kwargs):
+        body = content.get(url, f"<html><body><p>Статья по адресу {url}.</p></body></html>").encode("utf-8")
+        return FetchResult(url, body, "utf-8", hashlib.sha256(body).hexdigest(), None, None, False)
+
+    monkeypatch.setattr(extraction_cache, "fetch_url", fake_fetch)
+    return content
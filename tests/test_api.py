@@ -32,3 +32,322 @@ def test_music_list(client):
     assert r.status_code == 200
     data = r.get_json()
     assert "tracks" in data
+
+
+def test_usage_recorded_per_task(client):
+    from backend.services.usage import record_call, task_context
+    task_id = "usage-test-task"
+    with task_context(task_id):
+        record_call("tts", "speech", 120, chars=40, bytes_received=1000)
+        record_call("tts", "speech", 80, retries=1, chars=10, bytes_received=500)
+        record_call("llm", "script", 900, prompt_tokens=300, completion_tokens=150)
+    r = client.get("/api/usage?hours=1")
+    assert r.status_code == 200
+    data = r.get_json()
+    tts = data["by_service"]["tts"]
+    assert tts["calls"] >= 2
+    assert tts["retries"] >= 1
+    assert any(t["task_id"] == task_id for t in data["top_tasks"])
+    from backend.services.usage import get_task_usage
+    usage = get_task_usage(task_id)
+    assert usage["by_service"]["tts"]["chars"] == 50
+    assert usage["by_service"]["llm"]["prompt_tokens"] == 300
+    assert usage["latency_ms_total"] == 1100
+
+
+def test_extract_returns_extraction_id_reused_by_task(client, tmp_path, monkeypatch):
+    import io
+    import json
+    from docx import Document
+    import backend.routes.api as api
+    monkeypatch.setattr(api, "enqueue", lambda task_id, **kwargs: None)
+    doc = Document()
+    doc.add_paragraph("Текст для кэша извлечения.")
+    buf = io.BytesIO()
+    doc.save(buf)
+    content = buf.getvalue()
+    r = client.post("/api/extract", data={"file": (io.BytesIO(content), "a.docx")}, content_type="multipart/form-data")
+    assert r.status_code == 200
+    extraction_id = r.get_json()["extraction_id"]
+    assert extraction_id
+    # Тот же файл под другим именем — попадание в кэш по хешу содержимого
+    r = client.post("/api/extract", data={"file": (io.BytesIO(content), "b.docx")}, content_type="multipart/form-data")
+    assert r.get_json()["extraction_id"] == extraction_id
+    r = client.post("/api/tasks", json={"extraction_id": extraction_id})
+    assert r.status_code == 201
+    from backend.database import get_connection
+    with get_connection() as conn:
+        row = conn.execute("SELECT params_json FROM task WHERE id = ?", (r.get_json()["task_id"],)).fetchone()
+    params = json.loads(row["params_json"])
+    assert params["source"] == "extraction"
+    assert params["extraction_id"] == extraction_id
+
+
+def test_upload_saved_under_unique_name_with_hash(client, tmp_path, monkeypatch):
+    import hashlib
+    import io
+    import json
+    import backend.routes.api as api
+    monkeypatch.setattr(api, "enqueue", lambda task_id, **kwargs: None)
+    content = b"%PDF-1.4 not really a pdf"
+    ids = []
+    for _ in range(2):
+        r = client.post("/api/tasks", data={"file": (io.BytesIO(content), "same.pdf"), "reuse": "0"}, content_type="multipart/form-data")
+        assert r.status_code == 201
+        ids.append(r.get_json()["task_id"])
+    from backend.database import get_connection
+    with get_connection() as conn:
+        params = [json.loads(conn.execute("SELECT params_json FROM task WHERE id = ?", (i,)).fetchone()["params_json"]) for i in ids]
+    assert params[0]["file_path"] != params[1]["file_path"]
+    assert params[0]["content_hash"] == hashlib.sha256(content).hexdigest()
+    assert params[0]["filename"] == "same.pdf"
+
+
+def test_identical_tasks_are_coalesced(client, monkeypatch, pages):
+    import backend.routes.api as api
+    from backend.database import get_connection
+    queued = []
+    monkeypatch.setattr(api, "enqueue", lambda task_id, **kwargs: queued.append(task_id))
+    body = {"url": "https://example.com/coalesce", "style": "formal"}
+    leader = client.post("/api/tasks", json=body).get_json()
+    follower = client.post("/api/tasks", json=dict(body, priority=5)).get_json()
+    other = client.post("/api/tasks", json=dict(body, style="energetic")).get_json()
+    assert queued == [leader["task_id"], other["task_id"]]
+    assert follower["coalesced_with"] == leader["task_id"] and follower["status"] == "pending"
+    assert "coalesced_with" not in other
+
+    # Статус лидера переносится на последователя; готовый результат отдаётся новой задаче сразу
+    from backend.services.pipeline import _update_task
+    _update_task(leader["task_id"], "running", "tts", progress=50)
+    assert client.get(f"/api/tasks/{follower['task_id']}").get_json()["progress"] == 50
+    now = api._now()
+    with get_connection() as conn:
+        conn.execute(
+            "INSERT INTO result (id, task_id, mp3_path, cover_path, rss_path, title, created_at) VALUES ('res-c', ?, 'x.mp3', '', 'f.xml', 't', ?)",
+            (leader["task_id"], now),
+        )
+        conn.execute("UPDATE task SET status = 'completed', result_id = 'res-c' WHERE id IN (?, ?)", (leader["task_id"], follower["task_id"]))
+    late = client.post("/api/tasks", json=body).get_json()
+    assert late["status"] == "completed" and late["coalesced_with"] == leader["task_id"]
+    assert client.get(f"/api/tasks/{late['task_id']}").get_json()["result"]["title"] == "t"
+    fresh = client.post("/api/tasks", json=dict(body, reuse=False)).get_json()
+    assert fresh["status"] == "pending" and "coalesced_with" not in fresh
+    # Тот же адрес, но статья изменилась — новая генерация, а не старый выпуск
+    pages[body["url"]] = "<html><body><p>Вторая версия статьи, текст обновлён.</p></body></html>"
+    changed = client.post("/api/tasks", json=body).get_json()
+    assert changed["status"] == "pending" and "coalesced_with" not in changed
+
+
+def test_upload_over_limit_rejected(client, tmp_path):
+    import io
+    from werkzeug.datastructures import FileStorage
+    from backend.config import MAX_CONTENT_LENGTH
+    from backend.services.uploads import save_upload
+    with pytest.raises(ValueError):
+        save_upload(FileStorage(io.BytesIO(b"x" * 2048), "big.pdf"), tmp_path, max_bytes=1024)
+    assert list(tmp_path.iterdir()) == []
+    client.application.config["MAX_CONTENT_LENGTH"] = 1024
+    try:
+        r = client.post("/api/extract", data={"file": (io.BytesIO(b"x" * 4096), "big.pdf")}, content_type="multipart/form-data")
+    finally:
+        client.application.config["MAX_CONTENT_LENGTH"] = MAX_CONTENT_LENGTH
+    assert r.status_code == 413
+    assert "error" in r.get_json()
+
+
+def test_extract_batch_streams_ndjson_with_host_limit(client, monkeypatch):
+    import io
+    import json
+    import threading
+    import time
+    from docx import Document
+    import backend.services.batch_extract as batch
+    active, peak, lock = {}, {}, threading.Lock()
+
+    def fake_url(url):
+        host = url.split("/")[2]
+        with lock:
+            active[host] = active.get(host, 0) + 1
+            peak[host] = max(peak.get(host, 0), active[host])
+        time.sleep(0.05)
+        with lock:
+            active[host] -= 1
+        if "broken" in url:
+            raise ValueError("Страница недоступна")
+        return f"Текст {url}", [], [], None
+
+    monkeypatch.setattr(batch, "extract_url_cached", fake_url)
+    monkeypatch.setattr(batch, "EXTRACT_BATCH_PER_HOST", 2)
+    monkeypatch.setattr(batch, "_hosts", {})
+    doc = Document()
+    doc.add_paragraph("Текст из файла пакета.")
+    buf = io.BytesIO()
+    doc.save(buf)
+    urls = [f"https://a.example/{i}" for i in range(6)] + ["https://b.example/broken"]
+    r = client.post(
+        "/api/extract/batch",
+        data={"url": urls, "file": (io.BytesIO(buf.getvalue()), "doc.docx")},
+        content_type="multipart/form-data",
+    )
+    assert r.status_code == 200 and r.mimetype == "application/x-ndjson"
+    lines = [json.loads(line) for line in r.get_data(as_text=True).splitlines()]
+    assert lines[-1] == {"done": True, "total": 8, "ok": 7, "failed": 1}
+    by_index = {e["index"]: e for e in lines[:-1]}
+    assert sorted(by_index) == list(range(8))
+    assert by_index[6]["error"] == "Страница недоступна"
+    assert "Текст из файла пакета." in by_index[7]["text"]
+    assert peak["a.example"] <= 2
+    deadline = time.monotonic() + 2
+    while batch._hosts and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert batch._hosts == {}
+
+
+def test_extract_batch_busy_host_does_not_block_others(monkeypatch):
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+    import backend.services.batch_extract as batch
+    release = threading.Event()
+
+    def fake_url(url):
+        if "slow.example" in url:
+            assert release.wait(5)
+        return f"Текст {url}", [], [], None
+
+    monkeypatch.setattr(batch, "extract_url_cached", fake_url)
+    monkeypatch.setattr(batch, "EXTRACT_BATCH_PER_HOST", 1)
+    monkeypatch.setattr(batch, "_hosts", {})
+    monkeypatch.setattr(batch, "_executor", ThreadPoolExecutor(max_workers=2))
+    items = [{"url": f"https://slow.example/{i}"} for i in range(4)] + [{"url": "https://fast.example/1"}]
+    results = batch.iter_batch(items)
+    try:
+        # Одна загрузка slow.example занимает поток, остальные ждут в очереди хоста — второй поток свободен
+        assert next(results)["source"] == "https://fast.example/1"
+    finally:
+        release.set()
+    assert sorted(e["index"] for e in results) == [0, 1, 2, 3]
+
+
+def test_extract_batch_validation(client):
+    r = client.post("/api/extract/batch", json={"urls": []})
+    assert r.status_code == 400
+    r = client.post("/api/extract/batch", json={"urls": ["https://x.example/%d" % i for i in range(1000)]})
+    assert r.status_code == 400
+
+
+def test_task_priority_validated_and_queue_position_returned(client, monkeypatch, pages):
+    import backend.routes.api as api
+    monkeypatch.setattr(api, "enqueue", lambda task_id, **kwargs: None)
+    r = client.post("/api/tasks", json={"url": "https://example.com/a", "priority": "urgent"})
+    assert r.status_code == 400
+    r = client.post("/api/tasks", json={"url": "https://example.com/a", "priority": 3})
+    assert r.status_code == 201
+    assert "queue_position" in r.get_json()
+
+
+def test_admission_limits_return_429_with_retry_after(client, monkeypatch, pages):
+    import backend.tasks_queue as tq
+    from backend.database import get_connection
+    monkeypatch.setattr(tq, "_claim", lambda owner: None)  # задачи остаются в очереди
+    monkeypatch.setattr(tq, "QUEUE_MAX_DEPTH", 0)
+    monkeypatch.setattr(tq, "QUEUE_MAX_PER_SESSION", 2)
+    headers = {"X-Session-Id": "admission-session"}
+    before = client.get("/api/status").get_json()["admission"]
+    try:
+        for i in range(2):
+            r = client.post("/api/tasks", json={"url": f"https://example.com/adm-{i}"}, headers=headers)
+            assert r.status_code == 201
+        r = client.post("/api/tasks", json={"url": "https://example.com/adm-2"}, headers=headers)
+        assert r.status_code == 429
+        data = r.get_json()
+        assert data["reason"] == "session_limit" and data["recommendation"]
+        assert int(r.headers["Retry-After"]) == data["retry_after"] >= 1
+        # Присоединение к уже поставленной задаче лимит не расходует
+        assert client.post("/api/tasks", json={"url": "https://example.com/adm-0"}, headers=headers).status_code == 201
+        # Другая сессия упирается в общий лимит очереди
+        monkeypatch.setattr(tq, "QUEUE_MAX_DEPTH", tq.get_queue_size())
+        r = client.post("/api/tasks", json={"url": "https://example.com/adm-3"}, headers={"X-Session-Id": "admission-other"})
+        assert r.status_code == 429 and r.get_json()["reason"] == "queue_full"
+        after = client.get("/api/status").get_json()["admission"]
+        assert after["queued"] - before["queued"] == 2
+        assert after["coalesced"] - before["coalesced"] == 1
+        assert after["rejected"] - before["rejected"] == 2
+    finally:
+        with get_connection() as conn:
+            conn.execute("DELETE FROM queue_item WHERE session_id = 'admission-session'")
+
+
+def test_task_long_poll_and_events_stream(client):
+    import json
+    import threading
+    import time
+    from backend.database import get_connection
+    from backend.services.pipeline import _update_task
+    now = "2024-01-01T00:00:00"
+    with get_connection() as conn:
+        conn.execute("INSERT OR IGNORE INTO session (id, created_at) VALUES ('lp', ?)", (now,))
+        conn.execute(
+            "INSERT INTO task (id, session_id, status, stage, params_json, created_at, updated_at) VALUES ('lp-1', 'lp', 'running', 'tts', '{}', ?, ?)",
+            (now, now),
+        )
+    v0 = client.get("/api/tasks/lp-1").get_json()["version"]
+
+    # Без изменений long-poll ждёт до wait; изменение задачи отвечает сразу с новой версией
+    t0 = time.monotonic()
+    assert client.get(f"/api/tasks/lp-1?since={v0}&wait=0.3").get_json()["version"] == v0
+    assert time.monotonic() - t0 >= 0.3
+    timer = threading.Timer(0.2, lambda: _update_task("lp-1", "running", "tts", progress=60))
+    timer.start()
+    t0 = time.monotonic()
+    data = client.get(f"/api/tasks/lp-1?since={v0}&wait=10").get_json()
+    assert time.monotonic() - t0 < 5
+    assert data["version"] > v0 and data["progress"] == 60
+    assert data["usage"] is None  # расход API — в итоговом ответе
+
+    # SSE: текущее состояние, затем изменения до завершения задачи
+    resp = client.get("/api/tasks/lp-1/events", buffered=False)
+    assert resp.mimetype == "text/event-stream"
+    threading.Timer(0.2, lambda: _update_task("lp-1", "failed", "tts", error_message="boom")).start()
+    body = b"".join(resp.response).decode("utf-8")
+    events = [json.loads(line[6:]) for line in body.splitlines() if line.startswith("data: {\"")]
+    assert events[0]["progress"] == 60 and events[-1]["status"] == "failed"
+    assert events[0]["usage"] is None and events[-1]["usage"] is not None
+    assert body.rstrip().endswith("event: end\ndata: {}")
+    assert client.get("/api/tasks/missing/events").status_code == 404
+
+
+def test_podcasts_keyset_pagination_and_filters(client):
+    from backend.database import get_connection
+    now = "2031-01-01T00:00:00"
+    with get_connection() as conn:
+        conn.execute("INSERT OR IGNORE INTO session (id, created_at) VALUES ('pod-a', ?), ('pod-b', ?)", (now, now))
+        for i in range(5):
+            created = f"2031-01-0{i + 1}T12:00:00"
+            session_id = "pod-a" if i < 3 else "pod-b"
+            conn.execute(
+                "INSERT INTO task (id, session_id, status, result_id, created_at, updated_at) VALUES (?, ?, 'completed', ?, ?, ?)",
+                (f"pod-task-{i}", session_id, f"pod-res-{i}", created, created),
+            )
+            conn.execute(
+                "INSERT INTO result (id, task_id, title, created_at) VALUES (?, ?, ?, ?)",
+                (f"pod-res-{i}", f"pod-task-{i}", f"Эпизод {i}", created),
+            )
+
+    seen, cursor = [], None
+    for _ in range(3):
+        r = client.get("/api/podcasts", query_string={"session_id": "pod-a", "limit": 2, **({"cursor": cursor} if cursor else {})})
+        assert r.status_code == 200
+        data = r.get_json()
+        seen += [p["task_id"] for p in data["podcasts"]]
+        cursor = data["next_cursor"]
+        if not cursor:
+            break
+    assert seen == ["pod-task-2", "pod-task-1", "pod-task-0"]
+
+    r = client.get("/api/podcasts", query_string={"from": "2031-01-02", "to": "2031-01-04"})
+    assert [p["task_id"] for p in r.get_json()["podcasts"]] == ["pod-task-3", "pod-task-2", "pod-task-1"]
+
+    for bad in ({"cursor": "not-a-cursor"}, {"from": "вчера"}):
+        r = client.get("/api/podcasts", query_string=bad)
+        assert r.status_code == 400
+        assert "recommendation" in r.get_json()
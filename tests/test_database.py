@@ -0,0 +1,36 @@
+import sqlite3
+
+import pytest
+
+from backend.database import get_connection, init_db
+
+
+@pytest.fixture(autouse=True)
+def _db():
+    init_db()
+
+
+def test_connections_are_reused_with_wal_and_readonly_mode():
+    with get_connection() as conn:
+        first = conn
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        assert conn.execute("PRAGMA synchronous").fetchone()[0] == 1  # NORMAL
+        # Вложенный блок — другое соединение и своя транзакция
+        with get_connection() as inner:
+            assert inner is not conn
+    with get_connection() as conn:
+        assert conn is first
+
+    with get_connection(readonly=True) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM task").fetchone()[0] >= 0
+        with pytest.raises(sqlite3.OperationalError):
+            conn.execute("DELETE FROM task")
+
+
+def test_failed_block_rolls_back_and_connection_stays_usable():
+    with pytest.raises(RuntimeError):
+        with get_connection() as conn:
+            conn.execute("INSERT INTO session (id, created_at) VALUES ('db-rollback', 'x')")
+            raise RuntimeError("boom")
+    with get_connection() as conn:
+        assert conn.execute("SELECT 1 FROM session WHERE id = 'db-rollback'").fetchone() is None
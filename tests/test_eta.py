@@ -0,0 +1,63 @@
+import json
+from datetime import datetime
+
+import pytest
+
+import backend.services.eta as eta
+import backend.tasks_queue as tq
+from backend.database import get_connection, init_db
+
+
+@pytest.fixture(autouse=True)
+def _db():
+    init_db()
+
+
+def test_stage_model_learns_from_recorded_durations():
+    with get_connection() as conn:
+        conn.execute("DELETE FROM stage_timing")
+    for replicas in (10, 20, 30, 40):
+        features = {"text_length": 5000, "replicas": replicas, "cache_hit_ratio": 0.0, "duration_minutes": 4}
+        eta.record_stage("eta-fit", "tts", 1 + 2 * replicas, features)
+    a, b = eta.get_model()["coefs"]["tts"]
+    assert a == pytest.approx(1, abs=0.01) and b == pytest.approx(2, abs=0.01)
+
+    # Кэш TTS уменьшает прогноз озвучки; новый замер сразу меняет модель
+    model = eta.get_model()
+    cold = eta.predict_stage("tts", {"replicas": 20, "cache_hit_ratio": 0.0}, model)
+    warm = eta.predict_stage("tts", {"replicas": 20, "cache_hit_ratio": 0.5}, model)
+    assert warm < cold
+    eta.record_stage("eta-fit", "tts", 500, {"text_length": 5000, "replicas": 20, "cache_hit_ratio": 0.0})
+    assert eta.get_model()["coefs"]["tts"] != (a, b)
+
+
+def test_forecast_for_queued_and_running_tasks(monkeypatch):
+    monkeypatch.setattr(tq, "_claim", lambda owner: None)  # задачи остаются в очереди
+    monkeypatch.setattr(tq, "QUEUE_SLOTS", 1)
+    now = datetime.utcnow().isoformat()
+    with get_connection() as conn:
+        for task_id in ("eta-1", "eta-2"):
+            conn.execute(
+                "INSERT INTO task (id, session_id, status, stage, params_json, created_at, updated_at) VALUES (?, 'eta', 'pending', '', ?, ?, ?)",
+                (task_id, json.dumps({"duration": "very_short"}), now, now),
+            )
+    try:
+        tq.enqueue("eta-1")
+        tq.enqueue("eta-2")
+        first = tq.get_task_forecast({"id": "eta-1", "status": "pending"})
+        second = tq.get_task_forecast({"id": "eta-2", "status": "pending"})
+        assert second["queue_position"] == first["queue_position"] + 1
+        assert second["predicted_start_at"] > first["predicted_start_at"]
+        assert second["eta_seconds"] > first["eta_seconds"] > 0
+
+        running = {"id": "eta-1", "status": "running", "stage": "tts", "stage_started_at": None,
+                   "params_json": json.dumps({"duration": "very_short"}), "features_json": json.dumps({"text_length": 3000, "replicas": 6})}
+        with get_connection() as conn:
+            conn.execute("UPDATE task SET status = 'running', stage = 'tts' WHERE id = 'eta-1'")
+        forecast = tq.get_task_forecast(running)
+        assert forecast["queue_position"] is None and forecast["eta_seconds"] is not None
+        assert 0 < forecast["progress_estimate"] < 100
+    finally:
+        with get_connection() as conn:
+            conn.execute("DELETE FROM queue_item WHERE task_id IN ('eta-1', 'eta-2')")
+            conn.execute("UPDATE task SET status = 'cancelled' WHERE id IN ('eta-1', 'eta-2')")
@@ -0,0 +1,83 @@
+import threading
+import time
+
+import pytest
+
+from backend.services import executors
+from backend.services.cancellation import TaskCancelled, cancellation_scope
+
+
+def _sleep_then(marker: str, seconds: float, value: str) -> str:
+    """Выполняется в процессе пула."""
+    import os
+    from pathlib import Path
+    Path(marker).write_text(str(os.getpid()))
+    time.sleep(seconds)
+    return value
+
+
+def _alive(pid: int) -> bool:
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            return f.read().split(") ", 1)[1][0] not in "ZX"
+    except (OSError, IndexError):
+        return False
+
+
+def _wait(predicate, timeout=20.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+def test_abandoned_cpu_call_recycles_pool_and_other_calls_rerun(tmp_path, monkeypatch):
+    monkeypatch.setattr(executors, "CPU_WORKERS", 2)
+    results = {}
+
+    def run(task_id, seconds):
+        with cancellation_scope(task_id) as token:
+            results[task_id + ":token"] = token
+            try:
+                results[task_id] = executors.run_cpu(_sleep_then, str(tmp_path / task_id), seconds, task_id)
+            except TaskCancelled as e:
+                results[task_id] = e
+
+    recycled = executors.get_stats()["cpu_pool_recycled"]
+    threads = [threading.Thread(target=run, args=("ex-hung", 60)), threading.Thread(target=run, args=("ex-ok", 1.5))]
+    for t in threads:
+        t.start()
+    try:
+        assert _wait(lambda: (tmp_path / "ex-hung").exists() and (tmp_path / "ex-ok").exists())
+        old_pool = executors._cpu_pool
+        hung_pid = int((tmp_path / "ex-hung").read_text())
+        results["ex-hung:token"].cancel()
+        threads[0].join(5)
+        assert isinstance(results["ex-hung"], TaskCancelled)
+        # Процесс с брошенным вычислением завершён, пул пересоздан; вычисление другой задачи перезапущено
+        assert executors.get_stats()["cpu_pool_recycled"] == recycled + 1
+        assert executors._cpu_pool is not old_pool
+        assert _wait(lambda: not _alive(hung_pid), 5)
+        threads[1].join(30)
+        assert results["ex-ok"] == "ex-ok"
+    finally:
+        pool = executors._cpu_pool
+        if pool is not None:
+            executors._recycle_cpu_pool(pool)
+        for t in threads:
+            t.join(5)
+
+
+def test_abandoned_io_call_is_counted_until_it_finishes():
+    release = threading.Event()
+    with cancellation_scope("ex-io") as token:
+        future = executors.submit_io(release.wait, 5)
+        token.cancel()
+        with pytest.raises(TaskCancelled):
+            executors.wait_result(future)
+    assert executors.get_stats()["io_abandoned"] >= 1
+    release.set()
+    future.result(5)
+    assert _wait(lambda: executors.get_stats()["io_abandoned"] == 0, 5)
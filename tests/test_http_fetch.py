@@ -0,0 +1,74 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from backend.services import http_fetch
+
+
+@pytest.fixture
+def server():
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header("Content-Length", "100000")
+            self.end_headers()
+            try:
+                for _ in range(200):  # по байту раз в 50 мс: каждое чтение укладывается в таймаут сокета
+                    self.wfile.write(b"x")
+                    self.wfile.flush()
+                    time.sleep(0.05)
+            except OSError:
+                pass
+
+    srv = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{srv.server_port}"
+    srv.shutdown()
+
+
+def test_trickling_server_is_cut_at_total_deadline(server, monkeypatch):
+    monkeypatch.setattr(http_fetch, "HTTP_CACHE_ENABLED", False)
+    started = time.monotonic()
+    with pytest.raises(ValueError, match="слишком долго"):
+        http_fetch.fetch_url(server + "/slow", timeout=0.5)
+    assert time.monotonic() - started < 2
+
+
+def test_cache_entry_with_mismatched_body_is_not_served(tmp_path, monkeypatch):
+    monkeypatch.setattr(http_fetch, "HTTP_CACHE_DIR", tmp_path)
+    url = "https://example.com/a"
+    body = b"<html>ok</html>"
+    result = http_fetch.FetchResult(url, body, None, http_fetch.hashlib.sha256(body).hexdigest(), '"e1"', None, False)
+    http_fetch._save_cached(url, result)
+    assert http_fetch._load_cached(url)["content"] == body
+    assert not list(tmp_path.glob("*.tmp"))
+    # Тело новой версии записано, метаданные — ещё нет (процесс упал между файлами)
+    http_fetch._cache_paths(url)[1].write_bytes(b"<html>half")
+    assert http_fetch._load_cached(url) is None
+
+
+def test_purge_http_cache_drops_expired_then_oldest_over_budget(tmp_path, monkeypatch):
+    import os
+    monkeypatch.setattr(http_fetch, "HTTP_CACHE_DIR", tmp_path)
+    monkeypatch.setattr(http_fetch, "HTTP_CACHE_MAX_AGE_DAYS", 7)
+    monkeypatch.setattr(http_fetch, "HTTP_CACHE_MAX_MB", 1)
+    now = time.time()
+    ages = {"expired": 8 * 86400, "old": 3 * 86400, "new": 60}
+    for key, age in ages.items():
+        for suffix in (".json", ".body"):
+            path = tmp_path / f"{key}{suffix}"
+            path.write_bytes(b"x" * (400 * 1024 if suffix == ".body" else 10))
+            os.utime(path, (now - age, now - age))
+    (tmp_path / "expired.json.abc.tmp").write_bytes(b"half")
+    os.utime(tmp_path / "expired.json.abc.tmp", (now - ages["expired"],) * 2)
+    # 3 записи по 400 КБ — больше 1 МБ; после удаления устаревшей кэш укладывается в объём
+    assert http_fetch.purge_http_cache() == 1
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["new.body", "new.json", "old.body", "old.json"]
+    monkeypatch.setattr(http_fetch, "HTTP_CACHE_MAX_MB", 0)
+    assert http_fetch.purge_http_cache() == 2
+    assert not list(tmp_path.iterdir())
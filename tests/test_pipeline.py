@@ -0,0 +1,262 @@
+import json
+import time
+from datetime import datetime
+
+import pytest
+
+import backend.services.pipeline as pipeline
+from backend.database import get_connection, init_db
+
+
+@pytest.fixture(autouse=True)
+def _db():
+    init_db()
+
+
+def _wait(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def test_retry_resumes_from_first_incomplete_stage(client, monkeypatch):
+    calls = {"extract": 0, "script": 0, "tts": 0, "cover": 0, "id3": 0}
+
+    def fake_extract(url):
+        calls["extract"] += 1
+        return "Текст статьи", None, None, None
+
+    def fake_script(text, **kwargs):
+        calls["script"] += 1
+        return [{"speaker": "1", "text": "Привет"}, {"speaker": "2", "text": "Здравствуйте"}]
+
+    def fake_audio(script, voice_map, output_path, **kwargs):
+        calls["tts"] += 1
+        output_path.write_bytes(b"voice")
+        return output_path
+
+    def fake_cover(prompt, custom_prompt=None):
+        calls["cover"] += 1
+        if calls["cover"] == 1:
+            raise RuntimeError("image API 503")
+        return b"jpeg"
+
+    def fake_id3(path, title, cover):
+        calls["id3"] += 1
+        if calls["id3"] == 1:
+            raise OSError("disk full")
+
+    monkeypatch.setattr(pipeline, "extract_url_cached", fake_extract)
+    monkeypatch.setattr(pipeline, "generate_script", fake_script)
+    monkeypatch.setattr(pipeline, "generate_podcast_audio", fake_audio)
+    monkeypatch.setattr(pipeline, "generate_cover_image", fake_cover)
+    monkeypatch.setattr(pipeline, "mix_voice_with_music", lambda voice, music, out, volume: out.write_bytes(voice.read_bytes()))
+    monkeypatch.setattr(pipeline, "write_id3", fake_id3)
+    monkeypatch.setattr(pipeline, "get_mp3_duration_seconds", lambda path: 5)
+
+    now = datetime.utcnow().isoformat()
+    params = {"source": "url", "url": "https://example.com/a", "title": "Выпуск"}
+    with get_connection() as conn:
+        conn.execute(
+            "INSERT INTO task (id, session_id, status, stage, params_json, created_at, updated_at) VALUES ('retry-1', 's', 'pending', '', ?, ?, ?)",
+            (json.dumps(params), now, now),
+        )
+    pipeline.run_pipeline("retry-1")
+    assert client.get("/api/tasks/retry-1").get_json()["status"] == "failed"
+
+    resp = client.post("/api/tasks/retry-1/retry")
+    assert resp.status_code == 200
+    assert resp.get_json()["resume_stage"] == "cover"
+    assert _wait(lambda: client.get("/api/tasks/retry-1").get_json()["status"] == "completed")
+    assert calls == {"extract": 1, "script": 1, "tts": 1, "cover": 2, "id3": 2}
+    assert client.post("/api/tasks/retry-1/retry").status_code == 409
+
+
+def test_cancelled_leader_hands_result_to_follower(client, monkeypatch):
+    def fake_script(text, **kwargs):
+        assert client.post("/api/tasks/lead-1/cancel").status_code == 200
+        return [{"speaker": "1", "text": "Привет"}]
+
+    def fake_audio(script, voice_map, output_path, **kwargs):
+        output_path.write_bytes(b"voice")
+        return output_path
+
+    monkeypatch.setattr(pipeline, "extract_url_cached", lambda url: ("Текст статьи", None, None, None))
+    monkeypatch.setattr(pipeline, "generate_script", fake_script)
+    monkeypatch.setattr(pipeline, "generate_podcast_audio", fake_audio)
+    monkeypatch.setattr(pipeline, "generate_cover_image", lambda prompt, custom_prompt=None: b"jpeg")
+    monkeypatch.setattr(pipeline, "mix_voice_with_music", lambda voice, music, out, volume: out.write_bytes(voice.read_bytes()))
+    monkeypatch.setattr(pipeline, "write_id3", lambda path, title, cover: None)
+    monkeypatch.setattr(pipeline, "get_mp3_duration_seconds", lambda path: 5)
+
+    now = datetime.utcnow().isoformat()
+    params = json.dumps({"source": "url", "url": "https://example.com/shared", "base_url": "http://feed.test"})
+    with get_connection() as conn:
+        conn.execute(
+            "INSERT INTO task (id, session_id, status, stage, params_json, created_at, updated_at) VALUES ('lead-1', 's', 'pending', '', ?, ?, ?)",
+            (params, now, now),
+        )
+        conn.execute(
+            """INSERT INTO task (id, session_id, status, stage, params_json, leader_task_id, created_at, updated_at)
+               VALUES ('follow-1', 's2', 'pending', '', ?, 'lead-1', ?, ?)""",
+            (params, now, now),
+        )
+    pipeline.run_pipeline("lead-1")
+
+    assert client.get("/api/tasks/lead-1").get_json()["status"] == "cancelled"
+    follower = client.get("/api/tasks/follow-1").get_json()
+    assert follower["status"] == "completed"
+    assert client.get("/api/files/follow-1/mp3").status_code == 200
+    assert client.get("/api/files/lead-1/mp3").status_code == 404
+    rss = client.get("/api/files/follow-1/rss").get_data(as_text=True)
+    assert "http://feed.test/api/files/follow-1/mp3" in rss and "lead-1" not in rss
+    with get_connection() as conn:
+        owner = conn.execute("SELECT task_id FROM result WHERE id = (SELECT result_id FROM task WHERE id = 'follow-1')").fetchone()
+    assert owner["task_id"] == "follow-1"
+
+
+def test_tts_replicas_run_concurrently_in_order(monkeypatch, tmp_path):
+    import threading
+    import backend.services.executors as executors
+    import backend.services.tts_client as tts_client
+
+    lock = threading.Lock()
+    active = {"now": 0, "max": 0}
+
+    def fake_replica(text, voice_id, speed=1.0):
+        with lock:
+            active["now"] += 1
+            active["max"] = max(active["max"], active["now"])
+        time.sleep(0.05)
+        with lock:
+            active["now"] -= 1
+        return tmp_path / f"{text}.mp3"
+
+    rendered = {}
+    monkeypatch.setattr(tts_client, "TTS_CONCURRENCY", 3)
+    monkeypatch.setattr(tts_client, "synthesize_replica", fake_replica)
+    monkeypatch.setattr(tts_client, "_render_podcast_audio", lambda segments, out, per_voice: rendered.update(segments=segments))
+    monkeypatch.setattr(executors, "CPU_WORKERS", 0)
+    script = [{"speaker": str(1 + i % 2), "text": f"r{i}"} for i in range(8)]
+    progress = []
+    tts_client.generate_podcast_audio(script, {"1": "a", "2": "b"}, tmp_path / "voice.mp3", on_replica_done=lambda i, n: progress.append(i))
+    assert active["max"] == 3
+    assert [seg[1] for seg in rendered["segments"]] == [str(tmp_path / f"r{i}.mp3") for i in range(8)]
+    assert progress == list(range(1, 9))
+
+
+def test_run_cpu_uses_separate_process():
+    import os
+    from backend.services.executors import run_cpu
+    assert run_cpu(os.getpid) != os.getpid()
+
+
+def test_stage_budget_fails_task_with_stage_name(monkeypatch):
+    from backend.services.cancellation import call_abortable
+
+    monkeypatch.setattr(pipeline, "extract_url_cached", lambda url: ("Текст статьи", None, None, None))
+    monkeypatch.setattr(pipeline, "generate_script", lambda text, **kwargs: call_abortable(time.sleep, 10))
+    monkeypatch.setattr(pipeline, "STAGE_TIMEOUTS", {"script": 0.5})
+    now = datetime.utcnow().isoformat()
+    with get_connection() as conn:
+        conn.execute(
+            "INSERT INTO task (id, session_id, status, stage, params_json, created_at, updated_at) VALUES ('budget-1', 's', 'pending', '', ?, ?, ?)",
+            (json.dumps({"source": "url", "url": "https://example.com/budget"}), now, now),
+        )
+    started = time.monotonic()
+    pipeline.run_pipeline("budget-1")
+    assert time.monotonic() - started < 3
+    task = pipeline._get_task("budget-1")
+    assert task["status"] == "failed" and task["stage"] == "script"
+    assert "script" in task["error_message"]
+
+
+def test_task_deadline_raises_timeout():
+    from backend.services.cancellation import TaskTimedOut, cancellation_scope, check_cancelled, enter_stage
+    with cancellation_scope("deadline-1", timeout=0.3) as token:
+        enter_stage("tts")
+        time.sleep(0.5)
+        assert token.is_cancelled()
+        with pytest.raises(TaskTimedOut) as exc:
+            check_cancelled()
+    assert exc.value.stage == "tts" and "0.3" in str(exc.value)
+
+
+def test_progress_writes_are_throttled_and_readers_see_memory(client, monkeypatch):
+    import backend.services.task_progress as task_progress
+    monkeypatch.setattr(task_progress, "PROGRESS_FLUSH_SECONDS", 60)
+    writes = []
+    real_write = pipeline._write_task
+    monkeypatch.setattr(pipeline, "_write_task", lambda *args: writes.append(args) or real_write(*args))
+    now = datetime.utcnow().isoformat()
+    with get_connection() as conn:
+        conn.execute("INSERT OR IGNORE INTO session (id, created_at) VALUES ('s-prog', ?)", (now,))
+        conn.execute(
+            "INSERT INTO task (id, session_id, status, stage, params_json, created_at, updated_at) VALUES ('prog-1', 's-prog', 'pending', '', '{}', ?, ?)",
+            (now, now),
+        )
+    pipeline._update_task("prog-1", "running", "tts", progress=45, activity_message="Синтез речи…")
+    versions = []
+    for i in range(1, 121):
+        pipeline._update_task("prog-1", "running", "tts", progress=45 + i // 5, activity_message=f"Озвучка: реплика {i}/120")
+        if i % 40 == 0:
+            versions.append(client.get("/api/tasks/prog-1").get_json())
+    assert len(writes) == 1  # смена статуса; реплики — только в памяти
+    assert versions[-1]["activity_message"] == "Озвучка: реплика 120/120" and versions[-1]["progress"] == 69
+    assert versions[0]["version"] < versions[1]["version"] < versions[2]["version"]
+
+    # Смена этапа пишет накопленное сразу; версия в БД не меньше той, что видели читатели
+    pipeline._update_task("prog-1", "running", "music_cover", progress=75)
+    assert len(writes) == 2
+    with get_connection() as conn:
+        row = conn.execute("SELECT progress, stage, version FROM task WHERE id = 'prog-1'").fetchone()
+    assert row["stage"] == "music_cover" and row["progress"] == 75 and row["version"] > versions[-1]["version"]
+    task_progress.forget("prog-1")
+
+
+def test_buffered_flush_cannot_overwrite_newer_stage(monkeypatch):
+    import threading
+    import backend.services.task_progress as task_progress
+    monkeypatch.setattr(task_progress, "PROGRESS_FLUSH_SECONDS", 60)
+    db, started, release = {}, threading.Event(), threading.Event()
+
+    def writer(task_id, fields, count, expect_status):
+        if fields.get("stage") == "tts" and fields.get("progress") == 50:
+            started.set()
+            release.wait(5)  # UPDATE пачки реплик «застрял» в БД
+        db.update(fields)
+
+    task_progress.update("order-1", {"status": "running", "stage": "tts", "progress": 45}, writer)
+    task_progress.update("order-1", {"status": "running", "stage": "tts", "progress": 50}, writer)
+    flusher = threading.Thread(target=task_progress.flush, args=("order-1",))
+    flusher.start()
+    assert started.wait(5)
+    transition = threading.Thread(
+        target=task_progress.update, args=("order-1", {"status": "running", "stage": "music_cover", "progress": 75}, writer),
+    )
+    transition.start()
+    transition.join(0.2)
+    assert transition.is_alive()  # смена этапа ждёт завершения начатой записи
+    release.set()
+    flusher.join(5)
+    transition.join(5)
+    assert db["stage"] == "music_cover" and db["progress"] == 75
+    task_progress.forget("order-1")
+
+
+def test_concurrent_checkpoints_keep_every_stage(tmp_path):
+    import threading
+    from backend.services.checkpoints import load_checkpoints, save_checkpoint
+
+    for i in range(20):
+        task_dir = tmp_path / f"t{i}"
+        threads = [threading.Thread(target=save_checkpoint, args=(task_dir, stage, stage)) for stage in ("extract", "script", "cover")]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert set(load_checkpoints(task_dir)) == {"extract", "script", "cover"}
+        assert not list(task_dir.glob("*.tmp"))
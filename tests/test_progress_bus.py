@@ -0,0 +1,215 @@
+import time
+from datetime import datetime
+
+import pytest
+
+import backend.services.progress_bus as bus
+from backend.database import get_connection, init_db
+
+
+@pytest.fixture(autouse=True)
+def _db():
+    init_db()
+
+
+def test_subscriber_wakes_only_on_own_topics_and_cleans_up():
+    with bus.subscribe("bus-1") as sub:
+        bus.publish("bus-other")
+        assert sub.wait(0.05) == set()
+        bus.publish("bus-1")
+        bus.publish("bus-1")  # несколько событий до wait сливаются в одно
+        assert sub.wait(1) == {"bus-1"}
+        sub.add(bus.QUEUE)
+        bus.publish(bus.QUEUE)
+        assert sub.wait(1) == {bus.QUEUE}
+        assert bus.subscriber_count() == 1
+    assert bus.subscriber_count() == 0
+    assert "bus-1" not in bus._topics
+
+
+def test_pipeline_update_publishes_and_watcher_sees_other_process_writes():
+    from backend.services.pipeline import _update_task
+    now = datetime.utcnow().isoformat()
+    with get_connection() as conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO task (id, session_id, status, stage, params_json, created_at, updated_at) VALUES ('bus-t', 's', 'running', 'tts', '{}', ?, ?)",
+            (now, now),
+        )
+    with bus.subscribe("bus-t") as sub:
+        _update_task("bus-t", "running", "tts", progress=50)
+        assert sub.wait(1) == {"bus-t"}
+
+        # Запись из другого процесса событий не шлёт — её находит наблюдатель
+        seen = {}
+        bus._poll_db(seen)
+        sub.wait(0)
+        bus._poll_db(seen)
+        assert sub.wait(0.05) == set()
+        with get_connection() as conn:
+            conn.execute("UPDATE task SET progress = 60, updated_at = ? WHERE id = 'bus-t'", (datetime.utcnow().isoformat(),))
+        bus._poll_db(seen)
+        assert sub.wait(1) == {"bus-t"}
+
+
+def test_websocket_stream_follows_events_without_polling(monkeypatch):
+    import json
+    import threading
+    from backend.routes import ws as ws_routes
+    from backend.services.pipeline import _update_task
+    now = datetime.utcnow().isoformat()
+    with get_connection() as conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO task (id, session_id, status, stage, params_json, created_at, updated_at) VALUES ('bus-ws', 's', 'running', 'tts', '{}', ?, ?)",
+            (now, now),
+        )
+    reads = []
+    real_status = ws_routes._get_task_status
+    monkeypatch.setattr(ws_routes, "_get_task_status", lambda task_id: reads.append(task_id) or real_status(task_id))
+
+    class FakeWS:
+        connected = True
+        sent = []
+
+        def send(self, msg):
+            self.sent.append(json.loads(msg))
+
+    sock = FakeWS()
+    thread = threading.Thread(target=ws_routes._stream_task, args=(sock, "bus-ws"))
+    thread.start()
+    deadline = time.monotonic() + 5
+    while not sock.sent and time.monotonic() < deadline:
+        time.sleep(0.01)
+    time.sleep(0.3)
+    assert len(reads) == 1  # ожидание события БД не читает
+    _update_task("bus-ws", "running", "tts", progress=65)
+    _update_task("bus-ws", "failed", "tts", error_message="boom")
+    thread.join(5)
+    assert not thread.is_alive()
+    assert sock.sent[0]["progress"] != 65 and sock.sent[-1]["status"] == "failed"
+    assert bus.subscriber_count() == 0
+
+
+def test_websocket_multiplexed_subscriptions_send_batched_frames(monkeypatch):
+    import json
+    import queue
+    import threading
+    from simple_websocket import ConnectionClosed
+    from backend.routes import ws as ws_routes
+    from backend.services.pipeline import _update_task
+    monkeypatch.setattr(ws_routes, "WS_BATCH_INTERVAL_SECONDS", 0.3)
+    now = datetime.utcnow().isoformat()
+    with get_connection() as conn:
+        for task_id, session_id in (("mux-1", "mux-a"), ("mux-2", "mux-a"), ("mux-3", "mux-s")):
+            conn.execute(
+                "INSERT OR REPLACE INTO task (id, session_id, status, stage, params_json, created_at, updated_at) VALUES (?, ?, 'running', 'tts', '{}', ?, ?)",
+                (task_id, session_id, now, now),
+            )
+
+    class FakeWS:
+        connected = True
+
+        def __init__(self):
+            self.inbox = queue.Queue()
+            self.frames = queue.Queue()
+
+        def receive(self):
+            msg = self.inbox.get()
+            if msg is None:
+                self.connected = False
+                raise ConnectionClosed()
+            return json.dumps(msg)
+
+        def send(self, msg):
+            self.frames.put(json.loads(msg))
+
+    def updates(sock):
+        frame = sock.frames.get(timeout=5)
+        assert frame["type"] == "batch"
+        return {u["task_id"]: u for u in frame["updates"]}
+
+    sock = FakeWS()
+    thread = threading.Thread(target=ws_routes._stream_many, args=(sock, {"op": "subscribe", "task_ids": ["mux-1", "mux-2"]}))
+    thread.start()
+    try:
+        assert set(updates(sock)) == {"mux-1", "mux-2"}
+        # Несколько изменений за интервал — один кадр с последним состоянием
+        for p in (10, 20, 30):
+            _update_task("mux-1", "running", "tts", progress=p)
+        got = updates(sock)
+        assert set(got) == {"mux-1"} and got["mux-1"]["progress"] == 30
+
+        sock.inbox.put({"op": "subscribe", "session_id": "mux-s"})
+        assert set(updates(sock)) == {"mux-3"}
+        sock.inbox.put({"op": "unsubscribe", "task_ids": ["mux-2"]})
+        time.sleep(0.1)
+        _update_task("mux-2", "running", "tts", progress=50)
+        _update_task("mux-3", "completed", "done", progress=100)
+        got = updates(sock)
+        assert set(got) == {"mux-3"} and got["mux-3"]["status"] == "completed"
+    finally:
+        sock.inbox.put(None)
+        thread.join(5)
+    assert not thread.is_alive()
+    assert bus.subscriber_count() == 0
+
+
+def test_multiplexed_subscription_sees_writes_of_other_processes(monkeypatch):
+    import json
+    import queue
+    import threading
+    from simple_websocket import ConnectionClosed
+    from backend.routes import ws as ws_routes
+    monkeypatch.setattr(bus, "QUEUE_POLL_SECONDS", 0.1)
+    monkeypatch.setattr(ws_routes, "WS_BATCH_INTERVAL_SECONDS", 0.05)
+    now = datetime.utcnow().isoformat()
+    with get_connection() as conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO task (id, session_id, status, stage, params_json, created_at, updated_at) VALUES ('xp-1', 'xp-s', 'running', 'tts', '{}', ?, ?)",
+            (now, now),
+        )
+
+    class FakeWS:
+        connected = True
+
+        def __init__(self):
+            self.inbox = queue.Queue()
+            self.frames = queue.Queue()
+
+        def receive(self):
+            if self.inbox.get() is None:
+                self.connected = False
+                raise ConnectionClosed()
+
+        def send(self, msg):
+            self.frames.put(json.loads(msg))
+
+    def next_update(sock, task_id):
+        deadline = time.monotonic() + 5
+        while time.monotonic() < deadline:
+            frame = sock.frames.get(timeout=5)
+            for u in frame.get("updates", []):
+                if u["task_id"] == task_id:
+                    return u
+        raise AssertionError("no update for " + task_id)
+
+    sock = FakeWS()
+    thread = threading.Thread(target=ws_routes._stream_many, args=(sock, {"op": "subscribe", "task_ids": ["xp-1"], "session_id": "xp-s"}))
+    thread.start()
+    try:
+        assert next_update(sock, "xp-1")["progress"] is not None
+        # Другой процесс пишет в общую БД напрямую, без publish() — изменение находит наблюдатель
+        with get_connection() as conn:
+            conn.execute("UPDATE task SET progress = 55, activity_message = 'Озвучка: реплика 5/9' WHERE id = 'xp-1'")
+        assert next_update(sock, "xp-1")["progress"] == 55
+        with get_connection() as conn:
+            conn.execute(
+                "INSERT INTO task (id, session_id, status, stage, params_json, created_at, updated_at) VALUES ('xp-2', 'xp-s', 'pending', '', '{}', ?, ?)",
+                (now, now),
+            )
+        assert next_update(sock, "xp-2")["status"] == "pending"
+    finally:
+        sock.inbox.put(None)
+        thread.join(5)
+        with get_connection() as conn:
+            conn.execute("DELETE FROM task WHERE id IN ('xp-1', 'xp-2')")
+    assert not thread.is_alive()
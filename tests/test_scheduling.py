@@ -0,0 +1,42 @@
+from backend.services.scheduling import estimate_work, parse_priority, schedule
+
+import pytest
+
+
+def _item(task_id, session_id, enqueued_at, est_work=8.0, priority=0):
+    return {"task_id": task_id, "session_id": session_id, "enqueued_at": enqueued_at, "est_work": est_work, "priority": priority}
+
+
+def _order(items, last_claimed=None, now=1000.0):
+    return [it["task_id"] for it in schedule(items, last_claimed or {}, now)]
+
+
+def test_round_robin_across_sessions():
+    items = [_item(f"a{i}", "A", 900 + i) for i in range(5)] + [_item("b0", "B", 990)]
+    # A уже обслуживалась, B — ещё нет: задача B не ждёт все пять задач A
+    assert _order(items, {"A": 950}) == ["b0", "a0", "a1", "a2", "a3", "a4"]
+    assert _order(items + [_item("c0", "C", 995)], {"A": 950})[:3] == ["b0", "c0", "a0"]
+
+
+def test_short_tasks_first_and_priority_wins():
+    short = estimate_work({"duration": "very_short"}, 2000)
+    long = estimate_work({"duration": "standard"}, 40000)
+    assert short < long
+    items = [_item("long", "A", 990, long), _item("short", "A", 995, short)]
+    assert _order(items) == ["short", "long"]
+    items.append(_item("urgent", "A", 999, long, priority=5))
+    assert _order(items) == ["urgent", "short", "long"]
+
+
+def test_aging_lets_long_tasks_through():
+    items = [_item("old-long", "A", 900.0, 12.0), _item("new-short", "A", 999.0, 2.0)]
+    assert _order(items) == ["new-short", "old-long"]
+    # Ждёт 3000 с при QUEUE_AGING_SECONDS=300: 12 / (1 + 3000/300) < 2 / (1 + 1/300)
+    items[0]["enqueued_at"] = -2000.0
+    assert _order(items) == ["old-long", "new-short"]
+
+
+def test_parse_priority():
+    assert parse_priority(None) == 0 and parse_priority("3") == 3 and parse_priority(99) == 10
+    with pytest.raises(ValueError):
+        parse_priority("high")
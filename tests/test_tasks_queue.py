@@ -0,0 +1,227 @@
+import threading
+import time
+
+import pytest
+
+import backend.tasks_queue as tq
+
+
+@pytest.fixture(autouse=True)
+def _db():
+    from backend.database import init_db
+    init_db()
+
+
+def _wait(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def test_pool_runs_tasks_in_parallel_and_reports_workers(monkeypatch):
+    release = threading.Event()
+    started = []
+
+    def slow_pipeline(task_id, progress_cb=None):
+        started.append(task_id)
+        release.wait(5)
+
+    monkeypatch.setattr(tq, "TASK_WORKERS", 2)
+    monkeypatch.setattr(tq, "run_pipeline", slow_pipeline)
+    monkeypatch.setattr(tq, "_task_status", lambda task_id: "completed")
+    for task_id in ("slow-1", "slow-2", "slow-3"):
+        tq.enqueue(task_id)
+    try:
+        assert _wait(lambda: len(started) == 2)
+        stats = tq.get_queue_stats()
+        assert stats["in_flight"] == 2 and stats["queued"] == 1
+        assert {w["task_id"] for w in stats["workers"]} == {"slow-1", "slow-2"}
+        assert all(w["alive"] and w["state"] == "busy" for w in stats["workers"])
+    finally:
+        release.set()
+    assert _wait(lambda: tq.get_queue_stats()["in_flight"] == 0 and tq.get_queue_size() == 0)
+    assert sorted(started) == ["slow-1", "slow-2", "slow-3"]
+
+
+def _insert_task(task_id, status):
+    from datetime import datetime
+    from backend.database import get_connection
+    now = datetime.utcnow().isoformat()
+    with get_connection() as conn:
+        conn.execute(
+            "INSERT INTO task (id, session_id, status, stage, params_json, created_at, updated_at) VALUES (?, 's', ?, '', '{}', ?, ?)",
+            (task_id, status, now, now),
+        )
+
+
+def test_expired_lease_and_orphaned_tasks_are_recovered(monkeypatch):
+    from backend.database import get_connection
+    seen = {}
+
+    def record_pipeline(task_id, progress_cb=None):
+        with get_connection() as conn:
+            seen[task_id] = conn.execute("SELECT status FROM task WHERE id = ?", (task_id,)).fetchone()["status"]
+
+    monkeypatch.setattr(tq, "run_pipeline", record_pipeline)
+    monkeypatch.setattr(tq, "_task_status", lambda task_id: "completed")
+    # Воркер упал посреди задачи: status=running, аренда истекла
+    _insert_task("stale-running", "running")
+    with get_connection() as conn:
+        conn.execute(
+            "INSERT INTO queue_item (task_id, state, lease_owner, lease_expires_at, attempts, enqueued_at) VALUES (?, 'leased', 'dead', ?, 1, ?)",
+            ("stale-running", time.time() - 1, time.time() - 100),
+        )
+    # Задача из in-memory очереди до перезапуска: pending без записи в queue_item
+    _insert_task("orphan-pending", "pending")
+    assert tq.recover_queue() >= 1
+    tq.start_worker()
+    with tq._wakeup:
+        tq._wakeup.notify_all()
+    assert _wait(lambda: {"stale-running", "orphan-pending"} <= set(seen))
+    assert seen["stale-running"] == "pending" and seen["orphan-pending"] == "pending"
+
+    def _released():
+        with get_connection() as conn:
+            return conn.execute("SELECT COUNT(*) AS n FROM queue_item WHERE task_id IN ('stale-running', 'orphan-pending')").fetchone()["n"] == 0
+
+    assert _wait(_released)
+
+
+def test_standalone_worker_process_picks_up_tasks(tmp_path):
+    import json
+    import os
+    import signal
+    import sqlite3
+    import subprocess
+    import sys
+    from pathlib import Path
+
+    db = tmp_path / "w.db"
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{db.as_posix()}", STORAGE_PATH=str(tmp_path / "storage"),
+               EMBEDDED_WORKERS="0", QUEUE_POLL_SECONDS="0.2")
+    root = Path(__file__).resolve().parent.parent
+    subprocess.run([sys.executable, "-c", "from backend.database import init_db; init_db()"], cwd=root, env=env, check=True, timeout=60)
+    # Так задачу ставит веб-процесс с EMBEDDED_WORKERS=0: запись в task и queue_item общей БД
+    conn = sqlite3.connect(str(db))
+    with conn:
+        conn.execute(
+            "INSERT INTO task (id, session_id, status, stage, params_json, created_at, updated_at) VALUES ('w1', 's', 'pending', '', ?, '', '')",
+            (json.dumps({"source": "file", "file_path": str(tmp_path / "missing.pdf")}),),
+        )
+        conn.execute("INSERT INTO queue_item (task_id, state, attempts, enqueued_at) VALUES ('w1', 'queued', 0, ?)", (time.time(),))
+    proc = subprocess.Popen([sys.executable, "-m", "backend.worker", "--workers", "1"], cwd=root, env=env)
+    try:
+        status = lambda: conn.execute("SELECT status FROM task WHERE id = 'w1'").fetchone()[0]  # noqa: E731
+        assert _wait(lambda: status() == "failed", timeout=60)
+        assert _wait(lambda: conn.execute("SELECT COUNT(*) FROM queue_item").fetchone()[0] == 0)
+    finally:
+        proc.send_signal(signal.SIGTERM)
+        assert proc.wait(timeout=30) == 0
+        conn.close()
+
+
+def test_cancel_interrupts_running_task_and_reports_skipped_work(client, monkeypatch):
+    import json
+    import backend.services.pipeline as pipeline
+    from backend.database import get_connection
+    from backend.services.cancellation import call_abortable
+
+    def hanging_script(text, **kwargs):
+        return call_abortable(time.sleep, 10)  # ответ LLM, которого не дождёмся
+
+    monkeypatch.setattr(pipeline, "extract_url_cached", lambda url: ("Текст статьи", None, None, None))
+    monkeypatch.setattr(pipeline, "generate_script", hanging_script)
+    _insert_task("cancel-1", "pending")
+    with get_connection() as conn:
+        conn.execute("UPDATE task SET params_json = ? WHERE id = 'cancel-1'", (json.dumps({"source": "url", "url": "https://example.com/a"}),))
+    tq.enqueue("cancel-1")
+    assert _wait(lambda: client.get("/api/tasks/cancel-1").get_json()["stage"] == "script")
+
+    started = time.monotonic()
+    assert client.post("/api/tasks/cancel-1/cancel").status_code == 200
+    assert _wait(lambda: all(w["task_id"] != "cancel-1" for w in tq.get_queue_stats()["workers"]), timeout=3)
+    assert time.monotonic() - started < 3
+
+    data = client.get("/api/tasks/cancel-1").get_json()
+    assert data["status"] == "cancelled"
+    assert data["cancellation"]["stage"] == "script"
+    assert data["cancellation"]["skipped"]["llm_calls"] == 1
+    assert data["cancellation"]["skipped"]["image_calls"] == 1
+
+
+def test_queue_forecast_is_shared_between_watchers(monkeypatch):
+    from backend.database import get_connection
+    from backend.services import progress_bus
+    for i in range(3):
+        _insert_task(f"fc-{i}", "pending")
+    with get_connection() as conn:
+        conn.executemany(
+            "INSERT INTO queue_item (task_id, state, attempts, enqueued_at, session_id) VALUES (?, 'queued', 0, ?, 's')",
+            [(f"fc-{i}", time.time() + i) for i in range(3)],
+        )
+    progress_bus.publish(progress_bus.QUEUE)
+    calls = []
+    real_forecast = tq._forecast
+    monkeypatch.setattr(tq, "_forecast", lambda *args: calls.append(1) or real_forecast(*args))
+    monkeypatch.setattr(tq, "FORECAST_CACHE_SECONDS", 60)
+    try:
+        # Клиенты, разбуженные одним сдвигом очереди, делят один расчёт
+        forecasts = [tq.get_task_forecast({"id": f"fc-{i % 3}", "status": "pending"}) for i in range(30)]
+        assert len(calls) == 1
+        assert [f["queue_position"] for f in forecasts[:3]] == [1, 2, 3]
+        assert tq.get_queue_positions(["fc-2", "nope"]) == {"fc-2": 3, "nope": None}
+        assert len(calls) == 1
+        with get_connection() as conn:
+            conn.execute("DELETE FROM queue_item WHERE task_id = 'fc-0'")
+        progress_bus.publish(progress_bus.QUEUE)
+        assert tq.get_task_forecast({"id": "fc-1", "status": "pending"})["queue_position"] == 1
+        assert len(calls) == 2
+    finally:
+        with get_connection() as conn:
+            conn.execute("DELETE FROM queue_item WHERE task_id LIKE 'fc-%'")
+            conn.execute("DELETE FROM task WHERE id LIKE 'fc-%'")
+        progress_bus.publish(progress_bus.QUEUE)
+
+
+def test_forecast_slots_come_from_live_worker_processes(monkeypatch):
+    from backend.database import get_connection
+    monkeypatch.setattr(tq, "QUEUE_SLOTS", 0)
+    now = time.time()
+    with get_connection() as conn:
+        # В одной транзакции: heartbeat воркеров этого процесса не вклинится между записью и подсчётом
+        conn.execute("DELETE FROM queue_worker")
+        conn.executemany(
+            "INSERT INTO queue_worker (process_id, slots, heartbeat_at) VALUES (?, ?, ?)",
+            [("host:1", 3, now - 1), ("host:2", 4, now - 5), ("host:dead", 8, now - tq.TASK_LEASE_SECONDS - 1)],
+        )
+        assert tq._live_slots(conn, now) == 7
+        conn.execute("DELETE FROM queue_worker")
+        assert tq._live_slots(conn, now) == 1
+        monkeypatch.setattr(tq, "QUEUE_SLOTS", 5)
+        assert tq._live_slots(conn, now) == 5
+
+
+def test_claim_skips_exhausted_items_without_sleeping(monkeypatch):
+    from backend.database import get_connection
+    claim = tq._claim
+    monkeypatch.setattr(tq, "_claim", lambda owner: None)  # воркеры других тестов не перехватят задачу
+    _insert_task("exhausted", "running")
+    _insert_task("claimable", "pending")
+    now = time.time()
+    with get_connection() as conn:
+        conn.execute("DELETE FROM queue_item")
+        conn.execute(
+            "INSERT INTO queue_item (task_id, state, lease_owner, lease_expires_at, attempts, enqueued_at) VALUES (?, 'leased', 'dead', ?, ?, ?)",
+            ("exhausted", now - 1, tq.TASK_MAX_ATTEMPTS, now - 100),
+        )
+        conn.execute("INSERT INTO queue_item (task_id, state, enqueued_at) VALUES ('claimable', 'queued', ?)", (now,))
+    try:
+        assert claim("test-owner") == "claimable"
+        with get_connection() as conn:
+            assert conn.execute("SELECT status FROM task WHERE id = 'exhausted'").fetchone()["status"] == "failed"
+    finally:
+        with get_connection() as conn:
+            conn.execute("DELETE FROM queue_item WHERE task_id IN ('exhausted', 'claimable')")
@@ -28,6 +28,14 @@ def test_mask_pii_phone():
     assert len(phones) >= 1
 
 
+def test_mask_pii_single_pass_no_double_masking():
+    text = "Тел. +7 (999) 123-45-67, почта 79991234567@mail.ru, код 123-45-67."
+    out, phones, contacts = mask_pii(text)
+    assert out == "Тел. [телефон скрыт], почта [контакт скрыт] код [телефон скрыт]."
+    assert phones == ["+7 (999) 123-45-67", "123-45-67"]
+    assert contacts == ["79991234567@mail.ru,"]
+
+
 def test_clean_and_format():
     text = "  Первая строка   \n\n  Вторая строка  \n"
     result = clean_and_format(text)
@@ -70,3 +78,151 @@ def test_extract_from_url_integration(url):
         assert isinstance(text, str)
     except Exception as e:
         pytest.skip(f"Сеть недоступна: {e}")
+
+
+def _make_pdf(path, pages):
+    import fitz
+    doc = fitz.open()
+    for i in range(pages):
+        page = doc.new_page()
+        page.insert_text((72, 72), f"Страница номер {i} с текстом для проверки извлечения.")
+    doc.save(path)
+    doc.close()
+
+
+def test_extract_from_pdf_early_stop(tmp_path):
+    path = tmp_path / "big.pdf"
+    _make_pdf(path, 40)
+    full, _, _ = extract_from_pdf(path)
+    limited, _, _ = extract_from_pdf(path, max_chars=200)
+    assert len(limited) == 200
+    assert full.startswith(limited)
+
+
+def test_extract_from_pdf_early_stop_masks_per_page(tmp_path):
+    import fitz
+    path = tmp_path / "split.pdf"
+    doc = fitz.open()
+    for text in ("Первая страница.\nЗвоните 8 (999)", "123-45-67 или пишите a@b.ru\nКонец."):
+        doc.new_page().insert_text((72, 72), text)
+    doc.save(path)
+    doc.close()
+    full, full_phones, full_contacts = extract_from_pdf(path)
+    limited, phones, contacts = extract_from_pdf(path, max_chars=10_000)
+    assert limited == full
+    assert (phones, contacts) == (full_phones, full_contacts)
+    assert "999" not in limited and "45-67" not in limited and "a@b.ru" not in limited
+
+
+def test_extract_from_pdf_parallel_matches_serial(tmp_path, monkeypatch):
+    import backend.services.text_extraction as m
+    path = tmp_path / "big.pdf"
+    _make_pdf(path, 30)
+    serial, _, _ = extract_from_pdf(path)
+    monkeypatch.setattr(m, "PDF_PARALLEL_MIN_PAGES", 10)
+    monkeypatch.setattr(m, "PDF_PAGES_PER_CHUNK", 4)
+    monkeypatch.setattr(m, "PDF_WORKERS", 2)
+    parallel, _, _ = extract_from_pdf(path)
+    assert parallel == serial
+
+
+@pytest.fixture
+def local_site():
+    """Локальный HTTP-сервер: /article (с ETag, отвечает 304) и /huge (больше лимита)."""
+    import threading
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    hits = {"article": 0, "article_304": 0}
+    body = "<html><body><p>Статья про подкасты.</p></body></html>".encode("utf-8")
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            if self.path == "/article":
+                hits["article"] += 1
+                if self.headers.get("If-None-Match") == '"v1"':
+                    hits["article_304"] += 1
+                    self.send_response(304)
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.send_header("ETag", '"v1"')
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            else:
+                self.send_response(200)
+                self.send_header("Content-Type", "text/html")
+                self.end_headers()
+                for _ in range(64):
+                    self.wfile.write(b"x" * 1024)
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}", hits
+    server.shutdown()
+
+
+def test_fetch_url_conditional_get_and_size_cap(local_site):
+    from backend.services.http_fetch import fetch_url
+    base, hits = local_site
+    first = fetch_url(base + "/article")
+    second = fetch_url(base + "/article")
+    assert not first.not_modified and second.not_modified
+    assert second.content == first.content and hits["article_304"] == 1
+    with pytest.raises(ValueError, match="лимит"):
+        fetch_url(base + "/huge", max_bytes=10 * 1024)
+
+
+def test_extract_url_cached_not_reparsed(local_site, monkeypatch):
+    import backend.services.extraction_cache as cache
+    base, _ = local_site
+    text, _, _, extraction_id = cache.extract_url_cached(base + "/article")
+    assert "подкасты" in text
+
+    def _no_parse(*args, **kwargs):
+        raise AssertionError("страница не должна разбираться повторно")
+
+    monkeypatch.setattr(cache, "extract_from_html", _no_parse)
+    again, _, _, again_id = cache.extract_url_cached(base + "/article")
+    assert again == text and again_id == extraction_id
+
+
+def test_extract_from_html_density_keeps_main_article():
+    from backend.services.text_extraction import extract_from_html
+    article = "".join(
+        f"<p>Абзац {i}: основной текст статьи о подкастах, с запятыми, деталями и пояснениями для читателя.</p>"
+        for i in range(6)
+    )
+    html = (
+        "<html><body><nav><a href='/'>Главная</a></nav>"
+        f"<div class='layout'><article class='post-content'>{article}</article>"
+        "<div class='sidebar'><p>Реклама в сайдбаре: подпишитесь на рассылку прямо сейчас, это важно.</p></div>"
+        "<section class='comments'><p>Комментарий читателя: отличная статья, спасибо автору за труд.</p></section>"
+        "</div></body></html>"
+    ).encode("utf-8")
+    text, _, _ = extract_from_html(html, extractor="density")
+    assert "Абзац 0" in text and "Абзац 5" in text
+    assert "сайдбаре" not in text and "Комментарий" not in text
+    soup_text, _, _ = extract_from_html(html, extractor="soup")
+    assert "Комментарий" in soup_text
+
+
+def test_extract_from_html_density_keeps_article_in_sidebar_wrapper():
+    from backend.services.text_extraction import extract_from_html
+    article = "".join(
+        f"<p>Абзац {i}: основной текст статьи о подкастах, с запятыми, деталями и пояснениями для читателя.</p>"
+        for i in range(6)
+    )
+    html = (
+        "<html><body><div class='site has-sidebar'><div class='wrapper social-enabled'>"
+        f"<article>{article}</article>"
+        "<div class='sidebar'><p>Реклама в сайдбаре: подпишитесь на рассылку прямо сейчас, это важно.</p></div>"
+        "</div></div></body></html>"
+    ).encode("utf-8")
+    text, _, _ = extract_from_html(html, extractor="density")
+    assert "Абзац 0" in text and "Абзац 5" in text
+    assert "сайдбаре" not in text